@@ -1,5 +1,18 @@
+import datetime
+
 from django.contrib import admin
-from .models import Author, Book, BookInstance, Genre, Language
+from django.contrib.admin import helpers
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.forms.models import BaseInlineFormSet
+from django.http import QueryDict
+from django.template.response import TemplateResponse
+
+from catalog import loans
+from catalog.forms import RenewBookForm
+from catalog.pagination import EstimatedCountPaginator
+from catalog.views import report_bulk_loans
+from .models import Author, Book, BookInstance, Genre, Language, PageVisits, Reservation
 
 # Register your models here.
 # admin.site.register(Author)
@@ -8,32 +21,130 @@ from .models import Author, Book, BookInstance, Genre, Language
 admin.site.register(Genre)
 admin.site.register(Language)
 
-class BookAdminInline(admin.StackedInline):
-    model = Book
+# The catalog tables can hold millions of rows, so the admin pages avoid
+# reading or counting them whole:
+# - changelists select (or prefetch) what their columns show, are paginated
+#   with estimated counts on PostgreSQL (EstimatedCountPaginator), and do
+#   not count the unfiltered table (show_full_result_count);
+# - foreign keys to large tables are edited with autocomplete or raw id
+#   widgets rather than a <select> of every row;
+# - inlines show one page of the related rows (PaginatedInline).
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """ An inline formset of one page of the related objects (see PaginatedInline). """
+    per_page = 20
+    page_number = 1
+    query = QueryDict()
+
+    def get_queryset(self):
+        if not hasattr(self, 'page'):
+            paginator = Paginator(super().get_queryset(), self.per_page)
+            self.page = paginator.get_page(self.page_number)
+        return self.page.object_list
+
+    @classmethod
+    def page_param(cls):
+        return f'{cls.get_default_prefix()}-page'
+
+    def page_querystring(self, number):
+        query = self.query.copy()
+        query[self.page_param()] = number
+        return '?' + query.urlencode()
+
+    def page_links(self):
+        """ (label, querystring) of the previous and next pages, where there are some. """
+        self.get_queryset()
+        links = []
+        if self.page.has_previous():
+            links.append(('previous', self.page_querystring(self.page.previous_page_number())))
+        if self.page.has_next():
+            links.append(('next', self.page_querystring(self.page.next_page_number())))
+        return links
+
+class PaginatedInline(admin.TabularInline):
+    """
+    A tabular inline showing 'per_page' related objects at a time, chosen
+    with the '<prefix>-page' query parameter. The change form posts back to
+    its own URL, so a page is saved as it was shown.
+    """
+    formset = PaginatedInlineFormSet
+    template = 'admin/catalog/paginated_tabular.html'
+    per_page = 20
     extra = 0
+    show_change_link = True
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        return type(formset.__name__, (formset,), {
+            'per_page': self.per_page,
+            'page_number': request.GET.get(formset.page_param(), 1),
+            'query': request.GET,
+        })
+
+class BookAdminInline(PaginatedInline):
+    model = Book
+    # Genres and language (a <select> per row) are edited on the book's page.
+    fields = ('title', 'isbn')
+
+    def has_add_permission(self, request, obj=None):
+        # A book needs a summary and genres, which the row does not show:
+        # books are added on their own page (the change link leads there).
+        return False
 
 # Defines admin class
 class AuthorAdmin(admin.ModelAdmin):
     list_display = ('last_name', 'first_name', 'date_of_birth', 'date_of_death')
     fields = ['first_name', 'last_name', ('date_of_birth', 'date_of_death')]
     inlines = [BookAdminInline]
+    # The order of author_name_idx.
+    ordering = ('last_name', 'first_name', 'id')
+    # Trigram indexed on PostgreSQL (migration 0020). Also used by the
+    # autocomplete of BookAdmin.
+    search_fields = ('last_name', 'first_name')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 # Registers admin class with associated model
 admin.site.register(Author, AuthorAdmin)
 
-class BookInstanceInline(admin.StackedInline): # admin.TabularInline for horizontal
+class BookInstanceInline(PaginatedInline):
     model = BookInstance
-    extra = 0
+    fields = ('imprint', 'status', 'due_back', 'borrower')
+    # See BookInstanceAdmin.
+    readonly_fields = ('status', 'due_back', 'borrower')
+
+    def get_queryset(self, request):
+        # A copy's name includes its book's title.
+        return super().get_queryset(request).select_related('book', 'borrower')
 
 @admin.register(Book) # Does the same as 'admin.site.register()'
 class BookAdmin(admin.ModelAdmin):
     list_display = ('title', 'author', 'display_genre')
+    list_select_related = ('author',)
     inlines = [BookInstanceInline]
+    autocomplete_fields = ('author',)
+    # 'title' is trigram indexed on PostgreSQL (migration 0012). Also used
+    # by the autocomplete of BookInstanceAdmin.
+    search_fields = ('title', '=isbn')
+    # A total order, which book_title_idx serves (the autocomplete pages through it too).
+    ordering = ('title', 'id')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # For display_genre().
+        return super().get_queryset(request).prefetch_related('genre')
 
 @admin.register(BookInstance)
 class BookInstanceAdmin(admin.ModelAdmin):
     list_display = ('book', 'status', 'borrower', 'due_back', 'id')
+    list_select_related = ('book', 'borrower')
     list_filter = ('status', 'due_back')
+    # A total order, which bookinstance_due_idx serves.
+    ordering = ('due_back', 'id')
+    autocomplete_fields = ('book',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = (
         (None, {
             'fields': ('book', 'imprint', 'id')
@@ -42,3 +153,83 @@ class BookInstanceAdmin(admin.ModelAdmin):
             'fields': ('status', 'due_back', 'borrower')
         }),
     )
+
+    # Copies are lent, returned and reserved with the views of
+    # catalog/loans.py, which lock the copy first. Here a copy can only be
+    # put in or out of maintenance.
+    readonly_fields = ('id', 'due_back', 'borrower')
+    LENT = ('o', 'r')
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is not None and obj.status in self.LENT:
+            return self.readonly_fields + ('status',)
+        return self.readonly_fields
+
+    def formfield_for_choice_field(self, db_field, request, **kwargs):
+        if db_field.name == 'status':
+            kwargs['choices'] = [
+                (value, label) for value, label in BookInstance.LOAN_STATUS if value not in self.LENT
+            ]
+        return super().formfield_for_choice_field(db_field, request, **kwargs)
+
+    actions = ['renew_selected', 'return_selected']
+
+    def has_renew_permission(self, request):
+        return request.user.has_perm('catalog.can_renew')
+
+    def has_return_permission(self, request):
+        return request.user.has_perm('catalog.can_mark_returned')
+
+    @admin.action(description='Renew the selected loans', permissions=['renew'])
+    def renew_selected(self, request, queryset):
+        # Asks for the new due date first.
+        form = RenewBookForm(request.POST if 'apply' in request.POST else None, initial={
+            'renewal_date': datetime.date.today() + loans.LOAN_PERIOD,
+        })
+        if form.is_valid():
+            renewed, failures = loans.renew_many(
+                list(queryset.values_list('pk', flat=True)), form.cleaned_data['renewal_date'],
+            )
+            report_bulk_loans(request, 'renew', renewed, failures)
+            return None
+
+        return TemplateResponse(request, 'admin/catalog/bookinstance/renew_selected.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Renew the selected loans',
+            'opts': self.model._meta,
+            'form': form,
+            'queryset': queryset.select_related('book', 'borrower'),
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        })
+
+    @admin.action(description='Return the selected copies', permissions=['return'])
+    def return_selected(self, request, queryset):
+        returned, failures = loans.return_many(list(queryset.values_list('pk', flat=True)))
+        report_bulk_loans(request, 'return', returned, failures)
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+
+        with transaction.atomic():
+            # The loan fields are left alone, and so is the status if the
+            # copy was lent since the form was shown.
+            current = BookInstance.objects.select_for_update().get(pk=obj.pk)
+            fields = ['book', 'imprint', 'updated']
+            if current.status not in self.LENT:
+                fields.append('status')
+            obj.save(update_fields=fields)
+
+@admin.register(Reservation)
+class ReservationAdmin(admin.ModelAdmin):
+    list_display = ('book', 'borrower', 'created')
+    list_select_related = ('book', 'borrower')
+    raw_id_fields = ('book', 'borrower')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+@admin.register(PageVisits)
+class PageVisitsAdmin(admin.ModelAdmin):
+    list_display = ('page', 'date', 'count')
+    list_filter = ('page',)
+    date_hierarchy = 'date'
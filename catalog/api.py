@@ -0,0 +1,172 @@
+import hashlib
+import json
+
+from django.contrib.auth.mixins import PermissionRequiredMixin
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.http import Http404, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.views import View
+
+from catalog.models import Author, Book, BookInstance
+from catalog.pagination import CursorPaginator, InvalidCursor
+
+# Read-only JSON API (/catalog/api/...).
+#
+# Rows are read with values(), so no model instances are built, and each
+# endpoint only selects the columns asked for with '?fields=a,b'. Responses
+# carry a strong ETag computed from the ids and 'updated' timestamps of the
+# rows, so a client sending it back in 'If-None-Match' gets a 304 without
+# the body being serialized again.
+
+class ApiError(Exception):
+    pass
+
+class ApiView(View):
+    """
+    Base class of the API endpoints.
+
+    'fields' maps the public field names to the ORM lookups passed to
+    values(). 'id' is always returned.
+    """
+    queryset = None
+    fields = {}
+    http_method_names = ['get', 'head', 'options']
+
+    def get_queryset(self):
+        return self.queryset.all()
+
+    def get_fields(self):
+        requested = self.request.GET.get('fields')
+        if not requested:
+            return dict(self.fields)
+
+        names = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ApiError(f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(self.fields)}.")
+        return {'id': self.fields['id'], **{name: self.fields[name] for name in names}}
+
+    def get_etag(self, rows, *extra):
+        """ A strong ETag for 'rows': same rows, versions and options, same body. """
+        stamp = [(str(row['id']), str(row['_updated'])) for row in rows]
+        digest = hashlib.sha1(json.dumps([stamp, *extra]).encode()).hexdigest()
+        return f'"{digest}"'
+
+    def render(self, data, etag):
+        response = get_conditional_response(self.request, etag=etag)
+        if response is None:
+            response = JsonResponse(data, encoder=DjangoJSONEncoder)
+        response['ETag'] = etag
+        return response
+
+    @staticmethod
+    def serialize(rows, fields):
+        return [{name: row[lookup] for name, lookup in fields.items()} for row in rows]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            return self.respond(self.get_fields())
+        except ApiError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+class ApiListView(ApiView):
+    """ A cursor-paginated list ('?cursor=', '?limit='). """
+    ordering = ('pk',)
+    default_limit = 20
+    max_limit = 100
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.GET.get('limit', self.default_limit))
+        except ValueError:
+            raise ApiError('limit must be an integer.')
+        return min(max(limit, 1), self.max_limit)
+
+    def respond(self, fields):
+        # The ordering fields are needed for the cursors, 'updated' for the ETag.
+        lookups = {*fields.values(), *self.ordering}
+        queryset = self.get_queryset().values(*lookups, _updated=F('updated'))
+
+        cursor = self.request.GET.get('cursor')
+        try:
+            page = CursorPaginator(queryset, self.ordering, self.get_limit()).page(cursor)
+        except InvalidCursor:
+            raise ApiError('Invalid cursor.')
+
+        # The body also depends on the URL (through the next/previous links).
+        etag = self.get_etag(page.object_list, self.request.build_absolute_uri())
+        return self.render({
+            'results': self.serialize(page.object_list, fields),
+            'next': self.page_url(page.next_cursor),
+            'previous': self.page_url(page.previous_cursor),
+        }, etag)
+
+    def page_url(self, cursor):
+        if cursor is None:
+            return None
+        query = self.request.GET.copy()
+        query['cursor'] = cursor
+        return self.request.build_absolute_uri(f'{self.request.path}?{query.urlencode()}')
+
+class ApiDetailView(ApiView):
+    """ A single row, by primary key. """
+
+    def respond(self, fields):
+        row = (
+            self.get_queryset().filter(pk=self.kwargs['pk'])
+            .values(*fields.values(), _updated=F('updated'))
+            .first()
+        )
+        if row is None:
+            raise Http404('No such object.')
+
+        return self.render(self.serialize([row], fields)[0], self.get_etag([row], sorted(fields)))
+
+BOOK_FIELDS = {
+    'id': 'id', 'title': 'title', 'summary': 'summary', 'isbn': 'isbn',
+    'author': 'author_id', 'language': 'language_id', 'updated': 'updated',
+}
+AUTHOR_FIELDS = {
+    'id': 'id', 'first_name': 'first_name', 'last_name': 'last_name',
+    'date_of_birth': 'date_of_birth', 'date_of_death': 'date_of_death', 'updated': 'updated',
+}
+INSTANCE_FIELDS = {
+    'id': 'id', 'book': 'book_id', 'imprint': 'imprint', 'status': 'status',
+    'due_back': 'due_back', 'updated': 'updated',
+}
+LOAN_FIELDS = {**INSTANCE_FIELDS, 'borrower': 'borrower_id'}
+
+class BookListApi(ApiListView):
+    queryset = Book.objects.all()
+    fields = BOOK_FIELDS
+    ordering = ('title', 'pk')
+
+class BookDetailApi(ApiDetailView):
+    queryset = Book.objects.all()
+    fields = BOOK_FIELDS
+
+class AuthorListApi(ApiListView):
+    queryset = Author.objects.all()
+    fields = AUTHOR_FIELDS
+    ordering = ('last_name', 'first_name', 'pk')
+
+class AuthorDetailApi(ApiDetailView):
+    queryset = Author.objects.all()
+    fields = AUTHOR_FIELDS
+
+class BookInstanceListApi(ApiListView):
+    queryset = BookInstance.objects.all()
+    fields = INSTANCE_FIELDS
+
+class BookInstanceDetailApi(ApiDetailView):
+    queryset = BookInstance.objects.all()
+    fields = INSTANCE_FIELDS
+
+class LoanListApi(PermissionRequiredMixin, ApiListView):
+    """ The copies on loan, with their borrower. Staff only. """
+    queryset = BookInstance.objects.filter(status__exact='o')
+    fields = LOAN_FIELDS
+    ordering = ('due_back', 'pk')
+    permission_required = 'catalog.can_mark_returned'
+    raise_exception = True
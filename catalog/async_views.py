@@ -0,0 +1,156 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponsePermanentRedirect
+from django.shortcuts import render
+from django.utils.translation import gettext as _
+from django.views import View
+
+from catalog import facets, visits
+from catalog.cache import book_copies_version
+from catalog.counters import get_index_counts
+from catalog.models import Author, Book
+from catalog.pagination import CursorPaginator, InvalidCursor, add_page_links
+
+# Async (ASGI) versions of the read-only catalog pages, served under
+# /catalog/async/ (see the 'asgi' process in the Procfile). They render the
+# same templates as the views in catalog/views.py.
+#
+# No query may run in the event loop, and templates are rendered
+# synchronously, so everything the templates read from the database
+# (including request.user and its permissions) is loaded beforehand with
+# the async ORM or sync_to_async(). Django runs the sync_to_async() calls of
+# one request one after another, in a thread of its own.
+
+def _load_user(request):
+    # The sidebar shows the user and checks their permissions; this fills
+    # ModelBackend's permission cache, so the checks run no queries.
+    if request.user.is_authenticated:
+        request.user.get_all_permissions()
+
+load_user = sync_to_async(_load_user)
+
+async def index(request):
+    """ Async version of views.index. """
+    num_visits = visits.get_visits(request)
+
+    # The counters come from one (cached) aggregate query, see
+    # catalog/counters.py. The steps below are independent, so they are
+    # awaited together.
+    counts, *_rest = await asyncio.gather(
+        sync_to_async(get_index_counts)(),
+        sync_to_async(visits.record_visit)('index'),
+        load_user(request),
+    )
+
+    context = {
+        **counts,
+        'num_visits': num_visits,
+    }
+    response = render(request, 'index.html', context=context)
+    visits.set_visits(response, num_visits + 1)
+    return response
+
+class AsyncListView(View):
+    """ An async, cursor-paginated ListView (see catalog/pagination.py). """
+    queryset = None
+    template_name = None
+    context_object_name = None
+    paginate_by = 10
+    cursor_ordering = ('pk',)
+    cursor_query_param = 'cursor'
+
+    def get_queryset(self):
+        return self.queryset.all()
+
+    async def get_extra_context(self) -> dict:
+        """ More template context, loaded before rendering. """
+        return {}
+
+    async def get(self, request, *args, **kwargs):
+        paginator = CursorPaginator(self.get_queryset(), self.cursor_ordering, self.paginate_by)
+        try:
+            page = await paginator.apage(request.GET.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise Http404(_('Invalid page.'))
+        add_page_links(page, request.GET, self.cursor_query_param)
+
+        extra_context, _user = await asyncio.gather(self.get_extra_context(), load_user(request))
+        return render(request, self.template_name, {
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': page.has_other_pages(),
+            'object_list': page.object_list,
+            self.context_object_name: page.object_list,
+            **extra_context,
+        })
+
+class AsyncBookListView(AsyncListView):
+    """ Async version of views.BookListView, filtered by the same facets (but its pages are not cached). """
+    queryset = Book.objects.select_related('author')
+    template_name = 'catalog/book_list.html'
+    context_object_name = 'book_list'
+    cursor_ordering = ('title', 'pk')
+
+    def setup(self, request, *args, **kwargs):
+        super().setup(request, *args, **kwargs)
+        self.filters = facets.parse_filters(request.GET)
+        self.canonical_query = facets.canonical_query(self.filters, request.GET.get(self.cursor_query_param))
+
+    async def get(self, request, *args, **kwargs):
+        # As BookListView: one URL per set of filters.
+        if request.GET.urlencode() != self.canonical_query:
+            return HttpResponsePermanentRedirect(
+                f'{request.path}?{self.canonical_query}' if self.canonical_query else request.path
+            )
+        return await super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return facets.filter_books(super().get_queryset(), self.filters)
+
+    async def get_extra_context(self) -> dict:
+        return {
+            'filters': self.filters,
+            'facets': await sync_to_async(facets.facet_links)(self.filters),
+        }
+
+class AsyncAuthorListView(AsyncListView):
+    queryset = Author.objects.all()
+    template_name = 'catalog/author_list.html'
+    context_object_name = 'author_list'
+    cursor_ordering = ('last_name', 'first_name', 'pk')
+
+class AsyncBookDetailView(View):
+    async def get(self, request, pk):
+        queryset = Book.objects.select_related('author', 'language').prefetch_related('genre')
+        try:
+            book = await queryset.aget(pk=pk)
+        except Book.DoesNotExist:
+            raise Http404(_('No book found matching the query'))
+
+        copies_version = await sync_to_async(book_copies_version)(pk)
+
+        # Like BookDetailView, the copies are only read when the cached
+        # 'Copies' fragment has to be rendered again, by the template. So
+        # this one is rendered in a thread, where it may query.
+        return await sync_to_async(render)(request, 'catalog/book_detail.html', {
+            'book': book,
+            'object': book,
+            'copies_version': copies_version,
+        })
+
+class AsyncAuthorDetailView(View):
+    async def get(self, request, pk):
+        try:
+            author = await Author.objects.aget(pk=pk)
+        except Author.DoesNotExist:
+            raise Http404(_('No author found matching the query'))
+
+        book_list = [book async for book in author.book_set.order_by('title', 'pk')]
+
+        await load_user(request)
+        return render(request, 'catalog/author_detail.html', {
+            'author': author,
+            'object': author,
+            'book_list': book_list,
+        })
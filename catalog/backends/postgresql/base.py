@@ -0,0 +1,97 @@
+from django.db.backends.postgresql import base, creation
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+from psycopg2 import extensions
+
+from catalog.backends.postgresql.pool import ConnectionPool, PoolTimeout, close_pools, get_pool
+
+# The PostgreSQL backend, with each process's connections pooled (see
+# pool.py). settings.py selects it, with ENGINE 'catalog.backends.postgresql',
+# when DATABASE_URL points to PostgreSQL.
+#
+# Django opens a connection when a request first needs one and closes it
+# when the request ends (CONN_MAX_AGE = 0): here closing returns it to the
+# pool, and opening takes one from there. The pool's settings are the
+# 'pool' entry of the database's OPTIONS:
+#
+#   'OPTIONS': {'pool': {'max_size': 4, 'timeout': 10, 'max_idle': 300, 'max_lifetime': 3600}}
+
+class PostgreSQLPool(ConnectionPool):
+    def check(self, connection):
+        # As CONN_HEALTH_CHECKS does for persistent connections: one the
+        # server closed (or lost) while it sat in the pool is replaced.
+        if connection.closed:
+            return False
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except base.Database.Error:
+            return False
+        return True
+
+    def reset(self, connection):
+        if connection.closed:
+            return False
+        try:
+            status = connection.get_transaction_status()
+            if status in (extensions.TRANSACTION_STATUS_ACTIVE, extensions.TRANSACTION_STATUS_UNKNOWN):
+                # Mid-query, or the connection is broken.
+                return False
+            if status != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            # Django sets it again when it takes the connection.
+            connection.autocommit = True
+        except base.Database.Error:
+            return False
+        return True
+
+    def close(self, connection):
+        try:
+            connection.close()
+        except base.Database.Error:
+            pass
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Idle pooled connections to the test database would stop it from
+        # being dropped.
+        close_pools()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop('pool', None)
+        return conn_params
+
+    def get_pool(self, conn_params):
+        """ The pool of connections made with 'conn_params'. """
+        key = tuple(sorted((name, repr(value)) for name, value in conn_params.items()))
+        options = self.settings_dict['OPTIONS'].get('pool', {})
+        return get_pool(key, lambda: PostgreSQLPool(**options))
+
+    @base.async_unsafe
+    def get_new_connection(self, conn_params):
+        # Set by the parent's get_new_connection() too, but a pooled
+        # connection does not go through it again.
+        self.isolation_level = IsolationLevel(
+            self.settings_dict['OPTIONS'].get('isolation_level', IsolationLevel.READ_COMMITTED)
+        )
+        self.pool = self.get_pool(conn_params)
+        try:
+            return self.pool.getconn(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        except PoolTimeout as e:
+            # Surfaces as django.db.OperationalError.
+            raise base.Database.OperationalError(str(e)) from e
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                # Django keeps using the closed connection object until the
+                # atomic block exits, so it cannot be handed to another thread.
+                self.pool.discard(self.connection)
+            else:
+                self.pool.putconn(self.connection)
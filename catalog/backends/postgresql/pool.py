@@ -0,0 +1,205 @@
+import os
+import threading
+import time
+
+# A per-process pool of database connections.
+#
+# Each gunicorn worker process keeps up to 'max_size' connections open and
+# hands them to its request threads in turn, so the connections open to the
+# server stay at (workers x max_size) however many requests arrive at once:
+# a burst waits for a free connection (for up to 'timeout' seconds) instead
+# of opening more. Idle connections are handed out most recently used
+# first, so that the ones a quiet period leaves unused can be closed after
+# 'max_idle' seconds. Every connection is replaced after 'max_lifetime'
+# seconds.
+#
+# ConnectionPool knows nothing of the database: getconn() is given the
+# function that opens a connection, and subclasses (see base.py) check,
+# reset and close them.
+
+class PoolTimeout(Exception):
+    pass
+
+class ConnectionPool:
+    """
+    A thread-safe pool of at most 'max_size' connections, opened as needed.
+
+        connection = pool.getconn(connect)
+        ...
+        pool.putconn(connection)
+    """
+
+    def __init__(self, max_size, timeout=10.0, max_idle=300.0, max_lifetime=3600.0):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.opened = 0  # Connections opened, in all.
+        self.peak = 0  # The most connections open at once.
+
+        self._condition = threading.Condition()
+        self._idle = []  # [(connection, time returned)], the most recent last.
+        self._opened_at = {}  # {id(connection): time opened}, for every open connection.
+        self._opening = 0
+
+    # Implemented by subclasses.
+
+    def check(self, connection) -> bool:
+        """ Whether an idle connection still works, before it is handed out. """
+        return True
+
+    def reset(self, connection) -> bool:
+        """ Readies a returned connection for reuse; False if it cannot be reused. """
+        return True
+
+    def close(self, connection):
+        connection.close()
+
+    # The pool.
+
+    @property
+    def size(self) -> int:
+        """ The number of connections open, idle or in use. """
+        return len(self._opened_at)
+
+    def getconn(self, connect):
+        """
+        Returns an idle connection, or a new one opened with connect() if
+        fewer than 'max_size' are open. Otherwise waits for one to be
+        returned, for up to 'timeout' seconds, then raises PoolTimeout.
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            expired = []
+            try:
+                with self._condition:
+                    connection = self._take(deadline, expired)
+            finally:
+                # Closed without holding the lock, which a slow close would
+                # keep from the other threads.
+                for stale in expired:
+                    self.close(stale)
+            if connection is None:
+                return self._open(connect)
+            if self.check(connection):
+                return connection
+            self.discard(connection)
+
+    def putconn(self, connection):
+        """ Returns a connection taken with getconn() to the pool. """
+        now = time.monotonic()
+        opened_at = self._opened_at.get(id(connection))
+        if opened_at is None or now - opened_at > self.max_lifetime or not self.reset(connection):
+            self.discard(connection)
+            return
+
+        with self._condition:
+            self._idle.append((connection, now))
+            expired = self._expire(now)
+            self._condition.notify()
+        for connection in expired:
+            self.close(connection)
+
+    def discard(self, connection):
+        """ Closes a connection taken with getconn() instead of returning it. """
+        with self._condition:
+            self._opened_at.pop(id(connection), None)
+            self._condition.notify()
+        self.close(connection)
+
+    def closeall(self):
+        """ Closes the idle connections. """
+        with self._condition:
+            idle = [connection for connection, _ in self._idle]
+            self._idle = []
+            for connection in idle:
+                del self._opened_at[id(connection)]
+            self._condition.notify_all()
+        for connection in idle:
+            self.close(connection)
+
+    def _take(self, deadline, expired):
+        """
+        Returns an idle connection, or None once there is room to open one.
+        Adds the idle connections that expired meanwhile to 'expired', to be
+        closed by the caller. Called with the lock held.
+        """
+        while True:
+            now = time.monotonic()
+            expired.extend(self._expire(now))
+
+            if self._idle:
+                connection, _ = self._idle.pop()
+                return connection
+            if self.size + self._opening < self.max_size:
+                self._opening += 1
+                return None
+
+            if now >= deadline:
+                raise PoolTimeout(
+                    f'No database connection was free within {self.timeout:g} seconds '
+                    f'({self.max_size} in use).'
+                )
+            self._condition.wait(deadline - now)
+
+    def _open(self, connect):
+        try:
+            connection = connect()
+        except BaseException:
+            with self._condition:
+                self._opening -= 1
+                self._condition.notify()
+            raise
+
+        with self._condition:
+            self._opening -= 1
+            self._opened_at[id(connection)] = time.monotonic()
+            self.opened += 1
+            self.peak = max(self.peak, self.size)
+        return connection
+
+    def _expire(self, now):
+        """
+        Removes the idle connections unused for 'max_idle' seconds, or open
+        for 'max_lifetime', and returns them (to be closed). Called with the
+        lock held.
+        """
+        expired = []
+        kept = []
+        for connection, returned in self._idle:
+            if now - returned > self.max_idle or now - self._opened_at[id(connection)] > self.max_lifetime:
+                del self._opened_at[id(connection)]
+                expired.append(connection)
+            else:
+                kept.append((connection, returned))
+        self._idle = kept
+        return expired
+
+# The pools of this process, by connection parameters.
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pid = os.getpid()
+
+def get_pool(key, create):
+    """ Returns the pool for 'key', creating it with create() the first time. """
+    global _pid
+    with _pools_lock:
+        if os.getpid() != _pid:
+            # A forked child must not share its parent's connections: it
+            # leaves them to the parent and starts its own pools.
+            _pools.clear()
+            _pid = os.getpid()
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = create()
+        return pool
+
+def all_pools():
+    with _pools_lock:
+        return list(_pools.values())
+
+def close_pools():
+    """ Closes the idle connections of every pool, e.g. as a worker exits. """
+    for pool in all_pools():
+        pool.closeall()
@@ -0,0 +1,422 @@
+import datetime
+import math
+import statistics
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.db import close_old_connections, connection, connections
+from django.db.backends.signals import connection_created
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from catalog.counters import (
+    compute_index_counts, get_index_counts, invalidate_index_counts, recount_book_counters,
+)
+from catalog import loans
+from catalog.backends.postgresql.pool import all_pools
+from catalog.facets import (
+    compute_facet_counts, get_facet_counts, invalidate_book_list, invalidate_facet_counts, rebuild_facet_counts,
+)
+from catalog.importers import CatalogImporter
+from catalog.lookups import invalidate_genres
+from catalog.models import Author, Book, BookInstance, Genre, Language, Reservation
+from catalog.pagination import CursorPaginator
+from catalog.search import rebuild_search_index, search_books
+
+# Benchmarks are run with 'python manage.py benchmark <name>'.
+# Each one is given a 'scale' (roughly, the number of books to create) and a
+# 'repeat' count, and returns a list of results built by measure().
+BENCHMARKS = {}
+
+def benchmark(name):
+    """ Registers a benchmark function under 'name'. """
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+def measure(label, func, repeat):
+    """ Calls func 'repeat' times, recording latency and queries per call. """
+    timings = []
+    num_queries = 0
+
+    for _ in range(repeat):
+        # The query log is capped (at 9000 queries), so counts taken from a
+        # full log would be wrong.
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        num_queries += len(queries.captured_queries)
+
+    timings.sort()
+    return {
+        'label': label,
+        'queries': num_queries / repeat,
+        'median_ms': statistics.median(timings),
+        'p95_ms': timings[math.ceil(len(timings) * 0.95) - 1],
+    }
+
+def seed_catalog(num_books, copies_per_book=2):
+    """ Bulk creates a synthetic catalog of 'num_books' books. """
+    language = Language.objects.create(language_name='Benchmarkish')
+    genres = Genre.objects.bulk_create(
+        [Genre(name=name) for name in ('Horror', 'Fantasy', 'Science Fiction', 'Romance')]
+    )
+    authors = Author.objects.bulk_create(
+        [Author(first_name=f'First {i}', last_name=f'Last {i}') for i in range(max(num_books // 10, 1))]
+    )
+
+    books = Book.objects.bulk_create([
+        Book(
+            title=f'The Benchmark Book {i}' if i % 3 else f'Benchmark Book {i}',
+            summary=f'Summary of benchmark book number {i}.',
+            isbn=f'B{i:012d}',
+            author=authors[i % len(authors)],
+            language=language,
+        )
+        for i in range(num_books)
+    ], batch_size=1000)
+
+    Book.genre.through.objects.bulk_create([
+        Book.genre.through(book_id=book.pk, genre_id=genres[i % len(genres)].pk)
+        for i, book in enumerate(books)
+    ], batch_size=1000)
+
+    statuses = [status for status, _ in BookInstance.LOAN_STATUS]
+    BookInstance.objects.bulk_create([
+        BookInstance(
+            id=uuid.uuid4(),
+            book=book,
+            imprint='Benchmark Press',
+            status=statuses[(i + copy) % len(statuses)],
+        )
+        for i, book in enumerate(books)
+        for copy in range(copies_per_book)
+    ], batch_size=1000)
+
+    # bulk_create() does not send signals, so the copy counters, facet
+    # counts and caches must be updated by hand.
+    recount_book_counters()
+    rebuild_facet_counts()
+    invalidate_index_counts()
+    invalidate_genres()
+    return books
+
+def _legacy_index_counts():
+    """ The six separate COUNT queries the index view used to run. """
+    return {
+        'num_books': Book.objects.all().count(),
+        'num_instances': BookInstance.objects.all().count(),
+        'num_instances_available': BookInstance.objects.filter(status__exact='a').count(),
+        'num_authors': Author.objects.count(),
+        'num_genres_with_word': Genre.objects.filter(name__icontains='horror').count(),
+        'num_books_with_word_the': Book.objects.filter(title__icontains='the ').count(),
+    }
+
+@benchmark('index')
+def index_benchmark(scale, repeat):
+    seed_catalog(scale)
+    browser = Client()
+    url = reverse('index')
+
+    def uncached_request():
+        invalidate_index_counts()
+        browser.get(url)
+
+    return [
+        measure('counts: six COUNT queries (before)', _legacy_index_counts, repeat),
+        measure('counts: single aggregate query', compute_index_counts, repeat),
+        measure('counts: cached', get_index_counts, repeat),
+        measure('index view: cache miss', uncached_request, repeat),
+        measure('index view: cache hit', lambda: browser.get(url), repeat),
+    ]
+
+@benchmark('search')
+def search_benchmark(scale, repeat):
+    seed_catalog(scale, copies_per_book=0)
+    rebuild_search_index()
+    browser = Client()
+
+    def first_page(query):
+        # What BookSearchView runs: the page of results and the total.
+        results = search_books(query)
+        return list(results[:10]), results.count()
+
+    return [
+        measure("search: 'benchmark book' (every book)", lambda: first_page('benchmark book'), repeat),
+        measure("search: 'horror' (a quarter)", lambda: first_page('horror'), repeat),
+        measure(f"search: '{scale - 1}' (one book)", lambda: first_page(str(scale - 1)), repeat),
+        measure("search view: 'last 1'", lambda: browser.get(reverse('search'), {'q': 'last 1'}), repeat),
+    ]
+
+@benchmark('api')
+def api_benchmark(scale, repeat):
+    books = seed_catalog(scale)
+    browser = Client()
+    book = books[len(books) // 2]
+
+    def throughput(result):
+        result['label'] += f" ({1000 / result['median_ms']:.0f} req/s)"
+        return result
+
+    detail_url = reverse('api-book-detail', args=[book.pk])
+    etag = browser.get(detail_url)['ETag']
+
+    return [throughput(result) for result in (
+        measure('html: book list', lambda: browser.get(reverse('books')), repeat),
+        measure('api: book list (20 rows)', lambda: browser.get(reverse('api-books')), repeat),
+        measure('api: book list, ?fields=title', lambda: browser.get(reverse('api-books'), {'fields': 'title'}), repeat),
+        measure('html: book detail', lambda: browser.get(book.get_absolute_url()), repeat),
+        measure('api: book detail', lambda: browser.get(detail_url), repeat),
+        measure('api: book detail, 304', lambda: browser.get(detail_url, HTTP_IF_NONE_MATCH=etag), repeat),
+    )]
+
+@benchmark('import')
+def import_benchmark(scale, repeat):
+    records = [
+        {
+            'title': f'Imported Book {i}',
+            'isbn': f'I{i:012d}',
+            'summary': f'Summary of imported book number {i}.',
+            'author_first_name': f'First {i % 500}',
+            'author_last_name': f'Last {i % 500}',
+            'language': ('English', 'French', 'Spanish')[i % 3],
+            'genres': ['Fiction', ('Horror', 'Fantasy', 'Romance')[i % 3]],
+        }
+        for i in range(scale)
+    ]
+
+    def books_per_minute(result):
+        result['label'] += f" ({scale / result['median_ms'] * 60000:.0f} books/minute)"
+        return result
+
+    # The first run creates every book, the following ones update them all.
+    return [
+        books_per_minute(measure(f'import {scale} books: create', lambda: CatalogImporter().run(records), 1)),
+        books_per_minute(measure(f'import {scale} books: upsert', lambda: CatalogImporter().run(records), repeat)),
+    ]
+
+@benchmark('metrics')
+def metrics_benchmark(scale, repeat):
+    seed_catalog(scale)
+    url = reverse('books')
+
+    def client(middleware, sample_rate=0):
+        with override_settings(MIDDLEWARE=middleware, CATALOG_METRICS_SAMPLE_RATE=sample_rate):
+            browser = Client()
+            browser.get(url)  # Builds the middleware chain with these settings.
+        return browser
+
+    without = [name for name in settings.MIDDLEWARE if name != 'catalog.middleware.MetricsMiddleware']
+    clients = [
+        ('book list: no metrics middleware', client(without)),
+        ('book list: metrics, default sampling', client(settings.MIDDLEWARE, settings.CATALOG_METRICS_SAMPLE_RATE)),
+        ('book list: metrics, every request', client(settings.MIDDLEWARE, 1.0)),
+    ]
+    return [measure(label, lambda browser=browser: browser.get(url), repeat) for label, browser in clients]
+
+@benchmark('loans')
+def loans_benchmark(scale, repeat):
+    seed_catalog(scale)
+    librarian = User.objects.create_user(username='benchmark-librarian')
+    librarian.user_permissions.add(*Permission.objects.filter(codename__in=['can_mark_returned', 'can_renew']))
+
+    # Every copy is lent to one of a hundred borrowers (the librarian too).
+    borrowers = [librarian] + User.objects.bulk_create(
+        [User(username=f'benchmark-borrower-{i}') for i in range(99)]
+    )
+    today = datetime.date.today()
+    loans = list(BookInstance.objects.all())
+    for i, loan in enumerate(loans):
+        loan.status = 'o'
+        loan.borrower = borrowers[i % len(borrowers)]
+        loan.due_back = today + datetime.timedelta(days=i % 60)
+    BookInstance.objects.bulk_update(loans, ['status', 'borrower', 'due_back'], batch_size=1000)
+    recount_book_counters()
+
+    browser = Client()
+    browser.force_login(librarian)
+
+    def deep_cursor(queryset, pages):
+        """ The cursor of the page 'pages' pages in, as the views paginate. """
+        cursor = None
+        for _ in range(pages):
+            cursor = CursorPaginator(queryset, ('due_back', 'pk'), 10).page(cursor).next_cursor
+        return cursor
+
+    on_loan = BookInstance.objects.filter(status__exact='o')
+    results = []
+    for name, label, queryset in (
+        ('all-borrowed', 'all loans', on_loan),
+        ('my-borrowed', 'my loans', on_loan.filter(borrower=librarian)),
+    ):
+        url = reverse(name)
+        cursor = deep_cursor(queryset, 5)
+        results += [
+            measure(f'{label} ({queryset.count()} on loan): first page', lambda: browser.get(url), repeat),
+            measure(f'{label}: sixth page', lambda: browser.get(url, {'cursor': cursor}), repeat),
+        ]
+    return results
+
+@benchmark('reservations')
+def reservations_benchmark(scale, repeat):
+    """ 100 holds per book (100,000 at the default scale). """
+    books = seed_catalog(scale, copies_per_book=1)
+    librarian = User.objects.create_user(username='benchmark-librarian')
+    librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+
+    popular = BookInstance.objects.filter(status__exact='a').select_related('book').first()
+    loans.checkout(popular, librarian)
+
+    # 1000 borrowers, each waiting for 100 books; everyone waits for the
+    # popular one.
+    borrowers = User.objects.bulk_create([User(username=f'benchmark-borrower-{i}') for i in range(1000)])
+    Reservation.objects.bulk_create([
+        Reservation(book=popular.book if hold == 0 else books[(i * 100 + hold) % len(books)], borrower=borrower)
+        for i, borrower in enumerate(borrowers)
+        for hold in range(100)
+    ], batch_size=5000, ignore_conflicts=True)
+    queued = Reservation.objects.count()
+
+    def return_to_queue():
+        # The copy goes to the head of the queue, who takes it out again.
+        copy = loans.return_(popular)
+        loans.checkout(copy, copy.borrower)
+
+    browser = Client()
+    browser.force_login(librarian)
+
+    return [
+        measure(f'next in line ({queued} queued)', lambda: loans.next_in_queue(popular.book_id), repeat),
+        measure('return to the head of the queue + checkout', return_to_queue, repeat),
+        measure('queue depths view', lambda: browser.get(reverse('reservation-queues')), repeat),
+    ]
+
+@benchmark('facets')
+def facets_benchmark(scale, repeat):
+    books = seed_catalog(scale)
+    genre = books[0].genre.get()
+    author = books[0].author
+    browser = Client()
+    url = reverse('books')
+
+    def group_by_counts():
+        # What the facet counts would cost without the FacetCount table.
+        return [
+            list(Book.genre.through.objects.values('genre_id').annotate(n=Count('pk')).order_by('-n')[:20]),
+            list(Book.objects.values('language_id').annotate(n=Count('pk')).order_by('-n')[:20]),
+            list(Book.objects.values('author_id').annotate(n=Count('pk')).order_by('-n')[:20]),
+            Book.objects.filter(copies_available__gt=0).count(),
+        ]
+
+    def uncached_page(query):
+        invalidate_facet_counts()
+        invalidate_book_list()
+        browser.get(url, query)
+
+    def add_and_remove_genre():
+        books[1].genre.add(genre)
+        books[1].genre.remove(genre)
+
+    filtered = {'genre': genre.pk, 'available': 1}
+    return [
+        measure('facet counts: GROUP BY over the books', group_by_counts, repeat),
+        measure('facet counts: FacetCount table', compute_facet_counts, repeat),
+        measure('facet counts: cached', get_facet_counts, repeat),
+        measure('book list, genre + available: cache miss', lambda: uncached_page(filtered), repeat),
+        measure('book list, genre + available: cache hit', lambda: browser.get(url, filtered), repeat),
+        measure('book list, author: cache hit', lambda: browser.get(url, {'author': author.pk}), repeat),
+        measure('genre.add() + remove() (incremental refresh)', add_and_remove_genre, repeat),
+    ]
+
+@benchmark('connections')
+def connections_benchmark(scale, repeat):
+    """
+    A burst of concurrent clients (one thread each, up to 50) on the author
+    list, reporting how many database connections they opened. The catalog
+    is not seeded: the threads could not see the benchmark's uncommitted
+    data.
+    """
+    clients = min(scale, 50)
+    url = reverse('authors')
+    timings = []
+    num_queries = []
+    opened = []
+    errors = []
+
+    def count_connection(**kwargs):
+        opened.append(1)
+
+    def run_client():
+        browser = Client()
+        db = connections['default']
+        try:
+            for _ in range(repeat):
+                with CaptureQueriesContext(db) as queries:
+                    start = time.perf_counter()
+                    browser.get(url)
+                    # What request_finished does in a server (the test
+                    # client leaves it out).
+                    close_old_connections()
+                    timings.append((time.perf_counter() - start) * 1000)
+                num_queries.append(len(queries.captured_queries))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            db.close()
+
+    pools = all_pools()
+    opened_before = sum(pool.opened for pool in pools)
+    peak = []
+    done = threading.Event()
+
+    def sample_server_connections():
+        # One extra connection, which the count leaves out.
+        with connections['default'].cursor() as cursor:
+            while not done.wait(0.005):
+                cursor.execute(
+                    'SELECT count(*) - 1 FROM pg_stat_activity WHERE datname = current_database()'
+                )
+                peak.append(cursor.fetchone()[0])
+        connections['default'].close()
+
+    threads = [threading.Thread(target=run_client) for _ in range(clients)]
+    sampler = threading.Thread(target=sample_server_connections)
+    if connection.vendor == 'postgresql':
+        sampler.start()
+    connection_created.connect(count_connection)
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        connection_created.disconnect(count_connection)
+        done.set()
+        if sampler.is_alive():
+            sampler.join()
+    if errors:
+        raise errors[0]
+
+    if pools or all_pools():
+        # connection_created is also sent when a pooled connection is taken.
+        label = f'opened {sum(pool.opened for pool in all_pools()) - opened_before} (pooled)'
+    else:
+        label = f'opened {len(opened)}'
+    if peak:
+        label += f', peak {max(peak)} on the server'
+
+    timings.sort()
+    return [{
+        'label': f'{clients} clients x {repeat}: {label}',
+        'queries': statistics.mean(num_queries),
+        'median_ms': statistics.median(timings),
+        'p95_ms': timings[math.ceil(len(timings) * 0.95) - 1],
+    }]
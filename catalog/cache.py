@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from catalog.routers import use_primary
+
+# Cached values are stored under Django's cache 'version' argument.
+# Bumping a version stamp makes every value written under the old stamp
+# unreachable, so invalidation is a single cache.incr() instead of having
+# to find and delete every derived key.
+#
+# The version stamps live in the shared cache (settings.CACHES, Redis in
+# production), so a bump made by one worker is seen by all of them.
+
+def _version_key(name: str) -> str:
+    return f'catalog:version:{name}'
+
+def get_version(name: str) -> int:
+    """ Returns the current version stamp for 'name', creating it if needed. """
+    key = _version_key(name)
+    version = cache.get(key)
+
+    if version is None:
+        # Start from the clock rather than 1, so that a stamp which was evicted
+        # from the cache can never come back and match stale values.
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+
+    return version
+
+def bump_version(name: str) -> int:
+    """ Invalidates everything cached under the current version of 'name'. """
+    try:
+        return cache.incr(_version_key(name))
+    except ValueError:
+        # The stamp was never created (or was evicted), so nothing can be
+        # cached under it. Creating a fresh one is enough.
+        return get_version(name)
+
+# Per-book stamp for the 'Copies' fragment of book_detail.html.
+
+def book_copies_version(book_id) -> int:
+    return get_version(f'book-copies:{book_id}')
+
+def bump_book_copies_version(book_id) -> int:
+    return bump_version(f'book-copies:{book_id}')
+
+# Two-tier reads. get_cached() keeps the values it reads in a small
+# in-process LRU ("L1") in front of the shared cache, keyed by their version
+# stamp: a hit costs one shared cache read (of the stamp) and no
+# unpickling, and a bumped stamp misses in every worker at once. The L1
+# TTL only bounds how long unused entries stay in memory.
+
+class LocalCache:
+    """ A bounded, thread-safe LRU of (expiry, value) with a TTL. """
+
+    def __init__(self, max_entries=512, timeout=300):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+local_cache = LocalCache(**{
+    name.lower(): value for name, value in getattr(settings, 'CATALOG_LOCAL_CACHE', {}).items()
+})
+
+_MISSING = object()
+
+def get_cached(name: str, compute, timeout=None, key=None):
+    """
+    Returns the value cached under the version stamp 'name', computing (and
+    caching) it with compute() on a miss. bump_version(name) invalidates it.
+    Several values can share one stamp, each under its own 'key'.
+    """
+    version = get_version(name)
+    local_key = (name, key, version)
+    value = local_cache.get(local_key, _MISSING)
+
+    if value is _MISSING:
+        cache_key = f'catalog:{name}' if key is None else f'catalog:{name}:{key}'
+        value = cache.get(cache_key, _MISSING, version=version)
+        if value is _MISSING:
+            # From the primary: a lagging read replica's value would be
+            # cached until the next bump.
+            with use_primary():
+                value = compute()
+            cache.set(cache_key, value, timeout, version=version)
+        local_cache.set(local_key, value)
+
+    return value
@@ -0,0 +1,136 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Func, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Greatest
+
+from catalog.cache import bump_version, get_cached
+from catalog.facets import AVAILABLE, adjust_facet_counts, invalidate_book_list
+from catalog.models import Author, Book, BookInstance, Genre
+
+# Name of the version stamp that guards the home page counters.
+INDEX_COUNTS = 'index-counts'
+INDEX_COUNTS_TIMEOUT = 60 * 60
+
+def _scalar_count(queryset):
+    """ Returns a scalar subquery 'SELECT COUNT(*) FROM ...' for the queryset. """
+    # A plain Func (rather than Count) is not treated as an aggregate, so no
+    # GROUP BY is added and the subquery always returns exactly one row.
+    counted = queryset.order_by().annotate(
+        n=Func(F('pk'), function='COUNT', output_field=IntegerField())
+    ).values('n')
+    return Subquery(counted, output_field=IntegerField())
+
+def compute_index_counts() -> dict:
+    """ Computes all the home page counters with a single query. """
+    return (
+        BookInstance.objects.order_by()
+        # Grouping on a constant collapses the whole table into one row, even
+        # when it is empty, so the conditional counts below are table-wide.
+        .annotate(_all=Value(1)).values('_all')
+        .annotate(
+            num_instances=Count('pk'),
+            num_instances_available=Count('pk', filter=Q(status__exact='a')),
+            num_books=_scalar_count(Book.objects.all()),
+            num_books_with_word_the=_scalar_count(Book.objects.filter(title__icontains='the ')),
+            num_authors=_scalar_count(Author.objects.all()),
+            num_genres_with_word=_scalar_count(Genre.objects.filter(name__icontains='horror')),
+        )
+        .values(
+            'num_books', 'num_instances', 'num_instances_available',
+            'num_authors', 'num_genres_with_word', 'num_books_with_word_the',
+        )
+        .get()
+    )
+
+def get_index_counts() -> dict:
+    """ Returns the home page counters, from the cache when possible. """
+    return get_cached(INDEX_COUNTS, compute_index_counts, INDEX_COUNTS_TIMEOUT)
+
+def invalidate_index_counts():
+    """ Forces the next call of get_index_counts() to recompute. """
+    bump_version(INDEX_COUNTS)
+
+# Per-book copy counters (Book.copies_total, copies_available and
+# copies_on_loan). The receivers in catalog/signals.py move a copy between
+# them with F() updates as copies are created, saved and deleted, so
+# concurrent changes cannot overwrite each other. queryset.update() and
+# bulk_create() send no signals: after those, call recount_book_counters()
+# for the books concerned ('manage.py reconcile_counters' finds any drift).
+
+# counter: the status of the copies it counts (None for every copy).
+COPY_COUNTERS = {
+    'copies_total': None,
+    'copies_available': 'a',
+    'copies_on_loan': 'o',
+}
+
+def _counted_in(status):
+    return [name for name, counted in COPY_COUNTERS.items() if counted in (None, status)]
+
+def adjust_book_counters(old, new):
+    """
+    Moves one copy from 'old' to 'new', each a (book_id, status) pair, or
+    None for a copy that is created or deleted.
+    """
+    deltas = defaultdict(Counter)
+    if old is not None and old[0] is not None:
+        for name in _counted_in(old[1]):
+            deltas[old[0]][name] -= 1
+    if new is not None and new[0] is not None:
+        for name in _counted_in(new[1]):
+            deltas[new[0]][name] += 1
+
+    for book_id, counters in deltas.items():
+        # Never below zero, even if the counters had drifted.
+        changes = {
+            name: Greatest(F(name) + delta, Value(0))
+            for name, delta in counters.items() if delta
+        }
+        if not changes:
+            continue
+        if 'copies_available' not in changes:
+            Book.objects.filter(pk=book_id).update(**changes)
+            continue
+
+        # Whether the book has a copy available is a facet of the book list
+        # (catalog/facets.py). The book's row stays locked from the read to
+        # the update, so concurrent changes each see the other's result.
+        with transaction.atomic():
+            was = (
+                Book.objects.select_for_update().filter(pk=book_id)
+                .values_list('copies_available', flat=True).first()
+            )
+            Book.objects.filter(pk=book_id).update(**changes)
+            if was is not None:
+                now = max(was + counters['copies_available'], 0)
+                if (was > 0) != (now > 0):
+                    adjust_facet_counts({AVAILABLE: 1 if now else -1})
+
+def _actual_copy_counts():
+    """ The copy counters of each book, computed from its copies (subqueries). """
+    return {
+        name: _scalar_count(BookInstance.objects.filter(
+            book=OuterRef('pk'), **({} if status is None else {'status__exact': status})
+        ))
+        for name, status in COPY_COUNTERS.items()
+    }
+
+def recount_book_counters(books=None):
+    """ Recomputes the counters of 'books' (a Book queryset, every book by default). """
+    books = Book.objects.all() if books is None else books
+    available = books.filter(copies_available__gt=0)
+    with transaction.atomic():
+        was = available.count()
+        updated = books.update(**_actual_copy_counts())
+        adjust_facet_counts({AVAILABLE: available.count() - was})
+    invalidate_book_list()
+    return updated
+
+def find_counter_drift(books):
+    """ Returns the ids of the books in 'books' whose counters do not match their copies. """
+    actual = {f'actual_{name}': count for name, count in _actual_copy_counts().items()}
+    drifted = Q(pk__in=[])
+    for name in COPY_COUNTERS:
+        drifted |= ~Q(**{name: F(f'actual_{name}')})
+    return list(books.annotate(**actual).filter(drifted).values_list('pk', flat=True))
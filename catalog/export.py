@@ -0,0 +1,132 @@
+import csv
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from catalog.models import Book, BookInstance
+
+# Streaming catalog exports, used by the export views and by the
+# 'export_books' / 'export_bookinstances' management commands.
+#
+# Rows are read with values().iterator(chunk_size=...), so at most one chunk
+# of rows is in memory at a time, and are encoded (and gzipped) as they are
+# produced. Memory use does not grow with the size of the table.
+
+CHUNK_SIZE = 2000
+
+# name: (queryset, [(column, values() lookup), ...])
+EXPORTS = {
+    'books': (
+        lambda: Book.objects.order_by('pk'),
+        [
+            ('id', 'id'),
+            ('title', 'title'),
+            ('isbn', 'isbn'),
+            ('summary', 'summary'),
+            ('author_id', 'author_id'),
+            ('author_first_name', 'author__first_name'),
+            ('author_last_name', 'author__last_name'),
+            ('language', 'language__language_name'),
+        ],
+    ),
+    'bookinstances': (
+        lambda: BookInstance.objects.order_by('pk'),
+        [
+            ('id', 'id'),
+            ('book_id', 'book_id'),
+            ('book_title', 'book__title'),
+            ('imprint', 'imprint'),
+            ('status', 'status'),
+            ('due_back', 'due_back'),
+            ('borrower', 'borrower__username'),
+        ],
+    ),
+}
+
+FORMATS = ('csv', 'jsonl')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+def export_rows(name):
+    """ Yields the rows of the export 'name' as (column, value) dicts. """
+    queryset, columns = EXPORTS[name]
+    lookups = [lookup for column, lookup in columns]
+
+    for row in queryset().values_list(*lookups).iterator(chunk_size=CHUNK_SIZE):
+        yield dict(zip((column for column, lookup in columns), row))
+
+class _Echo:
+    """ A file-like object that hands back what csv.writer writes to it. """
+
+    def write(self, value):
+        return value
+
+def render(name, format):
+    """ Yields the export 'name' as chunks of text in 'format'. """
+    if format == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow([column for column, lookup in EXPORTS[name][1]])
+        for row in export_rows(name):
+            yield writer.writerow(row.values())
+    elif format == 'jsonl':
+        encoder = DjangoJSONEncoder()
+        for row in export_rows(name):
+            yield encoder.encode(row) + '\n'
+    else:
+        raise ValueError(f'Unknown export format: {format}')
+
+def accepts_gzip(accept_encoding):
+    """
+    Whether an Accept-Encoding header allows a gzip response: 'gzip' (or
+    '*', when gzip is not listed) with a q-value above 0.
+    """
+    qvalues = {}
+    for item in accept_encoding.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding:
+            qvalues[coding.lower()] = q
+
+    for coding in ('gzip', 'x-gzip', '*'):
+        if coding in qvalues:
+            return qvalues[coding] > 0
+    return False
+
+def encode(chunks, compress=False, buffer_size=64 * 1024):
+    """
+    Encodes text chunks to UTF-8 (and gzip, if 'compress'), grouping them in
+    blocks of about 'buffer_size' bytes rather than yielding every row.
+    """
+    # wbits=31 gives a gzip (rather than raw zlib) stream.
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = []
+    size = 0
+
+    for chunk in chunks:
+        data = chunk.encode()
+        buffer.append(data)
+        size += len(data)
+
+        if size >= buffer_size:
+            block = b''.join(buffer)
+            buffer, size = [], 0
+            block = compressor.compress(block) if compressor else block
+            if block:
+                yield block
+
+    block = b''.join(buffer)
+    if compressor:
+        block = compressor.compress(block) + compressor.flush()
+    if block:
+        yield block
@@ -0,0 +1,198 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Value
+from django.db.models.functions import Greatest
+from django.http import QueryDict
+
+from catalog.cache import bump_version, get_cached
+from catalog.lookups import get_genres, get_languages
+from catalog.models import Author, Book, FacetCount
+
+# Faceted browsing of the book list (BookListView): by genre, language,
+# author and availability.
+#
+# The number of books with each value of a facet is kept in the FacetCount
+# table, so showing the facets costs a few short index reads (cached) and
+# no GROUP BY over the books. The receivers in catalog/signals.py move a
+# book between values with F() updates as it is saved, deleted or has its
+# genres changed (m2m_changed), and catalog/counters.py does the same for
+# 'available' when a book's copies_available goes from or to zero. The
+# counts are of the whole catalog: they are not narrowed by the filters
+# already chosen, which would take a GROUP BY over the filtered books.
+#
+# Bulk operations, which send no signals, should call rebuild_facet_counts()
+# (or run 'manage.py rebuild_facets').
+#
+# Each set of filters has one canonical query string (see canonical_query()),
+# under which BookListView caches its pages.
+
+# The facets, in the order of the query string.
+FACETS = ('genre', 'language', 'author', 'available')
+# The one value of the 'available' facet.
+AVAILABLE = ('available', 1)
+
+# Version stamps (catalog/cache.py) of the facet counts, and of the pages
+# of the book list.
+FACET_COUNTS = 'facet-counts'
+BOOK_LIST = 'book-list'
+
+# How many values of a facet are listed (the ones with the most books).
+TOP_VALUES = 20
+
+def invalidate_facet_counts():
+    bump_version(FACET_COUNTS)
+
+def invalidate_book_list():
+    bump_version(BOOK_LIST)
+
+def adjust_facet_counts(deltas):
+    """ Applies 'deltas', a mapping of (facet, value) pairs to a change in their number of books. """
+    deltas = {key: delta for key, delta in deltas.items() if delta and key[1] is not None}
+    if not deltas:
+        return
+
+    # Values counted for the first time (e.g. a new genre) get their row.
+    FacetCount.objects.bulk_create(
+        [FacetCount(facet=facet, value=value) for facet, value in deltas], ignore_conflicts=True,
+    )
+    by_delta = defaultdict(list)
+    for (facet, value), delta in deltas.items():
+        by_delta[facet, delta].append(value)
+    for (facet, delta), values in by_delta.items():
+        # Never below zero, even if the counts had drifted.
+        FacetCount.objects.filter(facet=facet, value__in=values).update(
+            books=Greatest(F('books') + delta, Value(0)),
+        )
+
+    invalidate_facet_counts()
+
+def book_facets(values):
+    """ The (facet, value) pairs of a book's language and author, from its field values. """
+    return [('language', values.get('language_id')), ('author', values.get('author_id'))]
+
+def move_book(old, new):
+    """ Moves a book from the 'old' to the 'new' (facet, value) pairs (either may be empty). """
+    deltas = Counter()
+    deltas.subtract(old)
+    deltas.update(new)
+    adjust_facet_counts(deltas)
+
+def rebuild_facet_counts():
+    """ Recounts every facet from the books. """
+    through = Book.genre.through
+    counts = [
+        *(('genre', row['genre_id'], row['n'])
+          for row in through.objects.values('genre_id').annotate(n=Count('pk')).order_by()),
+        *(('language', row['language_id'], row['n'])
+          for row in Book.objects.filter(language__isnull=False).values('language_id').annotate(n=Count('pk')).order_by()),
+        *(('author', row['author_id'], row['n'])
+          for row in Book.objects.filter(author__isnull=False).values('author_id').annotate(n=Count('pk')).order_by()),
+        (*AVAILABLE, Book.objects.filter(copies_available__gt=0).count()),
+    ]
+    with transaction.atomic():
+        FacetCount.objects.all().delete()
+        FacetCount.objects.bulk_create(
+            [FacetCount(facet=facet, value=value, books=books) for facet, value, books in counts],
+            batch_size=1000,
+        )
+    invalidate_facet_counts()
+    invalidate_book_list()
+
+# Reading the facets.
+
+def _labels(facet, values):
+    """ The display names of the values of a facet, by value. """
+    # Genres and languages come from the cached lookup tables.
+    if facet == 'genre':
+        return {genre.pk: genre.name for genre in get_genres()}
+    if facet == 'language':
+        return {language.pk: language.language_name for language in get_languages()}
+    if facet == 'author':
+        return {author.pk: str(author) for author in Author.objects.filter(pk__in=values)}
+    return {1: 'Available now'}
+
+def compute_facet_counts() -> dict:
+    """ The TOP_VALUES values of each facet with the most books, as (value, label, books) lists. """
+    top = FacetCount.objects.filter(books__gt=0).order_by('-books', 'value')
+    # Genres and languages are few, like their lookup tables: they are read
+    # whole, with one query. Authors are many: only the top ones are read.
+    rows = defaultdict(list)
+    for facet, value, books in top.exclude(facet='author').values_list('facet', 'value', 'books'):
+        rows[facet].append((value, books))
+    rows['author'] = list(top.filter(facet='author').values_list('value', 'books')[:TOP_VALUES])
+
+    counts = {}
+    for facet in FACETS:
+        labels = _labels(facet, [value for value, _ in rows[facet]])
+        counts[facet] = [(value, labels[value], books) for value, books in rows[facet] if value in labels][:TOP_VALUES]
+    return counts
+
+def get_facet_counts() -> dict:
+    """ compute_facet_counts(), from the cache when possible. """
+    return get_cached(FACET_COUNTS, compute_facet_counts)
+
+# Filters.
+
+def parse_filters(query) -> dict:
+    """
+    The filters of a query string ('request.GET'), as a {facet: value}
+    dict. Values that are not ids, and unknown parameters, are ignored.
+    """
+    filters = {}
+    for facet in FACETS:
+        value = query.get(facet, '')
+        if value.isdigit() and int(value) > 0 and (facet != 'available' or value == '1'):
+            filters[facet] = int(value)
+    return filters
+
+def canonical_query(filters, cursor=None) -> str:
+    """ The query string of 'filters' (and of a page 'cursor'): the facets in FACETS order, the cursor last. """
+    query = QueryDict(mutable=True)
+    for facet in FACETS:
+        if facet in filters:
+            query[facet] = str(filters[facet])
+    if cursor:
+        query['cursor'] = cursor
+    return query.urlencode()
+
+def filter_books(queryset, filters):
+    """ Narrows a Book queryset to 'filters'. """
+    if 'genre' in filters:
+        queryset = queryset.filter(genre=filters['genre'])
+    if 'language' in filters:
+        queryset = queryset.filter(language=filters['language'])
+    if 'author' in filters:
+        queryset = queryset.filter(author=filters['author'])
+    if 'available' in filters:
+        queryset = queryset.filter(copies_available__gt=0)
+    return queryset
+
+def facet_links(filters) -> list:
+    """
+    The facets to show next to the book list: for each, a (facet, links)
+    pair, each link a dict with the value's label, number of books, whether
+    it is selected and the query string that toggles it.
+    """
+    counts = get_facet_counts()
+    facets = []
+    for facet in FACETS:
+        values = counts[facet]
+        if facet in filters and filters[facet] not in {value for value, _, _ in values}:
+            # A chosen value outside the top ones is listed too, so it can be unselected.
+            value = filters[facet]
+            labels = _labels(facet, [value])
+            if value in labels:
+                books = FacetCount.objects.filter(facet=facet, value=value).values_list('books', flat=True).first()
+                values = [(value, labels[value], books or 0), *values]
+
+        links = []
+        for value, label, books in values:
+            selected = filters.get(facet) == value
+            toggled = {name: v for name, v in filters.items() if name != facet}
+            if not selected:
+                toggled[facet] = value
+            links.append({'label': label, 'books': books, 'selected': selected, 'query': canonical_query(toggled)})
+        if links:
+            facets.append((facet, links))
+    return facets
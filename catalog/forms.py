@@ -1,23 +1,109 @@
 import datetime
+import uuid
 
 from django import forms
+from django.contrib.auth.models import User
 
 from django.core.exceptions import ValidationError
+from django.forms.models import ModelChoiceIterator
 from django.utils.translation import gettext_lazy as _
 
+from catalog.lookups import get_genres, get_languages
+from catalog.models import Book
+
+def validate_due_date(data):
+    """ Checks a new due date of a loan (renewal or checkout). """
+    # Check if a date is not in the past.
+    if data < datetime.date.today():
+        raise ValidationError(_('Invalid date - renewal in past'))
+
+    # Check if a date is in the allowed range (4 or less weeks from today)
+    if data > datetime.date.today() + datetime.timedelta(weeks=4):
+        raise ValidationError(_('Invalid date - renewal more than 4 weeks ahead'))
+
 class RenewBookForm(forms.Form):
     renewal_date = forms.DateField(help_text="Enter a date between now and 4 weeks (default 3).")
 
     def clean_renewal_date(self):
         data = self.cleaned_data['renewal_date']
+        validate_due_date(data)
 
-        # Check if a date is not in the past.
-        if data < datetime.date.today():
-            raise ValidationError(_('Invalid date - renewal in past'))
-        
-        # Check if a date is in the allowed range (4 or less weeks from today)
-        if data > datetime.date.today() + datetime.timedelta(weeks=4):
-            raise ValidationError(_('Invalid date - renewal more than 4 weeks ahead'))
-        
         # Always remember to return cleaned data
-        return data
\ No newline at end of file
+        return data
+
+class CheckoutForm(forms.Form):
+    borrower = forms.CharField(label=_('Borrower'), help_text=_('Username of the borrower.'))
+    due_back = forms.DateField(help_text="Enter a date between now and 4 weeks (default 3).")
+
+    def clean_borrower(self):
+        try:
+            return User.objects.get(username=self.cleaned_data['borrower'])
+        except User.DoesNotExist:
+            raise ValidationError(_('Unknown user'))
+
+    def clean_due_back(self):
+        data = self.cleaned_data['due_back']
+        validate_due_date(data)
+        return data
+
+class UUIDListField(forms.Field):
+    """ A list of UUIDs, e.g. the ids of the copies ticked in a list. """
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        try:
+            return [uuid.UUID(item) for item in value or []]
+        except ValueError:
+            raise ValidationError(_('Invalid selection'))
+
+class BulkLoanForm(forms.Form):
+    """ Renews or returns the loans of the selected copies (see loans.renew_many() and return_many()). """
+    copies = UUIDListField(error_messages={'required': _('Select at least one book.')})
+    action = forms.ChoiceField(choices=[('renew', _('Renew')), ('return', _('Return'))])
+    renewal_date = forms.DateField(required=False, help_text="Enter a date between now and 4 weeks (default 3).")
+
+    def clean_renewal_date(self):
+        data = self.cleaned_data['renewal_date']
+        if data is not None:
+            validate_due_date(data)
+        return data
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('action') == 'renew' and not cleaned_data.get('renewal_date') and 'renewal_date' not in self.errors:
+            self.add_error('renewal_date', _('Enter the new due date.'))
+        return cleaned_data
+
+class CachedChoiceIterator(ModelChoiceIterator):
+    """ Lists the field's choices from its cached_objects() instead of a query. """
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        for obj in self.field.cached_objects():
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(self.field.cached_objects()) + (1 if self.field.empty_label is not None else 0)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.cached_objects())
+
+# The submitted values are still checked against the database.
+
+class GenreChoiceField(forms.ModelMultipleChoiceField):
+    iterator = CachedChoiceIterator
+    cached_objects = staticmethod(get_genres)
+
+class LanguageChoiceField(forms.ModelChoiceField):
+    iterator = CachedChoiceIterator
+    cached_objects = staticmethod(get_languages)
+
+class BookForm(forms.ModelForm):
+    class Meta:
+        model = Book
+        fields = ['title', 'author', 'summary', 'isbn', 'genre', 'language']
+        field_classes = {
+            'genre': GenreChoiceField,
+            'language': LanguageChoiceField,
+        }
@@ -0,0 +1,281 @@
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django.db import transaction
+
+from catalog.counters import invalidate_index_counts
+from catalog.facets import rebuild_facet_counts
+from catalog.lookups import get_genres, get_languages, invalidate_genres, invalidate_languages
+from catalog.models import Author, Book, Genre, Language
+from catalog.search import update_search_index
+
+# Bulk catalog import, used by 'manage.py import_catalog'.
+#
+# Input records are plain dicts with the columns of the 'books' export
+# (catalog/export.py): title, isbn, summary, author_first_name,
+# author_last_name, language, plus an optional 'genres' (a list, or a string
+# separated by ';'). They are read from CSV, JSON Lines or MARC 21.
+#
+# Authors, genres and languages are resolved through in-memory maps loaded
+# once, and books are upserted on their unique ISBN with bulk_create(), one
+# transaction per batch. bulk_create() sends no signals, so the search index,
+# the index counters, the facet counts and the cached genres and languages
+# are updated here.
+
+class ImportRowError(ValueError):
+    pass
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    updated: int = 0
+    skipped: int = 0
+    errors: list = field(default_factory=list)
+
+    @property
+    def imported(self):
+        return self.created + self.updated
+
+# Readers. Each yields one record dict per book, or an ImportRowError in
+# place of a record it cannot decode (which is skipped like an invalid row).
+
+def read_csv(file):
+    yield from csv.DictReader(io.TextIOWrapper(file, encoding='utf-8', newline=''))
+
+def read_jsonl(file):
+    for line in io.TextIOWrapper(file, encoding='utf-8'):
+        if line.strip():
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                record = ImportRowError(f'invalid JSON: {e}')
+            yield record
+
+MARC_LANGUAGES = {
+    'eng': 'English', 'fre': 'French', 'ger': 'German', 'ita': 'Italian',
+    'jpn': 'Japanese', 'por': 'Portuguese', 'rus': 'Russian', 'spa': 'Spanish',
+}
+
+def _marc_subfields(data):
+    """ Splits a MARC data field (after its two indicators) into {code: [values]}. """
+    subfields = {}
+    for part in data[2:].split(b'\x1f')[1:]:
+        subfields.setdefault(part[:1].decode(), []).append(part[1:].decode('utf-8', 'replace').strip())
+    return subfields
+
+def _marc_value(fields, tag, code):
+    for data in fields.get(tag, []):
+        values = _marc_subfields(data).get(code)
+        if values:
+            return values[0]
+    return ''
+
+def read_marc(file):
+    """ Reads MARC 21 records in ISO 2709 (binary) form. """
+    while True:
+        leader = file.read(24)
+        if len(leader) < 24:
+            return
+        try:
+            length = int(leader[:5])
+        except ValueError:
+            # Without the record's length, the next record cannot be found.
+            yield ImportRowError('invalid MARC leader, the rest of the file was not read')
+            return
+        record = leader + file.read(length - 24)
+        try:
+            parsed = _parse_marc(record)
+        except ValueError as e:
+            parsed = ImportRowError(f'invalid MARC record: {e}')
+        yield parsed
+
+def _parse_marc(record):
+    """ The record dict of one MARC record (leader included). """
+    base_address = int(record[12:17])
+
+    fields = {}
+    directory = record[24:base_address - 1]
+    for entry in range(0, len(directory), 12):
+        tag = directory[entry:entry + 3].decode()
+        length = int(directory[entry + 3:entry + 7])
+        start = base_address + int(directory[entry + 7:entry + 12])
+        fields.setdefault(tag, []).append(record[start:start + length].rstrip(b'\x1e'))
+
+    last_name, _, first_name = _marc_value(fields, '100', 'a').rstrip(',.').partition(',')
+    language = _marc_value(fields, '041', 'a')
+    if not language and fields.get('008'):
+        language = fields['008'][0][35:38].decode('ascii', 'replace')
+
+    return {
+        'title': ' '.join(filter(None, [
+            _marc_value(fields, '245', 'a'), _marc_value(fields, '245', 'b'),
+        ])).rstrip(' /:;,.'),
+        'isbn': _marc_value(fields, '020', 'a').split(' ')[0].replace('-', ''),
+        'summary': _marc_value(fields, '520', 'a'),
+        'author_first_name': first_name.strip(),
+        'author_last_name': last_name.strip(),
+        'language': MARC_LANGUAGES.get(language.strip(), language.strip()),
+        'genres': [
+            _marc_subfields(data)['a'][0].rstrip('.')
+            for tag in ('650', '655') for data in fields.get(tag, [])
+            if _marc_subfields(data).get('a')
+        ],
+    }
+
+READERS = {
+    'csv': read_csv,
+    'jsonl': read_jsonl,
+    'marc': read_marc,
+}
+
+def _max_length(model, name):
+    return model._meta.get_field(name).max_length
+
+def clean_record(record):
+    """ Normalizes an input record, or raises ImportRowError. """
+    cleaned = {
+        name: str(record.get(name) or '').strip()
+        for name in ('title', 'isbn', 'summary', 'author_first_name', 'author_last_name', 'language')
+    }
+
+    genres = record.get('genres')
+    if isinstance(genres, str):
+        genres = genres.split(';')
+    elif genres is not None and not isinstance(genres, list):
+        raise ImportRowError('genres must be a list or a string')
+    # None (no 'genres' column) leaves the genres of an existing book alone.
+    cleaned['genres'] = None if genres is None else sorted({genre.strip() for genre in genres if genre.strip()})
+
+    for name, model, model_field in (
+        ('title', Book, 'title'), ('isbn', Book, 'isbn'),
+        ('author_first_name', Author, 'first_name'), ('author_last_name', Author, 'last_name'),
+        ('language', Language, 'language_name'),
+    ):
+        if len(cleaned[name]) > _max_length(model, model_field):
+            raise ImportRowError(f'{name} is too long')
+    for genre in cleaned['genres'] or []:
+        if len(genre) > _max_length(Genre, 'name'):
+            raise ImportRowError('genre name is too long')
+
+    if not cleaned['title']:
+        raise ImportRowError('missing title')
+    if not cleaned['isbn']:
+        raise ImportRowError('missing isbn')
+    return cleaned
+
+class CatalogImporter:
+    """
+    Imports records in batches of 'batch_size'. With 'dry_run', every batch
+    is rolled back, but the result still counts what would have happened.
+    'progress' is called with the running ImportResult after each batch.
+    """
+
+    def __init__(self, batch_size=1000, dry_run=False, progress=None):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.progress = progress
+
+        self.authors = {
+            (first_name, last_name): pk
+            for pk, first_name, last_name in Author.objects.values_list('pk', 'first_name', 'last_name')
+        }
+        self.genres = {genre.name: genre.pk for genre in get_genres()}
+        self.languages = {language.language_name: language.pk for language in get_languages()}
+
+    def run(self, records):
+        result = ImportResult()
+        records = iter(enumerate(records, start=1))
+
+        while batch := list(islice(records, self.batch_size)):
+            cleaned = {}
+            for line, record in batch:
+                try:
+                    if isinstance(record, ImportRowError):
+                        # A record the reader could not decode.
+                        raise record
+                    record = clean_record(record)
+                except (ImportRowError, AttributeError) as e:
+                    result.skipped += 1
+                    result.errors.append((line, str(e)))
+                    continue
+                # A repeated ISBN within a batch: the last record wins.
+                cleaned[record['isbn']] = record
+
+            # A dry run restores its lookup maps, since the rows it creates
+            # are rolled back.
+            maps = (dict(self.authors), dict(self.genres), dict(self.languages)) if self.dry_run else None
+            with transaction.atomic():
+                self._import_batch(list(cleaned.values()), result)
+                if self.dry_run:
+                    transaction.set_rollback(True)
+                    self.authors, self.genres, self.languages = maps
+
+            if self.progress:
+                self.progress(result)
+
+        if not self.dry_run:
+            rebuild_facet_counts()
+            invalidate_index_counts()
+            invalidate_genres()
+            invalidate_languages()
+        return result
+
+    def _resolve(self, lookup, model, keys, make):
+        """ Adds the missing 'keys' to 'lookup', creating them with one bulk_create(). """
+        missing = [key for key in dict.fromkeys(keys) if key not in lookup]
+        if missing:
+            for key, obj in zip(missing, model.objects.bulk_create([make(key) for key in missing])):
+                lookup[key] = obj.pk
+
+    def _import_batch(self, records, result):
+        if not records:
+            return
+
+        self._resolve(
+            self.authors, Author,
+            [(r['author_first_name'], r['author_last_name']) for r in records if r['author_last_name']],
+            lambda key: Author(first_name=key[0], last_name=key[1]),
+        )
+        self._resolve(self.languages, Language, [r['language'] for r in records if r['language']],
+                      lambda name: Language(language_name=name))
+        self._resolve(self.genres, Genre, [genre for r in records for genre in r['genres'] or []],
+                      lambda name: Genre(name=name))
+
+        isbns = [record['isbn'] for record in records]
+        existing = set(Book.objects.filter(isbn__in=isbns).values_list('isbn', flat=True))
+
+        Book.objects.bulk_create(
+            [
+                Book(
+                    title=record['title'],
+                    isbn=record['isbn'],
+                    summary=record['summary'],
+                    author_id=self.authors.get((record['author_first_name'], record['author_last_name'])),
+                    language_id=self.languages.get(record['language']),
+                )
+                for record in records
+            ],
+            update_conflicts=True,
+            unique_fields=['isbn'],
+            update_fields=['title', 'summary', 'author', 'language', 'updated'],
+        )
+        # Upserted rows do not get their pk back, so look them up by ISBN.
+        book_ids = dict(Book.objects.filter(isbn__in=isbns).values_list('isbn', 'pk'))
+
+        # Genres are replaced, for the records that list them.
+        with_genres = [record for record in records if record['genres'] is not None]
+        through = Book.genre.through
+        through.objects.filter(book_id__in=[book_ids[record['isbn']] for record in with_genres]).delete()
+        through.objects.bulk_create([
+            through(book_id=book_ids[record['isbn']], genre_id=self.genres[genre])
+            for record in with_genres
+            for genre in record['genres']
+        ])
+
+        update_search_index(book_ids.values())
+
+        result.updated += len(existing)
+        result.created += len(records) - len(existing)
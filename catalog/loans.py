@@ -0,0 +1,268 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from catalog.cache import bump_book_copies_version
+from catalog.counters import invalidate_index_counts, recount_book_counters
+from catalog.models import Book, BookInstance, Reservation
+
+# Lending: checking copies out, returning them and reserving them.
+#
+# Each operation runs in one transaction that first locks the row of the copy
+# it changes (SELECT ... FOR UPDATE), then checks the copy's status as locked
+# and saves it. A concurrent operation on the same copy waits for the lock
+# and then sees the new status, so a copy cannot be lent twice. reserve()
+# picks an available copy of a book with SKIP LOCKED: copies another
+# transaction is lending or reserving are passed over instead of waited for.
+#
+# SQLite has no row locks (select_for_update() does nothing), but allows one
+# writing transaction at a time: a concurrent one fails with "database is
+# locked" rather than lending a copy twice.
+#
+# Borrowers who find no available copy join the book's queue of
+# Reservations, in the same transaction (reserve()). A copy that is returned
+# (return_()), or whose hold expires (release_expired_holds()), is held for
+# the head of the queue; so is any copy reserve() finds available while
+# others are waiting, e.g. a new copy. The head is read from the (book,
+# created, id) index, so finding it costs one index seek however long the
+# queue is. It is taken with SKIP LOCKED, so copies returned at the same time
+# go to different borrowers. Each of these locks the book's row before it
+# reads the queue, so a borrower cannot join the queue while a copy is
+# being made available: one waits for the other and sees its result.
+#
+# The copies are saved with save(), so the receivers in catalog/signals.py
+# update the copy counters and caches.
+
+LOAN_PERIOD = datetime.timedelta(weeks=3)
+# How long a reserved copy is held for its borrower.
+HOLD_PERIOD = datetime.timedelta(weeks=1)
+
+LOAN_FIELDS = ['status', 'borrower', 'due_back', 'updated']
+
+class LoanError(Exception):
+    """ The copy (or book) is not in a state that allows the operation. """
+
+def _lock(instance):
+    """ Reloads the copy 'instance', locking its row until the transaction ends. """
+    try:
+        return BookInstance.objects.select_for_update().get(pk=instance.pk)
+    except BookInstance.DoesNotExist:
+        raise LoanError(_('This copy no longer exists.'))
+
+def _lock_user(user):
+    """
+    Locks the row of 'user', so their concurrent reservations run one at a
+    time and cannot both pass the checks that follow.
+    """
+    list(User.objects.select_for_update().filter(pk=user.pk).values_list('pk'))
+
+def _lock_books(book_ids):
+    """ Locks the rows of the books 'book_ids' (see above). """
+    list(Book.objects.select_for_update().filter(pk__in=book_ids).order_by('pk').values_list('pk'))
+
+def _hold(copy, borrower_id):
+    copy.status = 'r'
+    copy.borrower_id = borrower_id
+    copy.due_back = datetime.date.today() + HOLD_PERIOD
+    copy.save(update_fields=LOAN_FIELDS)
+
+def next_in_queue(book_id):
+    """ Returns the first Reservation of the book's queue, locked, or None. """
+    return (
+        Reservation.objects.select_for_update(skip_locked=True)
+        .filter(book_id=book_id)
+        .order_by('created', 'id')
+        .first()
+    )
+
+def checkout(instance, user, due_back=None):
+    """
+    Lends the copy 'instance' to 'user' until 'due_back' (LOAN_PERIOD from
+    today by default). The copy must be available, or reserved for 'user'.
+    Returns the copy as saved.
+    """
+    with transaction.atomic():
+        copy = _lock(instance)
+        if not (copy.status == 'a' or copy.status == 'r' and copy.borrower_id == user.pk):
+            raise LoanError(_('This copy is not available.'))
+
+        copy.status = 'o'
+        copy.borrower = user
+        copy.due_back = due_back or datetime.date.today() + LOAN_PERIOD
+        copy.save(update_fields=LOAN_FIELDS)
+        # They no longer wait for the book.
+        Reservation.objects.filter(book_id=copy.book_id, borrower=user).delete()
+    return copy
+
+def return_(instance):
+    """
+    Takes back the copy 'instance'. It is held for the first borrower in the
+    book's queue, or becomes available. Returns the copy as saved.
+    """
+    with transaction.atomic():
+        copy = _lock(instance)
+        if copy.status != 'o':
+            raise LoanError(_('This copy is not on loan.'))
+        _release(copy)
+    return copy
+
+def _release(copy):
+    """
+    Holds the locked 'copy' for the first borrower in its book's queue, or
+    makes it available.
+    """
+    _lock_books([copy.book_id])
+    reservation = next_in_queue(copy.book_id)
+    if reservation is not None:
+        _hold(copy, reservation.borrower_id)
+        reservation.delete()
+        return
+
+    copy.status = 'a'
+    copy.borrower = None
+    copy.due_back = None
+    copy.save(update_fields=LOAN_FIELDS)
+
+def _available_copy(book_id):
+    """ Returns an available copy of the book, locked, or None. """
+    return (
+        BookInstance.objects.select_for_update(skip_locked=True)
+        .filter(book_id=book_id, status__exact='a')
+        .order_by('pk')
+        .first()
+    )
+
+def reserve(book, user):
+    """
+    Holds an available copy of 'book' for 'user' (see HOLD_PERIOD), who may
+    then check it out, and returns the copy. Available copies go to the
+    borrowers already waiting first: when none is left, 'user' joins the
+    end of the book's queue, and their Reservation is returned.
+    """
+    with transaction.atomic():
+        _lock_user(user)
+        if BookInstance.objects.filter(book=book, borrower=user, status__in=['o', 'r']).exists():
+            raise LoanError(_('You already have a copy of this book.'))
+
+        _lock_books([book.pk])
+        while (reservation := next_in_queue(book.pk)) is not None:
+            copy = _available_copy(book.pk)
+            if copy is None:
+                break
+            _hold(copy, reservation.borrower_id)
+            reservation.delete()
+            if reservation.borrower_id == user.pk:
+                return copy
+
+        copy = _available_copy(book.pk) if reservation is None else None
+        if copy is None:
+            reservation, _created = Reservation.objects.get_or_create(book=book, borrower=user)
+            return reservation
+
+        _hold(copy, user.pk)
+    return copy
+
+def release_expired_holds(today=None):
+    """
+    Passes the copies held past their HOLD_PERIOD (due back before 'today')
+    to the next borrower in their book's queue, or makes them available.
+    Returns the number of holds released.
+    """
+    today = today or datetime.date.today()
+    expired = BookInstance.objects.filter(status__exact='r', due_back__lt=today)
+
+    released = 0
+    for pk in expired.order_by('due_back', 'id').values_list('pk', flat=True).iterator():
+        with transaction.atomic():
+            # Checked out (or released by another run) since it was read: skipped.
+            copy = expired.select_for_update(skip_locked=True).filter(pk=pk).first()
+            if copy is not None:
+                _release(copy)
+                released += 1
+    return released
+
+def queue_position(reservation):
+    """ The position of 'reservation' in its book's queue (1 for the head). """
+    ahead = Reservation.objects.filter(book_id=reservation.book_id).filter(
+        Q(created__lt=reservation.created) | Q(created=reservation.created, id__lt=reservation.id)
+    )
+    return ahead.count() + 1
+
+# Bulk renewals and returns, for librarians handling many loans at once
+# (e.g. a class). Each locks the selected copies with one SELECT, reports the
+# ones it cannot change and changes the rest with one UPDATE ... WHERE id IN
+# (...), whose WHERE repeats the checks. update() sends no signals, so the
+# copy counters and caches are updated here.
+
+def _lock_many(ids):
+    """ Locks the copies 'ids'; returns them by id and the failures for the missing ones. """
+    copies = {
+        copy.pk: copy
+        for copy in BookInstance.objects.select_for_update().filter(pk__in=ids).only('id', 'book', 'status', 'due_back')
+    }
+    failures = {pk: _('This copy no longer exists.') for pk in ids if pk not in copies}
+    return copies, failures
+
+def _copies_changed(book_ids):
+    for book_id in book_ids - {None}:
+        bump_book_copies_version(book_id)
+
+def renew_many(ids, due_back):
+    """
+    Renews the loans of the copies 'ids' until 'due_back' (a date already
+    checked with validate_due_date()). A loan already due later is left alone.
+    Returns the ids renewed, and the others' ids with the reason.
+    """
+    with transaction.atomic():
+        copies, failures = _lock_many(ids)
+        for pk, copy in copies.items():
+            if copy.status != 'o':
+                failures[pk] = _('This copy is not on loan.')
+            elif copy.due_back and copy.due_back > due_back:
+                failures[pk] = _('This loan is already due later.')
+
+        renewed = [pk for pk in copies if pk not in failures]
+        BookInstance.objects.filter(
+            Q(due_back__isnull=True) | Q(due_back__lte=due_back), pk__in=renewed, status__exact='o',
+        ).update(due_back=due_back, updated=timezone.now())
+
+        _copies_changed({copies[pk].book_id for pk in renewed})
+    return renewed, failures
+
+def return_many(ids):
+    """
+    Takes back the copies 'ids'. Copies of books with a queue are held for
+    it, one by one with return_(); the others become available with one
+    UPDATE. Returns the ids returned, and the others' ids with the reason.
+    """
+    with transaction.atomic():
+        copies, failures = _lock_many(ids)
+        for pk, copy in copies.items():
+            if copy.status != 'o':
+                failures[pk] = _('This copy is not on loan.')
+
+        returned = [pk for pk in copies if pk not in failures]
+        # Nobody joins the queues of these books until the copies are returned.
+        _lock_books({copies[pk].book_id for pk in returned} - {None})
+        queued_books = set(
+            Reservation.objects.filter(book__in={copies[pk].book_id for pk in returned})
+            .values_list('book', flat=True).distinct()
+        )
+        for pk in returned:
+            if copies[pk].book_id in queued_books:
+                return_(copies[pk])
+
+        unqueued = [pk for pk in returned if copies[pk].book_id not in queued_books]
+        BookInstance.objects.filter(pk__in=unqueued, status__exact='o').update(
+            status='a', borrower=None, due_back=None, updated=timezone.now(),
+        )
+        book_ids = {copies[pk].book_id for pk in unqueued}
+        recount_book_counters(Book.objects.filter(pk__in=book_ids))
+
+        invalidate_index_counts()
+        _copies_changed(book_ids)
+    return returned, failures
@@ -0,0 +1,24 @@
+from catalog.cache import bump_version, get_cached
+from catalog.models import Genre, Language
+
+# The Genre and Language tables are tiny and rarely change, but every book
+# form lists them. They are read through the two-tier cache (catalog/cache.py)
+# and invalidated by the receivers in catalog/signals.py. Bulk operations,
+# which send no signals, should call the invalidate_*() functions.
+
+GENRES = 'genres'
+LANGUAGES = 'languages'
+
+def get_genres() -> list:
+    """ Returns every Genre, by name. Treat the list as read-only. """
+    return get_cached(GENRES, lambda: list(Genre.objects.order_by('name')))
+
+def get_languages() -> list:
+    """ Returns every Language, by name. Treat the list as read-only. """
+    return get_cached(LANGUAGES, lambda: list(Language.objects.order_by('language_name')))
+
+def invalidate_genres():
+    bump_version(GENRES)
+
+def invalidate_languages():
+    bump_version(LANGUAGES)
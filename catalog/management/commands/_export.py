@@ -0,0 +1,26 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from catalog.export import FORMATS, encode, render
+
+class ExportCommand(BaseCommand):
+    """ Shared by the export_* commands. Set 'export_name' (see catalog/export.py). """
+    export_name = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--output', '-o', help='File to write to (default: standard output).')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip.')
+
+    def handle(self, *args, **options):
+        chunks = encode(render(self.export_name, options['format']), compress=options['gzip'])
+
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+
+from catalog.benchmarks import BENCHMARKS
+from catalog.cache import local_cache
+
+# What a benchmark caches describes data that is rolled back, so it runs
+# with a throwaway cache rather than the shared one (whose values and
+# version stamps the site would otherwise keep serving).
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog-benchmark',
+    },
+}
+
+class Rollback(Exception):
+    """ Raised to throw away the data a benchmark created. """
+
+class Command(BaseCommand):
+    help = 'Runs a catalog benchmark against synthetic data, then rolls the data back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(BENCHMARKS))
+        parser.add_argument('--scale', type=int, default=1000, help='Number of books to create.')
+        parser.add_argument('--repeat', type=int, default=50, help='Number of timed calls per case.')
+
+    def handle(self, *args, **options):
+        if options['scale'] < 1 or options['repeat'] < 1:
+            raise CommandError('--scale and --repeat must be positive.')
+
+        try:
+            # The test client's 'testserver' host must get past ALLOWED_HOSTS.
+            with override_settings(ALLOWED_HOSTS=['testserver'], CACHES=BENCHMARK_CACHES), transaction.atomic():
+                results = BENCHMARKS[options['name']](options['scale'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            local_cache.clear()
+
+        for result in results:
+            self.stdout.write(
+                f"{result['label']:<45} {result['queries']:>8.1f} queries"
+                f" {result['median_ms']:>9.2f} ms median {result['p95_ms']:>9.2f} ms p95"
+            )
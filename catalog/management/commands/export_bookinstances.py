@@ -0,0 +1,5 @@
+from catalog.management.commands._export import ExportCommand
+
+class Command(ExportCommand):
+    help = 'Streams every book copy (with its book and borrower) as CSV or JSON Lines.'
+    export_name = 'bookinstances'
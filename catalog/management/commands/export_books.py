@@ -0,0 +1,5 @@
+from catalog.management.commands._export import ExportCommand
+
+class Command(ExportCommand):
+    help = 'Streams every book (with its author and language) as CSV or JSON Lines.'
+    export_name = 'books'
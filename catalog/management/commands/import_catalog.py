@@ -0,0 +1,62 @@
+import gzip
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.importers import READERS, CatalogImporter
+
+class Command(BaseCommand):
+    help = (
+        'Imports books from a CSV, JSON Lines or MARC 21 file, creating or updating them by ISBN. '
+        'Takes the columns of the export_books command, plus an optional ";"-separated "genres".'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import ('-' for standard input, '.gz' files are decompressed).")
+        parser.add_argument('--format', choices=sorted(READERS), help='Input format (default: from the file extension).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Books per transaction.')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and count, but roll everything back.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or self.guess_format(path)
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        start = time.monotonic()
+
+        def progress(result):
+            elapsed = time.monotonic() - start
+            self.stderr.write(
+                f'{result.imported} books ({result.created} new, {result.updated} updated, '
+                f'{result.skipped} skipped), {result.imported / elapsed * 60:.0f} books/minute'
+            )
+
+        importer = CatalogImporter(batch_size=options['batch_size'], dry_run=options['dry_run'], progress=progress)
+
+        if path == '-':
+            result = importer.run(READERS[format](sys.stdin.buffer))
+        else:
+            try:
+                file = gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+            except OSError as e:
+                raise CommandError(e)
+            with file:
+                result = importer.run(READERS[format](file))
+
+        for line, error in result.errors:
+            self.stderr.write(f'Record {line} skipped: {error}')
+
+        summary = f'{result.created} books created, {result.updated} updated, {result.skipped} skipped.'
+        if options['dry_run']:
+            summary = 'Dry run, nothing was saved: ' + summary
+        self.stdout.write(self.style.SUCCESS(summary))
+
+    def guess_format(self, path):
+        extension = os.path.splitext(path[:-3] if path.endswith('.gz') else path)[1].lstrip('.').lower()
+        extension = {'mrc': 'marc', 'json': 'jsonl', 'ndjson': 'jsonl'}.get(extension, extension)
+        if extension not in READERS:
+            raise CommandError('Cannot tell the input format from the file name, use --format.')
+        return extension
@@ -0,0 +1,53 @@
+import math
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+class Command(BaseCommand):
+    help = (
+        'Sends concurrent GET requests to running servers and reports their throughput and latency, '
+        'e.g. to compare the WSGI and ASGI processes of the Procfile.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', help='URLs to load, one after another.')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per URL (default 500).')
+        parser.add_argument('--concurrency', type=int, default=20, help='Requests in flight (default 20).')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds before a request fails (default 30).')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive.')
+
+        for url in options['urls']:
+            self.load(url, options['requests'], options['concurrency'], options['timeout'])
+
+    def load(self, url, requests, concurrency, timeout):
+        def fetch(_):
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=timeout) as response:
+                    response.read()
+                    ok = response.status == 200
+            except (urllib.error.URLError, OSError):
+                ok = False
+            return ok, time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(fetch, range(requests)))
+        elapsed = time.perf_counter() - start
+
+        timings = sorted(seconds * 1000 for ok, seconds in results if ok)
+        errors = requests - len(timings)
+        if not timings:
+            raise CommandError(f'Every request to {url} failed.')
+
+        self.stdout.write(
+            f'{url}: {requests / elapsed:.0f} req/s, {statistics.median(timings):.1f} ms median, '
+            f'{timings[math.ceil(len(timings) * 0.95) - 1]:.1f} ms p95, {errors} errors'
+        )
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from catalog.loans import release_expired_holds
+from catalog.overdue import process_overdue
+
+class Command(BaseCommand):
+    help = (
+        'Sends each borrower one notice for their overdue loans, and marks the loans as noticed '
+        '(see catalog/overdue.py). Passes the copies held past their hold period to the next borrower '
+        'waiting, or makes them available (see catalog/loans.py). Safe to run again or at the same time.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Borrowers notified per transaction (default 100).')
+        parser.add_argument(
+            '--every', type=float, metavar='SECONDS',
+            help='Keep running, processing the overdue loans every SECONDS (for a scheduler process).',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        while True:
+            noticed, sent = process_overdue(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Noticed {noticed} overdue loans, sent {sent} notices.'))
+            released = release_expired_holds()
+            self.stdout.write(self.style.SUCCESS(f'Released {released} expired holds.'))
+
+            if not options['every']:
+                break
+            time.sleep(options['every'])
+            # As after a request: drop connections that are too old or broken.
+            close_old_connections()
@@ -0,0 +1,37 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+class Command(BaseCommand):
+    help = (
+        'Deletes the expired sessions in chunks, so that no single DELETE locks the '
+        'session table for long (unlike clearsessions).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Sessions deleted per query (default 1000).')
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to pause between chunks (default 0).')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        deleted = 0
+
+        while True:
+            # The keys first: DELETE ... LIMIT is not portable.
+            keys = list(
+                Session.objects.filter(expire_date__lt=now)
+                .values_list('session_key', flat=True)[:options['chunk_size']]
+            )
+            if not keys:
+                break
+
+            Session.objects.filter(session_key__in=keys).delete()
+            deleted += len(keys)
+            if options['verbosity'] > 1:
+                self.stderr.write(f'{deleted} sessions deleted...')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired sessions.'))
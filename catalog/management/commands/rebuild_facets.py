@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from catalog.facets import rebuild_facet_counts
+
+class Command(BaseCommand):
+    help = 'Recounts the facets of the book list (genre, language, author, availability), e.g. after a bulk load.'
+
+    def handle(self, *args, **options):
+        rebuild_facet_counts()
+        self.stdout.write(self.style.SUCCESS('Facet counts rebuilt.'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from catalog.search import rebuild_search_index
+
+class Command(BaseCommand):
+    help = 'Recomputes the full-text search index of every book (e.g. after a bulk load).'
+
+    def handle(self, *args, **options):
+        rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
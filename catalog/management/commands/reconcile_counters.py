@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from catalog.counters import find_counter_drift, recount_book_counters
+from catalog.models import Book
+
+class Command(BaseCommand):
+    help = (
+        "Finds books whose copy counters (copies_total, copies_available, copies_on_loan) "
+        "do not match their copies, and recomputes them, in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Books checked per batch (default 1000).')
+        parser.add_argument('--dry-run', action='store_true', help='Only report the drifted books.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        checked = drifted = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                Book.objects.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', flat=True)[:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1]
+            checked += len(batch)
+
+            # One short transaction per batch.
+            with transaction.atomic():
+                book_ids = find_counter_drift(Book.objects.filter(pk__in=batch))
+                if book_ids and not options['dry_run']:
+                    recount_book_counters(Book.objects.filter(pk__in=book_ids))
+            drifted += len(book_ids)
+
+            if options['verbosity'] > 1 and book_ids:
+                self.stderr.write(f"Drifted: {', '.join(map(str, book_ids))}")
+
+        action = 'found' if options['dry_run'] else 'fixed'
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} books, {action} {drifted} with drifted counters.'))
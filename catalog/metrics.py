@@ -0,0 +1,103 @@
+import bisect
+import threading
+
+# In-process metrics, aggregated per view (URL name) into histograms and
+# exposed in the Prometheus text format at /catalog/metrics. Filled in by
+# catalog.middleware.MetricsMiddleware. Each gunicorn worker keeps its own.
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+class Histogram:
+    """ A Prometheus-style histogram (cumulative buckets, sum and count). """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last one is +Inf.
+        self.sum = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self):
+        """ Returns ([(upper bound, cumulative count), ...], sum, count). """
+        with self.lock:
+            counts, total = list(self.counts), self.sum
+
+        cumulative, running = [], 0
+        for bound, count in zip((*self.buckets, float('inf')), counts):
+            running += count
+            cumulative.append((bound, running))
+        return cumulative, total, running
+
+# name: (type, help text, buckets)
+METRICS = {
+    'catalog_requests_total': ('counter', 'Requests, sampled or not.', None),
+    'catalog_request_duration_seconds': ('histogram', 'Request latency (sampled).', SECONDS_BUCKETS),
+    'catalog_db_queries': ('histogram', 'Database queries per request (sampled).', QUERY_COUNT_BUCKETS),
+    'catalog_db_duration_seconds': ('histogram', 'Database time per request (sampled).', SECONDS_BUCKETS),
+    'catalog_template_render_seconds': (
+        'histogram', 'Template rendering time per request (sampled, TemplateResponse views).', SECONDS_BUCKETS,
+    ),
+}
+
+_series = {}
+_counters = {}
+_lock = threading.Lock()
+
+def observe(name, view, value):
+    key = (name, view)
+    histogram = _series.get(key)
+    if histogram is None:
+        with _lock:
+            histogram = _series.setdefault(key, Histogram(METRICS[name][2]))
+    histogram.observe(value)
+
+def increment(name, view):
+    with _lock:
+        _counters[(name, view)] = _counters.get((name, view), 0) + 1
+
+def reset():
+    """ Drops every recorded value (for tests). """
+    with _lock:
+        _series.clear()
+        _counters.clear()
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _number(value):
+    return '+Inf' if value == float('inf') else repr(value)
+
+def render_prometheus():
+    """ Returns every metric in the Prometheus text exposition format (0.0.4). """
+    with _lock:
+        series = sorted(_series.items())
+        counters = sorted(_counters.items())
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+        if kind == 'counter':
+            for (counter_name, view), value in counters:
+                if counter_name == name:
+                    lines.append(f'{name}{{view="{_label(view)}"}} {value}')
+            continue
+
+        for (series_name, view), histogram in series:
+            if series_name != name:
+                continue
+            cumulative, total, count = histogram.snapshot()
+            view = _label(view)
+            for bound, bucket_count in cumulative:
+                lines.append(f'{name}_bucket{{view="{view}",le="{_number(bound)}"}} {bucket_count}')
+            lines.append(f'{name}_sum{{view="{view}"}} {_number(total)}')
+            lines.append(f'{name}_count{{view="{view}"}} {count}')
+
+    return '\n'.join(lines) + '\n'
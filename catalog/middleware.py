@@ -0,0 +1,177 @@
+import random
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from catalog import metrics, routers
+
+class MetricsMiddleware:
+    """
+    Records per view (URL name) latency, database query count and time, and
+    template rendering time into catalog.metrics.
+
+    Only a sample of the requests (settings.CATALOG_METRICS_SAMPLE_RATE) is
+    instrumented, which keeps the overhead negligible; every request is
+    still counted in 'catalog_requests_total'.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'CATALOG_METRICS_SAMPLE_RATE', 0.1)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if random.random() >= self.sample_rate:
+            response = self.get_response(request)
+            metrics.increment('catalog_requests_total', self.view_name(request))
+            return response
+
+        db_stats = {'queries': 0, 'seconds': 0.0}
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            self.wrap_connections(stack, db_stats)
+            response = self.get_response(request)
+        self.record(request, time.perf_counter() - start, db_stats)
+        return response
+
+    async def __acall__(self, request):
+        if random.random() >= self.sample_rate:
+            response = await self.get_response(request)
+            metrics.increment('catalog_requests_total', self.view_name(request))
+            return response
+
+        # The queries of an async request run in a thread of its own (see
+        # sync_to_async()), on that thread's connections, so they are wrapped
+        # from there.
+        db_stats = {'queries': 0, 'seconds': 0.0}
+        start = time.perf_counter()
+        stack = ExitStack()
+        await sync_to_async(self.wrap_connections)(stack, db_stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self.record(request, time.perf_counter() - start, db_stats)
+        return response
+
+    @staticmethod
+    def wrap_connections(stack, db_stats):
+        """ Counts and times the queries run on this thread's connections into 'db_stats'. """
+        def record_query(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                db_stats['queries'] += 1
+                db_stats['seconds'] += time.perf_counter() - start
+
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(record_query))
+
+    def record(self, request, duration, db_stats):
+        view = self.view_name(request)
+        metrics.increment('catalog_requests_total', view)
+        metrics.observe('catalog_request_duration_seconds', view, duration)
+        metrics.observe('catalog_db_queries', view, db_stats['queries'])
+        metrics.observe('catalog_db_duration_seconds', view, db_stats['seconds'])
+        if hasattr(request, '_metrics_render_seconds'):
+            metrics.observe('catalog_template_render_seconds', view, request._metrics_render_seconds)
+
+    def process_template_response(self, request, response):
+        # Called just before a TemplateResponse is rendered: time the rendering.
+        start = time.perf_counter()
+
+        def rendered(response):
+            request._metrics_render_seconds = time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    @staticmethod
+    def view_name(request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return 'unresolved'
+        return match.view_name or match._func_path
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise's middleware, usable without a thread switch under ASGI.
+
+    WhiteNoise 6.5 only has a sync middleware, which makes Django run every
+    request of the async views through a thread. This one serves the static
+    files the same way and hands other requests straight on.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+class ReplicaPinningMiddleware:
+    """
+    Sends the reads of requests other than GET and HEAD, and of the requests
+    of a client in the CATALOG_REPLICA_PIN_SECONDS after it wrote, to the
+    primary database (see catalog/routers.py). A cookie marks the clients
+    that have just written. Not used without read replicas.
+    """
+    cookie_name = 'primary_pin'
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'CATALOG_READ_REPLICAS', None):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.pin_seconds = settings.CATALOG_REPLICA_PIN_SECONDS
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = self.start(request)
+        return self.finish(state, self.get_response(request))
+
+    async def __acall__(self, request):
+        state = self.start(request)
+        return self.finish(state, await self.get_response(request))
+
+    def start(self, request):
+        return routers.start_request(
+            pinned=request.method not in ('GET', 'HEAD') or self.cookie_name in request.COOKIES,
+        )
+
+    def finish(self, state, response):
+        if state.wrote:
+            response.set_cookie(self.cookie_name, '1', max_age=self.pin_seconds, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.3 on 2026-10-16 22:50
+
+from django.db import migrations, models
+
+
+# Title search uses 'title__icontains', which Django compiles to
+# UPPER("title") LIKE UPPER(%s) on PostgreSQL, so the trigram index is on
+# UPPER(title). Other databases (SQLite in development) are left alone.
+
+def create_title_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS book_title_trgm_idx '
+        'ON catalog_book USING gin (UPPER(title) gin_trgm_ops)'
+    )
+
+def drop_title_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS book_title_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0011_alter_author_date_of_death'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['last_name', 'first_name', 'id'], name='author_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['title', 'id'], name='book_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(fields=['status', 'due_back', 'id'], name='bookinstance_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(fields=['borrower', 'status', 'due_back', 'id'], name='bookinstance_borrower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(condition=models.Q(('status', 'o')), fields=['due_back', 'id'], name='bookinstance_on_loan_idx'),
+        ),
+        migrations.RunPython(create_title_trigram_index, drop_title_trigram_index),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 4.2.3 on 2026-10-16 22:52
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# PostgreSQL: a GIN index on the stored search vector.
+# SQLite: an FTS5 table standing in for it (rowid = book id).
+# Both are filled from the existing books; catalog/search.py keeps them up to date.
+
+POSTGRESQL_FILL = '''
+    UPDATE catalog_book book SET search_vector =
+        setweight(to_tsvector('english', book.title), 'A')
+        || setweight(to_tsvector('english', COALESCE(
+            (SELECT first_name || ' ' || last_name FROM catalog_author WHERE id = book.author_id), ''
+        )), 'B')
+        || setweight(to_tsvector('english', COALESCE(
+            (SELECT string_agg(genre.name, ' ') FROM catalog_book_genre book_genre
+             JOIN catalog_genre genre ON genre.id = book_genre.genre_id
+             WHERE book_genre.book_id = book.id), ''
+        )), 'B')
+        || setweight(to_tsvector('english', book.summary), 'C')
+'''
+
+SQLITE_FILL = '''
+    INSERT INTO catalog_book_fts (rowid, title, summary, author, genre)
+    SELECT book.id, book.title, book.summary,
+           COALESCE(author.first_name || ' ' || author.last_name, ''),
+           COALESCE((SELECT group_concat(genre.name, ' ')
+                     FROM catalog_book_genre book_genre
+                     JOIN catalog_genre genre ON genre.id = book_genre.genre_id
+                     WHERE book_genre.book_id = book.id), '')
+    FROM catalog_book book
+    LEFT JOIN catalog_author author ON author.id = book.author_id
+'''
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS book_search_vector_idx ON catalog_book USING gin (search_vector)'
+        )
+        schema_editor.execute(POSTGRESQL_FILL)
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS catalog_book_fts '
+            "USING fts5(title, summary, author, genre, tokenize = 'porter unicode61')"
+        )
+        schema_editor.execute(SQLITE_FILL)
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS book_search_vector_idx')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS catalog_book_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0012_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
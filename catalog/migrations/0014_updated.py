@@ -0,0 +1,28 @@
+# Generated by Django 4.2.3 on 2026-10-16 22:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_book_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='bookinstance',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
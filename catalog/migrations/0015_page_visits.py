@@ -0,0 +1,29 @@
+# Generated by Django 4.2.3 on 2026-10-16 23:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0014_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageVisits',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page', models.CharField(max_length=100)),
+                ('date', models.DateField()),
+                ('count', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'page visits',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='pagevisits',
+            constraint=models.UniqueConstraint(fields=('page', 'date'), name='pagevisits_page_date_unique'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.3 on 2026-10-16 23:25
+
+from django.db import migrations, models
+
+
+# Fills the new counters from the existing copies.
+FILL = '''
+    UPDATE catalog_book SET
+        copies_total = (SELECT COUNT(*) FROM catalog_bookinstance copy
+                        WHERE copy.book_id = catalog_book.id),
+        copies_available = (SELECT COUNT(*) FROM catalog_bookinstance copy
+                            WHERE copy.book_id = catalog_book.id AND copy.status = 'a'),
+        copies_on_loan = (SELECT COUNT(*) FROM catalog_bookinstance copy
+                          WHERE copy.book_id = catalog_book.id AND copy.status = 'o')
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0015_page_visits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='copies_available',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_on_loan',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(FILL, migrations.RunSQL.noop),
+    ]
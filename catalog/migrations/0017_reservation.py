@@ -0,0 +1,32 @@
+# Generated by Django 4.2.3 on 2026-10-16 23:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('catalog', '0016_book_copy_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('book', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='catalog.book')),
+                ('borrower', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['book', 'created', 'id'], name='reservation_queue_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='reservation',
+            constraint=models.UniqueConstraint(fields=('book', 'borrower'), name='reservation_book_borrower_unique'),
+        ),
+    ]
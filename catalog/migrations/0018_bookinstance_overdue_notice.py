@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-16 23:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0017_reservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookinstance',
+            name='overdue_notice',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+    ]
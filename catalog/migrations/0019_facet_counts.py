@@ -0,0 +1,44 @@
+# Generated by Django 4.2.3 on 2026-10-16 23:56
+
+from django.db import migrations, models
+
+
+# Counts the existing books (see catalog/facets.py).
+FILL = '''
+    INSERT INTO catalog_facetcount (facet, value, books)
+    SELECT 'genre', genre_id, COUNT(*) FROM catalog_book_genre GROUP BY genre_id
+    UNION ALL
+    SELECT 'language', language_id, COUNT(*) FROM catalog_book
+    WHERE language_id IS NOT NULL GROUP BY language_id
+    UNION ALL
+    SELECT 'author', author_id, COUNT(*) FROM catalog_book
+    WHERE author_id IS NOT NULL GROUP BY author_id
+    UNION ALL
+    SELECT 'available', 1, COUNT(*) FROM catalog_book WHERE copies_available > 0
+'''
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0018_bookinstance_overdue_notice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=20)),
+                ('value', models.BigIntegerField()),
+                ('books', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['facet', '-books', 'value'], name='facetcount_top_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='facetcount',
+            constraint=models.UniqueConstraint(fields=('facet', 'value'), name='facetcount_facet_value_unique'),
+        ),
+        migrations.RunSQL(FILL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.3 on 2026-10-17 00:07
+
+from django.db import migrations, models
+
+
+# The admin searches authors with 'last_name__icontains' and
+# 'first_name__icontains' (AuthorAdmin.search_fields), indexed like the book
+# titles in migration 0012. pg_trgm was created there.
+
+def create_name_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for column in ('last_name', 'first_name'):
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS author_{column}_trgm_idx '
+            f'ON catalog_author USING gin (UPPER({column}) gin_trgm_ops)'
+        )
+
+def drop_name_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for column in ('last_name', 'first_name'):
+        schema_editor.execute(f'DROP INDEX IF EXISTS author_{column}_trgm_idx')
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0019_facet_counts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(fields=['due_back', 'id'], name='bookinstance_due_idx'),
+        ),
+        migrations.RunPython(create_name_trigram_indexes, drop_name_trigram_indexes),
+    ]
@@ -1,3 +1,4 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.urls import reverse # for generating URLS by reversing the URL patterns.
 import uuid
@@ -32,6 +33,45 @@ class Book(models.Model):
 
     language = models.ForeignKey('Language', on_delete=models.SET_NULL, null=True)
 
+    # Full-text search document, only used on PostgreSQL (see catalog/search.py).
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # Last modification time (used for the ETags of the JSON API).
+    updated = models.DateTimeField(auto_now=True)
+
+    # Copy counts, kept up to date by the receivers in catalog/signals.py
+    # (see catalog/counters.py), so that showing availability needs no
+    # query on BookInstance.
+    copies_total = models.PositiveIntegerField(default=0, editable=False)
+    copies_available = models.PositiveIntegerField(default=0, editable=False)
+    copies_on_loan = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # BookListView pages through the books on (title, id).
+            models.Index(fields=['title', 'id'], name='book_title_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # See BookInstance.from_db().
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        """ Saves the book, without writing back the copy counters of an existing row. """
+        if update_fields is None and not force_insert and not self._state.adding:
+            # The counters loaded with the instance may be stale: the signal
+            # receivers update the row's own values with F() expressions.
+            from catalog.counters import COPY_COUNTERS
+            deferred = self.get_deferred_fields()
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in COPY_COUNTERS and field.attname not in deferred
+            ]
+        super().save(force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
+
     def __str__(self) -> str:
         return self.title
     
@@ -68,14 +108,41 @@ class BookInstance(models.Model):
         default='m', help_text='Book availability',
     )
 
+    updated = models.DateTimeField(auto_now=True)
+
+    # When the borrower was last sent an overdue notice for this copy
+    # (see catalog/overdue.py).
+    overdue_notice = models.DateField(null=True, blank=True, editable=False)
+
     class Meta:
         ordering = ['due_back']
+        indexes = [
+            # The trailing 'id' matches the (due_back, id) keyset pagination order.
+            models.Index(fields=['status', 'due_back', 'id'], name='bookinstance_status_due_idx'),
+            # LoanedBooksByUserListView.
+            models.Index(fields=['borrower', 'status', 'due_back', 'id'], name='bookinstance_borrower_idx'),
+            # AllLoanedBooksListView. Only the copies on loan are indexed.
+            models.Index(
+                fields=['due_back', 'id'], name='bookinstance_on_loan_idx',
+                condition=models.Q(status='o'),
+            ),
+            # The admin changelist (BookInstanceAdmin.ordering).
+            models.Index(fields=['due_back', 'id'], name='bookinstance_due_idx'),
+        ]
         permissions = (
             ("can_mark_returned", "Set book as returned"),
             ("can_mark_late", "Set book as late"),
             ("can_renew", "Set new due_back date"),
         )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the values as loaded, so signal receivers can tell what a
+        # save() changed (e.g. a copy moved to another book).
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def __str__(self) -> str:
         return f'{self.id} ({self.book.title})' # Python 3.6
         # return '{0} ({1})'.format(self.id, self.book.title) # For older Python versions.
@@ -85,6 +152,45 @@ class BookInstance(models.Model):
         """ Determines if the book is overdue based on due date and current date. """
         return bool(self.due_back and date.today() > self.due_back)
 
+class Reservation(models.Model):
+    """ A borrower waiting for a copy of a book (see catalog/loans.py). """
+    # Indexed by reservation_queue_idx.
+    book = models.ForeignKey('Book', on_delete=models.CASCADE, db_index=False)
+    borrower = models.ForeignKey(User, on_delete=models.CASCADE)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # The queue of a book, first come first served: the head is the
+            # first entry of the index for the book.
+            models.Index(fields=['book', 'created', 'id'], name='reservation_queue_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'borrower'], name='reservation_book_borrower_unique'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.borrower} ({self.book})'
+
+class FacetCount(models.Model):
+    """ The number of books with one value of a facet of the book list (see catalog/facets.py). """
+    facet = models.CharField(max_length=20)
+    # The id of the genre, language or author; 1 for 'available'.
+    value = models.BigIntegerField()
+    books = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['facet', 'value'], name='facetcount_facet_value_unique'),
+        ]
+        indexes = [
+            # The values with the most books first.
+            models.Index(fields=['facet', '-books', 'value'], name='facetcount_top_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.facet}={self.value}: {self.books}'
+
 class Author(models.Model):
     """ Model that represents an Author. """
     first_name = models.CharField(max_length=100)
@@ -92,8 +198,13 @@ class Author(models.Model):
     date_of_birth = models.DateField(null=True, blank=True, help_text="YYYY-MM-DD format")
     date_of_death = models.DateField('died', null=True, blank=True)
 
+    updated = models.DateTimeField(auto_now=True)
+
     class Meta:
         ordering = ['last_name', 'first_name']
+        indexes = [
+            models.Index(fields=['last_name', 'first_name', 'id'], name='author_name_idx'),
+        ]
 
     def get_absolute_url(self):
         return reverse('author-detail', args=[str(self.id)])
@@ -111,4 +222,19 @@ class Secret(models.Model):
     name = models.CharField(max_length=200, help_text="Dummy field, no use for this app")
 
     def __str__(self) -> str:
-        return self.name
\ No newline at end of file
+        return self.name
+
+class PageVisits(models.Model):
+    """ Daily visit totals of a page, written in batches by catalog/visits.py. """
+    page = models.CharField(max_length=100)
+    date = models.DateField()
+    count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'page visits'
+        constraints = [
+            models.UniqueConstraint(fields=['page', 'date'], name='pagevisits_page_date_unique'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.page} ({self.date}): {self.count}'
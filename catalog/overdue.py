@@ -0,0 +1,90 @@
+import datetime
+from collections import defaultdict
+
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.template.loader import render_to_string
+
+from catalog.models import BookInstance
+
+# Overdue loans.
+#
+# 'manage.py process_overdue' (the 'clock' process of the Procfile runs it
+# every hour) reads the loans due before today with one query, a range scan
+# of the partial index on the copies on loan (bookinstance_on_loan_idx). It
+# sends each borrower one notice listing all their overdue books, and records
+# the date in BookInstance.overdue_notice with one update() per batch of
+# borrowers.
+#
+# A loan gets one notice per due date: those noticed since they fell due are
+# skipped, so running again sends nothing twice, and a run that stopped half
+# way is finished by the next one. Each batch is sent and marked in one
+# transaction, which locks its loans (SKIP LOCKED), so two runs at once do
+# not notify the same loans either. A batch whose mail fails is rolled back
+# and retried by the next run.
+
+def overdue_loans(today=None):
+    """ The loans due before 'today' (one indexed range query). """
+    today = today or datetime.date.today()
+    return BookInstance.objects.filter(status__exact='o', due_back__lt=today)
+
+def pending_notices(today):
+    """ The overdue loans not noticed since they fell due. """
+    return overdue_loans(today).filter(Q(overdue_notice__isnull=True) | Q(overdue_notice__lt=F('due_back')))
+
+def build_notice(borrower, loans):
+    """ The overdue notice of one borrower, for their overdue 'loans' (or None without an email address). """
+    if not borrower['email']:
+        return None
+    context = {'username': borrower['username'], 'loans': loans}
+    return EmailMessage(
+        subject=render_to_string('catalog/overdue_notice_subject.txt', context).strip(),
+        body=render_to_string('catalog/overdue_notice.txt', context),
+        to=[borrower['email']],
+    )
+
+def process_overdue(today=None, batch_size=100):
+    """
+    Sends the pending overdue notices, 'batch_size' borrowers at a time.
+    Returns the number of loans noticed and of notices sent.
+    """
+    today = today or datetime.date.today()
+
+    # Grouped by borrower in Python: the query reads the index in due date order.
+    by_borrower = defaultdict(list)
+    borrowers = {}
+    for loan in (
+        pending_notices(today)
+        .order_by('due_back', 'id')
+        .values('id', 'due_back', 'book__title', 'borrower', 'borrower__username', 'borrower__email')
+        .iterator()
+    ):
+        by_borrower[loan['borrower']].append(loan)
+        borrowers[loan['borrower']] = {'username': loan['borrower__username'], 'email': loan['borrower__email']}
+
+    noticed = sent = 0
+    borrower_ids = list(by_borrower)
+    for start in range(0, len(borrower_ids), batch_size):
+        batch = borrower_ids[start:start + batch_size]
+        loan_ids = [loan['id'] for borrower_id in batch for loan in by_borrower[borrower_id]]
+
+        with transaction.atomic():
+            # Loans noticed (or being noticed) by another run since they were read drop out.
+            locked = set(
+                pending_notices(today).filter(pk__in=loan_ids).order_by()
+                .select_for_update(skip_locked=True).values_list('pk', flat=True)
+            )
+            notices = []
+            for borrower_id in batch:
+                loans = [loan for loan in by_borrower[borrower_id] if loan['id'] in locked]
+                notice = build_notice(borrowers[borrower_id], loans) if loans and borrower_id else None
+                if notice is not None:
+                    notices.append(notice)
+
+            if notices:
+                get_connection().send_messages(notices)
+            noticed += BookInstance.objects.filter(pk__in=list(locked)).update(overdue_notice=today)
+            sent += len(notices)
+
+    return noticed, sent
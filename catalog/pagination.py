@@ -0,0 +1,313 @@
+import hashlib
+import json
+
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import F, Q, QuerySet
+from django.http import Http404
+from django.utils.functional import cached_property
+from django.utils.translation import gettext as _
+
+# Keyset ("cursor") pagination.
+#
+# Instead of 'OFFSET n', each page seeks past the ordering values of the last
+# row of the previous page ('WHERE (title, id) > (%s, %s)'), which an index on
+# the ordering columns can answer directly however deep the page is. No COUNT
+# is run, unless an estimated total is asked for.
+#
+# Numbered pages (EstimatedCountPaginator) need a count, which PostgreSQL
+# can only get exactly by reading every row: for large querysets, the
+# paginator uses the table's row estimate or the planner's instead.
+
+class InvalidCursor(Exception):
+    pass
+
+def table_estimate(model, using):
+    """
+    The row count PostgreSQL keeps for the model's table in pg_class
+    (updated by VACUUM and ANALYZE), or None where it has none.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+        row = cursor.fetchone()
+    # -1 (or 0 before PostgreSQL 14) for a table never vacuumed or analyzed.
+    return int(row[0]) if row and row[0] > 0 else None
+
+def is_unfiltered(queryset):
+    """ Whether the queryset has as many rows as its table. """
+    query = queryset.query
+    return not (query.where or query.is_sliced or query.distinct or query.combinator or query.group_by)
+
+def estimate_count(queryset):
+    """
+    Returns an estimate of the queryset's row count on PostgreSQL (the
+    table's pg_class count when it is unfiltered, or else the planner's
+    estimate), or an exact count on other databases (e.g. SQLite in
+    development).
+    """
+    if queryset.query.is_empty():
+        # none(), which runs no query.
+        return 0
+    if connections[queryset.db].vendor == 'postgresql':
+        if is_unfiltered(queryset):
+            estimate = table_estimate(queryset.model, queryset.db)
+            if estimate is not None:
+                return estimate
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        return int(plan[0]['Plan']['Plan Rows'])
+    return queryset.count()
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A numbered Paginator for large tables, for ListView ('paginator_class')
+    and ModelAdmin ('paginator').
+
+    On PostgreSQL, a queryset estimated (see estimate_count()) at
+    'exact_below' rows or more is not counted: its estimate is used, or,
+    if 'count_timeout' is set, an exact count cached for that many seconds.
+    Smaller querysets, and every queryset on other databases, are counted
+    exactly.
+
+    Either way such a count can be off ('estimated' is then True), so pages
+    past the last counted one are still served while they have rows.
+    """
+    exact_below = 10000
+    count_timeout = None
+    estimated = False
+
+    def estimate(self):
+        """ The estimated row count, or None on databases other than PostgreSQL (or for lists). """
+        if not isinstance(self.object_list, QuerySet) or connections[self.object_list.db].vendor != 'postgresql':
+            return None
+        return estimate_count(self.object_list)
+
+    def cached_count(self):
+        """ The exact count, cached for 'count_timeout' seconds under the query's SQL. """
+        sql, params = self.object_list.query.sql_with_params()
+        digest = hashlib.md5(f'{self.object_list.db}:{sql}:{params!r}'.encode()).hexdigest()
+        key = f'catalog:count:{digest}'
+
+        count = cache.get(key)
+        if count is None:
+            count = self.object_list.count()
+            cache.set(key, count, self.count_timeout)
+        return count
+
+    @cached_property
+    def count(self):
+        estimate = self.estimate()
+        if estimate is None or estimate < self.exact_below:
+            return self.object_list.count()
+
+        self.estimated = True
+        if self.count_timeout is not None:
+            return self.cached_count()
+        return estimate
+
+    def page(self, number):
+        if not self.count or not self.estimated:
+            return super().page(number)
+
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(_('That page number is not an integer'))
+        if number < 1:
+            raise EmptyPage(_('That page number is less than 1'))
+
+        bottom = (number - 1) * self.per_page
+        object_list = self.object_list[bottom:bottom + self.per_page]
+        if number > 1 and not object_list:
+            raise EmptyPage(_('That page contains no results'))
+        return self._get_page(object_list, number, self)
+
+class CursorPage:
+    """ A page of results, with the cursors of its neighbouring pages. """
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.estimated_count = None
+        self.next_querystring = None
+        self.previous_querystring = None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+class CursorPaginator:
+    """
+    Paginates 'queryset' on 'ordering', a tuple of field names that ends with
+    a unique field (normally 'pk') so that every row has a distinct position.
+    Nullable fields are ordered with the NULLs last.
+    """
+    salt = 'catalog.pagination.cursor'
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.fields = [
+            queryset.model._meta.pk if name == 'pk' else queryset.model._meta.get_field(name)
+            for name in self.ordering
+        ]
+        # A cursor is only valid for the same model and ordering: a list's
+        # cursor on another list would seek on values of the wrong fields.
+        self.cursor_salt = f"{self.salt}:{queryset.model._meta.label_lower}:{','.join(self.ordering)}"
+
+    def encode_cursor(self, obj, direction):
+        # 'obj' is a model instance, or a dict for values() querysets (which
+        # must then include the ordering fields).
+        row = [obj[name] if isinstance(obj, dict) else getattr(obj, name) for name in self.ordering]
+        values = ['' if value is None else str(value) for value in row]
+        nulls = [value is None for value in row]
+        return signing.dumps({'d': direction, 'v': values, 'n': nulls}, salt=self.cursor_salt, compress=True)
+
+    def decode_cursor(self, cursor):
+        try:
+            data = signing.loads(cursor, salt=self.cursor_salt)
+            values = [
+                None if is_null else field.to_python(value)
+                for field, value, is_null in zip(self.fields, data['v'], data['n'], strict=True)
+            ]
+            if data['d'] not in ('next', 'previous'):
+                raise ValueError(data['d'])
+        except (signing.BadSignature, ValidationError, ValueError, KeyError, TypeError) as e:
+            raise InvalidCursor(str(e))
+        return data['d'], values
+
+    def _seek(self, values, forward):
+        """ Builds the WHERE clause selecting the rows after (or before) 'values'. """
+        condition = Q(pk__in=[])  # Matches nothing. Each field ORs in a branch.
+        equal = Q()
+
+        for name, field, value in zip(self.ordering, self.fields, values):
+            if value is None:
+                # NULLs sort last: nothing comes after a NULL, and every
+                # non-NULL value comes before it.
+                beyond = Q(pk__in=[]) if forward else Q(**{f'{name}__isnull': False})
+                same = Q(**{f'{name}__isnull': True})
+            else:
+                beyond = Q(**{f'{name}__gt' if forward else f'{name}__lt': value})
+                if field.null and forward:
+                    beyond |= Q(**{f'{name}__isnull': True})
+                same = Q(**{name: value})
+
+            condition |= equal & beyond
+            equal &= same
+
+        return condition
+
+    def _order_by(self, forward):
+        order_by = []
+        for name, field in zip(self.ordering, self.fields):
+            # NULLS LAST/FIRST is only spelled out where it matters, so plain
+            # columns keep an ORDER BY that any index on them can serve.
+            if forward:
+                order_by.append(F(name).asc(nulls_last=True) if field.null else F(name).asc())
+            else:
+                order_by.append(F(name).desc(nulls_first=True) if field.null else F(name).desc())
+        return order_by
+
+    def _query(self, cursor):
+        """ Returns (forward, cursor values, queryset) for the page 'cursor' points to. """
+        direction, values = self.decode_cursor(cursor) if cursor else ('next', None)
+        forward = direction == 'next'
+
+        queryset = self.queryset.order_by(*self._order_by(forward))
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, forward))
+
+        # Fetch one extra row to find out whether there is a further page.
+        return forward, values, queryset[:self.per_page + 1]
+
+    def _build_page(self, rows, forward, values):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if not forward:
+            rows.reverse()
+
+        # Coming from a cursor means there are rows on the side we came from.
+        has_next = has_more if forward else values is not None
+        has_previous = values is not None if forward else has_more
+
+        return CursorPage(
+            rows,
+            self.encode_cursor(rows[-1], 'next') if rows and has_next else None,
+            self.encode_cursor(rows[0], 'previous') if rows and has_previous else None,
+        )
+
+    def page(self, cursor=None):
+        """ Returns the page that 'cursor' points to (the first page if None). """
+        forward, values, queryset = self._query(cursor)
+        return self._build_page(list(queryset), forward, values)
+
+    async def apage(self, cursor=None):
+        """ The async version of page(). """
+        forward, values, queryset = self._query(cursor)
+        return self._build_page([row async for row in queryset], forward, values)
+
+def add_page_links(page, query, cursor_query_param='cursor'):
+    """
+    Sets the page's 'next_querystring' and 'previous_querystring' from the
+    current request's query ('request.GET'), keeping the other parameters
+    (e.g. filters) intact.
+    """
+    for cursor, attribute in ((page.next_cursor, 'next_querystring'),
+                              (page.previous_cursor, 'previous_querystring')):
+        if cursor is not None:
+            query = query.copy()
+            query[cursor_query_param] = cursor
+            setattr(page, attribute, '?' + query.urlencode())
+
+class CursorPaginationMixin:
+    """
+    Replaces ListView's OFFSET pagination with keyset pagination.
+
+    Set 'cursor_ordering' to the fields to seek on, ending with 'pk'. Set
+    'paginate_estimate_total' to also show an estimate of the total count.
+    """
+    cursor_ordering = ('pk',)
+    cursor_query_param = 'cursor'
+    paginate_estimate_total = False
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = CursorPaginator(queryset, self.cursor_ordering, page_size)
+
+        try:
+            page = self.get_cursor_page(paginator, self.request.GET.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise Http404(_('Invalid page.'))
+
+        if self.paginate_estimate_total:
+            page.estimated_count = estimate_count(queryset)
+
+        add_page_links(page, self.request.GET, self.cursor_query_param)
+
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+    def get_cursor_page(self, paginator, cursor):
+        """ Returns the page 'cursor' points to. Override e.g. to cache pages. """
+        return paginator.page(cursor)
@@ -0,0 +1,99 @@
+import random
+from contextlib import contextmanager
+
+from asgiref.local import Local
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Read replicas (settings.CATALOG_READ_REPLICAS, see settings.py).
+#
+# ReplicaRouter sends the reads of the catalog's models to a replica and
+# every write to the primary ('default'). A replica lags behind the
+# primary, so reads that must see the latest writes go to the primary too:
+# - while the primary is in a transaction (atomic()), e.g. in the loan
+#   services of catalog/loans.py;
+# - for the rest of a request (or thread) once it has written to the
+#   catalog. Other apps' models (sessions, users) are always read from the
+#   primary, and the page visit totals (catalog/visits.py) are written during
+#   ordinary GET requests, so their writes do not count;
+# - for a whole request that is not a GET or HEAD, and for the requests of
+#   the same client in the CATALOG_REPLICA_PIN_SECONDS after one that wrote
+#   (ReplicaPinningMiddleware);
+# - inside use_primary(), e.g. when computing values to cache, which would
+#   otherwise keep a stale read for as long as they are cached.
+#
+# Each request reads from one replica, chosen at random, so its reads are
+# consistent with each other.
+
+class RoutingState:
+    """ Where the reads of a request (or thread) go. """
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        self.replica = None
+
+_local = Local()
+
+def get_state() -> RoutingState:
+    state = getattr(_local, 'state', None)
+    if state is None:
+        state = _local.state = RoutingState()
+    return state
+
+def start_request(pinned=False) -> RoutingState:
+    """ Starts a request's routing, with its reads on the primary if 'pinned'. """
+    state = _local.state = RoutingState(pinned)
+    return state
+
+@contextmanager
+def use_primary():
+    """ Sends the reads inside the block to the primary. """
+    state = get_state()
+    pinned = state.pinned
+    state.pinned = True
+    try:
+        yield
+    finally:
+        state.pinned = pinned or state.wrote
+
+class ReplicaRouter:
+    """ Reads of the catalog from a replica, everything else from the primary (see above). """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'catalog' or not settings.CATALOG_READ_REPLICAS:
+            return DEFAULT_DB_ALIAS
+
+        # Related objects are read from where their instance was.
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+
+        state = get_state()
+        if state.pinned or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            state.replica = random.choice(settings.CATALOG_READ_REPLICAS)
+        return state.replica
+
+    # The catalog models whose writes do not pin (see above).
+    unpinned_models = {'catalog.pagevisits'}
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == 'catalog' and model._meta.label_lower not in self.unpinned_models:
+            state = get_state()
+            state.wrote = state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary.
+        databases = {DEFAULT_DB_ALIAS, *settings.CATALOG_READ_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary, schema included.
+        if db in settings.CATALOG_READ_REPLICAS:
+            return False
+        return None
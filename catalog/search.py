@@ -0,0 +1,168 @@
+import re
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Coalesce, Concat
+
+from catalog.models import Author, Book
+
+# Full-text search over the book title, summary, author name and genre names.
+#
+# On PostgreSQL each book stores its own 'search_vector' (GIN indexed). On
+# SQLite, which has no tsvector, the same text is kept in an FTS5 virtual
+# table, 'catalog_book_fts', whose rowid is the book id. Both are created by
+# migration 0013 and kept up to date by the receivers in catalog/signals.py
+# through update_search_index(). Bulk loads, which send no signals, should
+# call it themselves (or run 'manage.py rebuild_search_index').
+
+SEARCH_CONFIG = 'english'
+
+FTS_TABLE = 'catalog_book_fts'
+# bm25() weights for the FTS5 columns: title, summary, author, genre.
+FTS_WEIGHTS = (10.0, 1.0, 5.0, 3.0)
+
+def _is_postgresql():
+    return connection.vendor == 'postgresql'
+
+def _search_vector():
+    """ The PostgreSQL search document of a book, as an UPDATE expression. """
+    author_name = Subquery(
+        Author.objects.filter(pk=OuterRef('author_id'))
+        .annotate(name=Concat('first_name', Value(' '), 'last_name'))
+        .values('name')
+    )
+    genre_names = Subquery(
+        Book.genre.through.objects.filter(book_id=OuterRef('pk'))
+        .values('book_id')
+        .annotate(names=StringAgg('genre__name', ' '))
+        .values('names')
+    )
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(Coalesce(author_name, Value(''), output_field=TextField()), weight='B', config=SEARCH_CONFIG)
+        + SearchVector(Coalesce(genre_names, Value(''), output_field=TextField()), weight='B', config=SEARCH_CONFIG)
+        + SearchVector('summary', weight='C', config=SEARCH_CONFIG)
+    )
+
+# The FTS5 row of a book. '%s' is replaced with the condition on 'book'.
+_FTS_INSERT_SQL = f'''
+    INSERT INTO {FTS_TABLE} (rowid, title, summary, author, genre)
+    SELECT book.id, book.title, book.summary,
+           COALESCE(author.first_name || ' ' || author.last_name, ''),
+           COALESCE((SELECT group_concat(genre.name, ' ')
+                     FROM catalog_book_genre book_genre
+                     JOIN catalog_genre genre ON genre.id = book_genre.genre_id
+                     WHERE book_genre.book_id = book.id), '')
+    FROM catalog_book book
+    LEFT JOIN catalog_author author ON author.id = book.author_id
+    WHERE %s
+'''
+
+def update_search_index(book_ids):
+    """ Recomputes the search document of the given books. """
+    book_ids = list(book_ids)
+    if not book_ids:
+        return
+
+    if _is_postgresql():
+        Book.objects.filter(pk__in=book_ids).update(search_vector=_search_vector())
+        return
+
+    placeholders = ', '.join(['%s'] * len(book_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', book_ids)
+        cursor.execute(_FTS_INSERT_SQL % f'book.id IN ({placeholders})', book_ids)
+
+def remove_from_search_index(book_ids):
+    """ Drops deleted books from the SQLite index (PostgreSQL needs nothing). """
+    book_ids = list(book_ids)
+    if not book_ids or _is_postgresql():
+        return
+
+    placeholders = ', '.join(['%s'] * len(book_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', book_ids)
+
+def rebuild_search_index():
+    """ Recomputes the search documents of every book. """
+    if _is_postgresql():
+        Book.objects.update(search_vector=_search_vector())
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(_FTS_INSERT_SQL % '1 = 1')
+
+def _fts_match(query):
+    """ Turns user input into an FTS5 query: every word must match. """
+    # Each word is quoted, so FTS5 operators and column filters in the input
+    # are searched for literally instead of being interpreted.
+    words = re.findall(r'\w+', query)
+    return ' '.join(f'"{word}"' for word in words)
+
+class FTSResults:
+    """
+    The SQLite search results, in rank order. Like a queryset it can be
+    counted and sliced (so it can be paginated): each slice is one
+    'ORDER BY rank LIMIT' query on the FTS5 table, plus one for the books.
+    """
+
+    def __init__(self, match, queryset):
+        self.match = match
+        self.queryset = queryset
+
+    def count(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [self.match])
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+
+        start, stop = index.start or 0, index.stop
+        limit = -1 if stop is None else max(stop - start, 0)
+        # bm25() is lower for better matches, hence the negation.
+        bm25 = f'bm25({FTS_TABLE}, {", ".join(map(str, FTS_WEIGHTS))})'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, -{bm25} FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY {bm25}, rowid LIMIT %s OFFSET %s',
+                [self.match, limit, start],
+            )
+            ranks = dict(cursor.fetchall())
+
+        books = self.queryset.in_bulk(list(ranks))
+        results = []
+        for book_id, rank in ranks.items():
+            if book_id in books:
+                books[book_id].rank = rank
+                results.append(books[book_id])
+        return results
+
+def search_books(query, queryset=None):
+    """
+    Returns the books matching 'query', best match first, each annotated
+    with its 'rank' (higher is better). 'queryset' can be used to
+    select_related() or narrow down the books.
+    """
+    if queryset is None:
+        queryset = Book.objects.all()
+
+    if _is_postgresql():
+        search_query = SearchQuery(query, search_type='websearch', config=SEARCH_CONFIG)
+        return (
+            queryset.filter(search_vector=search_query)
+            .annotate(rank=SearchRank(F('search_vector'), search_query))
+            .order_by('-rank', 'pk')
+        )
+
+    match = _fts_match(query)
+    if not match:
+        return []
+    return FTSResults(match, queryset)
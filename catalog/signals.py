@@ -0,0 +1,211 @@
+from collections import Counter
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from catalog.cache import bump_book_copies_version
+from catalog.counters import adjust_book_counters, invalidate_index_counts, recount_book_counters
+from catalog.facets import (
+    AVAILABLE, adjust_facet_counts, book_facets, invalidate_book_list, invalidate_facet_counts, move_book,
+)
+from catalog.lookups import invalidate_genres, invalidate_languages
+from catalog.models import Author, Book, BookInstance, FacetCount, Genre, Language
+from catalog.search import remove_from_search_index, update_search_index
+
+# Connected in CatalogConfig.ready() (catalog/apps.py).
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=BookInstance)
+@receiver(post_delete, sender=BookInstance)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def index_counts_changed(sender, **kwargs):
+    """ Any change to a counted model makes the home page counters stale. """
+    invalidate_index_counts()
+
+@receiver(post_save, sender=BookInstance)
+@receiver(post_delete, sender=BookInstance)
+def book_copies_changed(sender, instance, **kwargs):
+    """ Invalidates the cached 'Copies' section of the copy's book(s). """
+    book_ids = {instance.book_id, getattr(instance, '_loaded_values', {}).get('book_id')}
+
+    for book_id in book_ids - {None}:
+        bump_book_copies_version(book_id)
+    # The book list shows the number of copies available.
+    invalidate_book_list()
+
+# Per-book copy counters (catalog/counters.py).
+
+@receiver(post_save, sender=BookInstance)
+def book_counters_saved(sender, instance, created, update_fields, **kwargs):
+    if created:
+        adjust_book_counters(None, (instance.book_id, instance.status))
+        return
+
+    saved = None if update_fields is None else set(update_fields)
+    if saved is not None and not saved & {'book', 'book_id', 'status'}:
+        return
+
+    loaded = getattr(instance, '_loaded_values', {})
+    if 'book_id' not in loaded or 'status' not in loaded:
+        # Where the copy was counted before is unknown.
+        recount_book_counters(Book.objects.filter(pk__in={instance.book_id, loaded.get('book_id')} - {None}))
+        return
+
+    new_book_id = instance.book_id if saved is None or saved & {'book', 'book_id'} else loaded['book_id']
+    new_status = instance.status if saved is None or 'status' in saved else loaded['status']
+    adjust_book_counters((loaded['book_id'], loaded['status']), (new_book_id, new_status))
+
+@receiver(post_delete, sender=BookInstance)
+def book_counters_deleted(sender, instance, **kwargs):
+    # The values as loaded are the ones the copy was counted with.
+    loaded = getattr(instance, '_loaded_values', {})
+    adjust_book_counters((loaded.get('book_id', instance.book_id), loaded.get('status', instance.status)), None)
+
+# Cached lookup tables (catalog/lookups.py).
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def genres_changed(sender, **kwargs):
+    invalidate_genres()
+
+@receiver(post_save, sender=Language)
+@receiver(post_delete, sender=Language)
+def languages_changed(sender, **kwargs):
+    invalidate_languages()
+
+# Facets of the book list (catalog/facets.py).
+
+FACET_FIELDS = {'language': 'language_id', 'author': 'author_id'}
+
+@receiver(post_save, sender=Book)
+def book_facets_saved(sender, instance, created, update_fields, **kwargs):
+    if created:
+        move_book([], book_facets(instance.__dict__))
+        return
+
+    # Only fields that were loaded can have changed. (A book saved without
+    # being loaded is not moved: run 'manage.py rebuild_facets' after that.)
+    loaded = getattr(instance, '_loaded_values', {})
+    saved = [
+        attname for name, attname in FACET_FIELDS.items()
+        if attname in loaded and (update_fields is None or name in update_fields or attname in update_fields)
+    ]
+    move_book(
+        book_facets({attname: loaded[attname] for attname in saved}),
+        book_facets({attname: getattr(instance, attname) for attname in saved}),
+    )
+
+@receiver(pre_delete, sender=Book)
+def book_facets_deleting(sender, instance, **kwargs):
+    # The book's genres are deleted with it, without any signal.
+    instance._facet_genre_ids = list(instance.genre.values_list('pk', flat=True))
+
+@receiver(post_delete, sender=Book)
+def book_facets_deleted(sender, instance, **kwargs):
+    values = {**instance.__dict__, **getattr(instance, '_loaded_values', {})}
+    old = book_facets(values) + [('genre', genre_id) for genre_id in getattr(instance, '_facet_genre_ids', [])]
+    if values.get('copies_available'):
+        old.append(AVAILABLE)
+    move_book(old, [])
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def book_genre_facets_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # book.genre.add(...) etc. when not 'reverse', genre.book_set.add(...)
+    # when it is. pk_set holds the ids of the other side.
+    if action in ('pre_remove', 'pre_clear'):
+        # pk_set holds the links asked to be removed, which need not all
+        # exist, and nothing for clear(): count the ones that do.
+        links = sender.objects.filter(**{'genre' if reverse else 'book': instance})
+        if action == 'pre_remove':
+            links = links.filter(**{'book__in' if reverse else 'genre__in': pk_set})
+        instance._facet_genres_removed = Counter(links.values_list('genre_id', flat=True))
+    elif action in ('post_remove', 'post_clear'):
+        removed = getattr(instance, '_facet_genres_removed', Counter())
+        adjust_facet_counts({('genre', genre_id): -n for genre_id, n in removed.items()})
+        invalidate_book_list()
+    elif action == 'post_add':
+        # Django only sends the links it actually adds.
+        adjust_facet_counts({('genre', instance.pk): len(pk_set)} if reverse else {('genre', pk): 1 for pk in pk_set})
+        invalidate_book_list()
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def book_list_changed(sender, **kwargs):
+    """ The book list shows each book's title and author. """
+    invalidate_book_list()
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=Language)
+def facet_labels_changed(sender, **kwargs):
+    invalidate_facet_counts()
+
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Genre)
+@receiver(post_delete, sender=Language)
+def facet_value_deleted(sender, instance, **kwargs):
+    # Its books were unlinked without any signal, which changes no other count.
+    FacetCount.objects.filter(facet=sender._meta.model_name, value=instance.pk).delete()
+    invalidate_facet_counts()
+
+# Search index (catalog/search.py). A book's search document includes its
+# author's name and its genre names, so those models reindex their books.
+
+@receiver(post_save, sender=Book)
+def book_search_changed(sender, instance, **kwargs):
+    update_search_index([instance.pk])
+
+@receiver(post_delete, sender=Book)
+def book_search_deleted(sender, instance, **kwargs):
+    remove_from_search_index([instance.pk])
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def book_genres_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # book.genre.add(...) etc.
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            update_search_index([instance.pk])
+    elif action == 'pre_clear':
+        # genre.book_set.clear(): the books are unknown once it is done.
+        instance._search_book_ids = list(instance.book_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        update_search_index(getattr(instance, '_search_book_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        update_search_index(pk_set)
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Genre)
+def search_names_changed(sender, instance, created, **kwargs):
+    if not created:
+        update_search_index(instance.book_set.values_list('pk', flat=True))
+
+@receiver(pre_delete, sender=Author)
+@receiver(pre_delete, sender=Genre)
+def search_names_deleting(sender, instance, **kwargs):
+    # The books lose their link to the author/genre without any signal.
+    instance._search_book_ids = list(instance.book_set.values_list('pk', flat=True))
+
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Genre)
+def search_names_deleted(sender, instance, **kwargs):
+    update_search_index(getattr(instance, '_search_book_ids', []))
+
+# Connected last, so that the receivers above see the values from before
+# the save.
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=BookInstance)
+def remember_saved_values(sender, instance, update_fields, **kwargs):
+    """ Records the saved values, as from_db() does for loaded ones. """
+    saved = {
+        field.attname: getattr(instance, field.attname)
+        for field in instance._meta.concrete_fields
+        if update_fields is None or field.name in update_fields or field.attname in update_fields
+    }
+    instance._loaded_values = {**getattr(instance, '_loaded_values', {}), **saved}
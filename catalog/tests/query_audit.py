@@ -0,0 +1,123 @@
+import os
+import re
+import sys
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.db import connections
+from django.template.base import Node
+from django.test import Client
+
+# A test-time N+1 query detector.
+#
+# QueryAuditor records every query run inside it, groups them by fingerprint
+# (the SQL with its literals and IN (...) lists normalized away) and notes
+# where each one came from: the template line being rendered, or else the
+# innermost line of catalog code. A fingerprint that repeats more than
+# 'max_repeats' times within one request is almost always a query run once
+# per row, e.g. '{{ bookinst.book.title }}' without select_related().
+#
+# View tests use it through QueryAuditMixin, which makes every request sent
+# with self.client fail the test when it finds repeated queries.
+
+MAX_REPEATS = 2
+
+CATALOG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN \((?:%s|\?)(?:, (?:%s|\?))*\)', re.IGNORECASE)
+_SPACES = re.compile(r'\s+')
+
+def fingerprint(sql):
+    """ Normalizes 'sql' so that the same query with other values matches. """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+def query_origin(frame):
+    """ Describes where the query run under 'frame' comes from. """
+    catalog_line = None
+    while frame is not None:
+        node = frame.f_locals.get('self')
+        # type() rather than isinstance(), which would evaluate lazy objects
+        # (such as request.user) and run more queries from in here.
+        if issubclass(type(node), Node) and getattr(node, 'token', None) is not None and node.origin:
+            return f'{node.origin.template_name or node.origin.name}, line {node.token.lineno}: {node.token.contents}'
+
+        filename = frame.f_code.co_filename
+        if catalog_line is None and filename.startswith(CATALOG_DIR) and not filename.startswith(TESTS_DIR):
+            catalog_line = f'{os.path.relpath(filename, os.path.dirname(CATALOG_DIR))}, line {frame.f_lineno}'
+        frame = frame.f_back
+    return catalog_line or 'unknown'
+
+class QueryAuditor:
+    """
+    Records the queries run on every database connection while active.
+
+        with QueryAuditor() as audit:
+            client.get(url)
+        audit.assert_no_repeats()
+    """
+
+    def __init__(self, max_repeats=MAX_REPEATS):
+        self.max_repeats = max_repeats
+        self.queries = defaultdict(list)  # fingerprint: [(sql, origin), ...]
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self._record))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def _record(self, execute, sql, params, many, context):
+        self.queries[fingerprint(sql)].append((sql, query_origin(sys._getframe(1))))
+        return execute(sql, params, many, context)
+
+    def repeats(self):
+        """ Returns {fingerprint: [(sql, origin), ...]} for the repeated queries. """
+        return {sql: runs for sql, runs in self.queries.items() if len(runs) > self.max_repeats}
+
+    def report(self):
+        lines = []
+        for sql, runs in self.repeats().items():
+            lines.append(f'{len(runs)} x {sql}')
+            for origin in dict.fromkeys(origin for _, origin in runs):
+                lines.append(f'    from {origin}')
+        return '\n'.join(lines)
+
+    def assert_no_repeats(self, description='the block'):
+        if self.repeats():
+            raise AssertionError(
+                f'Repeated queries (more than {self.max_repeats} of the same kind) in {description}; '
+                f'use select_related()/prefetch_related() or annotate:\n{self.report()}'
+            )
+
+class AuditingClient(Client):
+    """ A test client that fails on repeated queries in any request. """
+    max_repeats = MAX_REPEATS
+
+    def request(self, **request):
+        with QueryAuditor(self.max_repeats) as audit:
+            response = super().request(**request)
+        audit.assert_no_repeats(f"{request['REQUEST_METHOD']} {request['PATH_INFO']}")
+        return response
+
+class QueryAuditMixin:
+    """
+    For view TestCases: audits every request made with self.client. Set
+    'max_query_repeats' to change how many identical queries are allowed.
+    """
+    client_class = AuditingClient
+    max_query_repeats = MAX_REPEATS
+
+    def _pre_setup(self):
+        super()._pre_setup()
+        self.client.max_repeats = self.max_query_repeats
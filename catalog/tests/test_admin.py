@@ -0,0 +1,111 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.models import Author, Book, BookInstance, Genre, Reservation
+from catalog.tests.query_audit import QueryAuditMixin
+
+# Create your tests here.
+
+class AdminPerformanceTest(QueryAuditMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.admin = User.objects.create_superuser(username='admin', password='3Jk&8wZq!pL0')
+        genres = [Genre.objects.create(name=name) for name in ('Horror', 'Gothic', 'Romance', 'Science Fiction')]
+
+        cls.author = Author.objects.create(first_name='Mary', last_name='Shelley')
+        for number in range(25):
+            Author.objects.create(first_name=f'John {number}', last_name='Smith')
+            book = Book.objects.create(title=f'Book {number:02d}', summary='Summary', isbn=str(number), author=cls.author)
+            book.genre.set(genres)
+        cls.book = Book.objects.get(title='Book 00')
+
+        today = datetime.date.today()
+        for number in range(25):
+            borrower = User.objects.create_user(username=f'borrower{number}')
+            BookInstance.objects.create(
+                book=cls.book, imprint='Lackington', status='o', borrower=borrower,
+                due_back=today + datetime.timedelta(days=number),
+            )
+            Reservation.objects.create(book=Book.objects.get(title=f'Book {number:02d}'), borrower=borrower)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelists(self):
+        # The audit fails on any query run once per row.
+        for model in ('book', 'bookinstance', 'author', 'reservation'):
+            with self.subTest(model=model):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(reverse(f'admin:catalog_{model}_changelist'))
+                self.assertEqual(response.status_code, 200)
+                # No count of the unfiltered table besides the paginator's.
+                counts = [query for query in queries if 'COUNT(' in query['sql']]
+                self.assertEqual(len(counts), 1)
+
+        response = self.client.get(reverse('admin:catalog_book_changelist'))
+        self.assertContains(response, 'Horror, Gothic, Romance')
+
+    def test_book_copies_are_paginated(self):
+        url = reverse('admin:catalog_book_change', args=[self.book.pk])
+        response = self.client.get(url)
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertEqual(len(formset.forms), 20)
+        self.assertContains(
+            response,
+            '<p class="paginator">Book instances: page 1 of 2 (25 in all) <a href="?bookinstance_set-page=2">next</a></p>',
+            html=True,
+        )
+
+        response = self.client.get(url, {'bookinstance_set-page': 2})
+        self.assertEqual(len(response.context['inline_admin_formsets'][0].formset.forms), 5)
+
+    def test_saving_a_page_of_books(self):
+        url = reverse('admin:catalog_author_change', args=[self.author.pk])
+        response = self.client.get(url, {'book_set-page': 2})
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertEqual([form.instance.title for form in formset.forms], ['Book 20', 'Book 21', 'Book 22', 'Book 23', 'Book 24'])
+
+        data = {
+            'first_name': 'Mary', 'last_name': 'Shelley',
+            'book_set-TOTAL_FORMS': '5', 'book_set-INITIAL_FORMS': '5',
+            'book_set-MIN_NUM_FORMS': '0', 'book_set-MAX_NUM_FORMS': '1000',
+        }
+        for i, form in enumerate(formset.forms):
+            data.update({
+                f'book_set-{i}-id': str(form.instance.pk), f'book_set-{i}-author': str(self.author.pk),
+                f'book_set-{i}-title': form.instance.title, f'book_set-{i}-isbn': form.instance.isbn,
+            })
+        data['book_set-4-title'] = 'Frankenstein'
+        # Saving a formset looks up each form's object and checks its unique
+        # isbn with a query: one page of them at most.
+        self.client.max_repeats = len(formset.forms)
+        response = self.client.post(f'{url}?book_set-page=2', data)
+        self.assertRedirects(response, reverse('admin:catalog_author_changelist'))
+        self.assertEqual(Book.objects.get(isbn='24').title, 'Frankenstein')
+        # The books of the other page are untouched.
+        self.assertEqual(Book.objects.filter(author=self.author).count(), 25)
+
+    def test_books_cannot_be_added_on_the_author_page(self):
+        url = reverse('admin:catalog_author_change', args=[self.author.pk])
+        response = self.client.get(url)
+        self.assertFalse(response.context['inline_admin_formsets'][0].has_add_permission)
+        self.assertContains(response, reverse('admin:catalog_book_change', args=[self.book.pk]))
+
+        self.client.post(url, {
+            'first_name': 'Mary', 'last_name': 'Shelley',
+            'book_set-TOTAL_FORMS': '1', 'book_set-INITIAL_FORMS': '0',
+            'book_set-MIN_NUM_FORMS': '0', 'book_set-MAX_NUM_FORMS': '1000',
+            'book_set-0-author': str(self.author.pk), 'book_set-0-title': 'No Summary', 'book_set-0-isbn': 'NOSUMMARY',
+        })
+        self.assertFalse(Book.objects.filter(isbn='NOSUMMARY').exists())
+
+    def test_book_autocomplete(self):
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'catalog', 'model_name': 'bookinstance', 'field_name': 'book', 'term': '24',
+        })
+        self.assertEqual([result['text'] for result in response.json()['results']], ['Book 24'])
@@ -0,0 +1,127 @@
+import datetime
+
+from django.contrib.auth.models import Permission, User
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog.models import Author, Book, BookInstance
+from catalog.tests.query_audit import QueryAuditMixin
+
+# Create your tests here.
+
+class BookApiTest(QueryAuditMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.test_author = Author.objects.create(first_name='John', last_name='Smith')
+        for book_number in range(25):
+            Book.objects.create(
+                title=f'Book {book_number:02d}', summary='My book summary',
+                isbn=f'ISBN{book_number}', author=cls.test_author,
+            )
+        cls.test_book = Book.objects.get(title='Book 00')
+
+    def test_list(self):
+        response = self.client.get(reverse('api-books'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+        data = response.json()
+        self.assertEqual(len(data['results']), 20)
+        self.assertEqual(data['results'][0]['title'], 'Book 00')
+        self.assertEqual(data['results'][0]['author'], self.test_author.pk)
+        self.assertIsNone(data['previous'])
+
+        data = self.client.get(data['next']).json()
+        self.assertEqual([book['title'] for book in data['results']], [f'Book {n}' for n in range(20, 25)])
+        self.assertIsNone(data['next'])
+        self.assertIsNotNone(data['previous'])
+
+    def test_list_uses_one_query(self):
+        with self.assertNumQueries(1):
+            self.client.get(reverse('api-books'))
+
+    def test_sparse_fieldsets(self):
+        data = self.client.get(reverse('api-books'), {'fields': 'title,isbn', 'limit': 2}).json()
+        self.assertEqual(data['results'][0], {'id': self.test_book.pk, 'title': 'Book 00', 'isbn': 'ISBN0'})
+        self.assertEqual(len(data['results']), 2)
+
+    def test_unknown_field_is_an_error(self):
+        response = self.client.get(reverse('api-books'), {'fields': 'title,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+
+    def test_invalid_cursor_is_an_error(self):
+        response = self.client.get(reverse('api-books'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_detail(self):
+        response = self.client.get(reverse('api-book-detail', args=[self.test_book.pk]), {'fields': 'title'})
+        self.assertEqual(response.json(), {'id': self.test_book.pk, 'title': 'Book 00'})
+
+        response = self.client.get(reverse('api-book-detail', args=[9999]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_etag_not_modified(self):
+        url = reverse('api-book-detail', args=[self.test_book.pk])
+        etag = self.client.get(url)['ETag']
+        self.assertFalse(etag.startswith('W/'))
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_etag_changes_when_a_row_changes(self):
+        url = reverse('api-books')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.test_book.summary = 'A new summary'
+        self.test_book.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_depends_on_fields(self):
+        url = reverse('api-books')
+        self.assertNotEqual(self.client.get(url)['ETag'], self.client.get(url, {'fields': 'title'})['ETag'])
+
+    def test_read_only(self):
+        response = self.client.post(reverse('api-books'), {'title': 'New'})
+        self.assertEqual(response.status_code, 405)
+
+class LoanApiTest(QueryAuditMixin, TestCase):
+    def setUp(self):
+        self.test_user1 = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        test_user2 = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        test_user2.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+
+        test_book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG')
+        for book_copy in range(3):
+            BookInstance.objects.create(
+                book=test_book, imprint='Unlikely Imprint, 2016', status='o' if book_copy else 'a',
+                due_back=datetime.date.today() + datetime.timedelta(days=3 - book_copy),
+                borrower=self.test_user1,
+            )
+
+    def test_forbidden_without_permission(self):
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        response = self.client.get(reverse('api-loans'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_lists_loans_by_due_date(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        results = self.client.get(reverse('api-loans')).json()['results']
+
+        self.assertEqual(len(results), 2)
+        self.assertLess(results[0]['due_back'], results[1]['due_back'])
+        self.assertEqual(results[0]['borrower'], self.test_user1.pk)
+
+    def test_instances_hide_borrower(self):
+        results = self.client.get(reverse('api-instances')).json()['results']
+        self.assertEqual(len(results), 3)
+        self.assertNotIn('borrower', results[0])
+
+        response = self.client.get(reverse('api-instance-detail', args=[results[0]['id']]))
+        self.assertEqual(response.json()['id'], results[0]['id'])
@@ -0,0 +1,107 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from catalog import metrics
+from catalog.models import Author, Book, BookInstance
+
+# Create your tests here.
+
+class AsyncViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.test_author = Author.objects.create(first_name='John', last_name='Smith')
+        for author_id in range(12):
+            Author.objects.create(first_name=f'Dominique {author_id}', last_name=f'Surname {author_id}')
+
+        cls.test_book = Book.objects.create(
+            title='Book Title', summary='My book summary', isbn='ABCDEFG', author=cls.test_author,
+        )
+        for book_id in range(12):
+            Book.objects.create(title=f'Book {book_id:02d}', summary='Summary', isbn=str(book_id), author=cls.test_author)
+        for status in ('a', 'a', 'o'):
+            BookInstance.objects.create(book=cls.test_book, imprint='Unlikely Imprint, 2016', status=status)
+
+        test_user = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        test_user.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_index(self):
+        response = await self.async_client.get(reverse('async-index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'index.html')
+        self.assertEqual(response.context['num_books'], 13)
+        self.assertEqual(response.context['num_instances_available'], 2)
+        self.assertEqual(response.context['num_visits'], 0)
+
+    async def test_book_list_is_paginated(self):
+        response = await self.async_client.get(reverse('async-books'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'catalog/book_list.html')
+        self.assertEqual(len(response.context['book_list']), 10)
+        self.assertContains(response, 'Smith, John')
+
+        response = await self.async_client.get(
+            reverse('async-books') + response.context['page_obj'].next_querystring
+        )
+        self.assertEqual(len(response.context['book_list']), 3)
+
+    async def test_book_list_facets(self):
+        other_author = await Author.objects.aget(first_name='Dominique 0')
+        await Book.objects.acreate(title='Other Book', summary='Summary', isbn='OTHER', author=other_author)
+
+        response = await self.async_client.get(reverse('async-books'), {'author': other_author.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([book.title for book in response.context['book_list']], ['Other Book'])
+        self.assertEqual(response.context['filters'], {'author': other_author.pk})
+        self.assertIn('author', dict(response.context['facets']))
+
+        response = await self.async_client.get(reverse('async-books'), {'available': '1'})
+        self.assertEqual([book.title for book in response.context['book_list']], ['Book Title'])
+
+        # Other spellings of the query string are redirected.
+        response = await self.async_client.get(reverse('async-books'), {'author': other_author.pk, 'x': '1'})
+        self.assertEqual(response.status_code, 301)
+        self.assertEqual(response.url, f"{reverse('async-books')}?author={other_author.pk}")
+
+    async def test_invalid_cursor(self):
+        response = await self.async_client.get(reverse('async-authors'), {'cursor': 'nonsense'})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_author_list(self):
+        response = await self.async_client.get(reverse('async-authors'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['author_list']), 10)
+
+    async def test_book_detail(self):
+        response = await self.async_client.get(reverse('async-book-detail', args=[self.test_book.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'catalog/book_detail.html')
+        self.assertContains(response, 'Unlikely Imprint, 2016', count=3)
+
+        response = await self.async_client.get(reverse('async-book-detail', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_author_detail(self):
+        response = await self.async_client.get(reverse('async-author-detail', args=[self.test_author.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '(3, 2 available)')
+
+    async def test_logged_in_user_and_permissions(self):
+        await sync_to_async(self.async_client.force_login)(await User.objects.aget(username='testuser1'))
+        response = await self.async_client.get(reverse('async-books'))
+        self.assertContains(response, 'testuser1')
+        self.assertContains(response, 'All borrowed')
+
+    @override_settings(CATALOG_METRICS_SAMPLE_RATE=1.0)
+    async def test_metrics_count_the_queries(self):
+        metrics.reset()
+        await self.async_client.get(reverse('async-books'))
+
+        cumulative, total, count = metrics._series[('catalog_db_queries', 'async-books')].snapshot()
+        self.assertEqual(count, 1)
+        self.assertGreaterEqual(total, 1)
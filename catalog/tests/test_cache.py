@@ -0,0 +1,95 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from catalog.cache import LocalCache, bump_version, get_cached, local_cache
+from catalog.forms import BookForm
+from catalog.lookups import get_genres
+from catalog.models import Genre, Language
+
+# Create your tests here.
+
+class LocalCacheTest(TestCase):
+    def test_least_recently_used_entries_are_dropped(self):
+        local = LocalCache(max_entries=2)
+        local.set('a', 1)
+        local.set('b', 2)
+        local.get('a')
+        local.set('c', 3)
+
+        self.assertEqual(local.get('a'), 1)
+        self.assertIsNone(local.get('b'))
+        self.assertEqual(local.get('c'), 3)
+
+    def test_entries_expire(self):
+        local = LocalCache(timeout=10)
+        with mock.patch('catalog.cache.time.monotonic', return_value=100):
+            local.set('a', 1)
+        with mock.patch('catalog.cache.time.monotonic', return_value=105):
+            self.assertEqual(local.get('a'), 1)
+        with mock.patch('catalog.cache.time.monotonic', return_value=111):
+            self.assertIsNone(local.get('a'))
+
+class GetCachedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.compute = mock.Mock(return_value=['value'])
+
+    def test_computes_once(self):
+        self.assertEqual(get_cached('test', self.compute), ['value'])
+        self.assertEqual(get_cached('test', self.compute), ['value'])
+        self.assertEqual(self.compute.call_count, 1)
+
+    def test_local_tier_is_read_first(self):
+        value = get_cached('test', self.compute)
+        with mock.patch.object(cache, 'get', wraps=cache.get) as shared_get:
+            self.assertIs(get_cached('test', self.compute), value)
+        # Only the version stamp is read from the shared cache.
+        self.assertEqual(shared_get.call_count, 1)
+
+    def test_shared_tier_fills_an_empty_local_tier(self):
+        get_cached('test', self.compute)
+        local_cache.clear()  # As in another worker.
+        self.assertEqual(get_cached('test', self.compute), ['value'])
+        self.assertEqual(self.compute.call_count, 1)
+
+    def test_bump_invalidates_both_tiers(self):
+        get_cached('test', self.compute)
+        bump_version('test')
+        get_cached('test', self.compute)
+        self.assertEqual(self.compute.call_count, 2)
+
+class LookupsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        Genre.objects.create(name='Fantasy')
+        Genre.objects.create(name='Horror')
+        Language.objects.create(language_name='English')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_saving_a_genre_refreshes_the_list(self):
+        self.assertEqual([genre.name for genre in get_genres()], ['Fantasy', 'Horror'])
+        Genre.objects.create(name='Crime')
+        self.assertEqual([genre.name for genre in get_genres()], ['Crime', 'Fantasy', 'Horror'])
+
+    def test_book_form_lists_cached_choices(self):
+        str(BookForm())  # Fills the cache.
+
+        with CaptureQueriesContext(connection) as queries:
+            html = str(BookForm())
+
+        self.assertIn('Horror', html)
+        self.assertIn('English', html)
+        self.assertFalse([query for query in queries if 'catalog_genre' in query['sql']])
+        self.assertFalse([query for query in queries if 'catalog_language' in query['sql']])
+
+    def test_book_form_validates_against_the_database(self):
+        form = BookForm(data={'genre': [Genre.objects.get(name='Horror').pk, 0]})
+        self.assertFalse(form.is_valid())
+        self.assertIn('genre', form.errors)
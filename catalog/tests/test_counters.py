@@ -0,0 +1,173 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog.counters import compute_index_counts, find_counter_drift, get_index_counts, recount_book_counters
+from catalog.models import Author, Book, BookInstance, Genre
+from catalog.tests.query_audit import QueryAuditMixin
+
+# Create your tests here.
+
+class IndexCountsTest(QueryAuditMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        author = Author.objects.create(first_name='Mary', last_name='Shelley')
+        Genre.objects.create(name='Gothic Horror')
+        Genre.objects.create(name='Romance')
+
+        book = Book.objects.create(title='Frankenstein', summary='A monster.', isbn='1', author=author)
+        Book.objects.create(title='The Last Man', summary='A plague.', isbn='2', author=author)
+
+        BookInstance.objects.create(book=book, imprint='Lackington', status='a')
+        BookInstance.objects.create(book=book, imprint='Lackington', status='o')
+        BookInstance.objects.create(book=book, imprint='Colburn', status='m')
+
+    def setUp(self):
+        # The cache is not rolled back between tests like the database is.
+        cache.clear()
+
+    def test_counts(self):
+        self.assertEqual(compute_index_counts(), {
+            'num_books': 2,
+            'num_instances': 3,
+            'num_instances_available': 1,
+            'num_authors': 1,
+            'num_genres_with_word': 1,
+            'num_books_with_word_the': 1,
+        })
+
+    def test_counts_use_a_single_query(self):
+        with self.assertNumQueries(1):
+            compute_index_counts()
+
+    def test_counts_on_empty_tables(self):
+        BookInstance.objects.all().delete()
+        self.assertEqual(compute_index_counts()['num_instances'], 0)
+        self.assertEqual(compute_index_counts()['num_books'], 2)
+
+    def test_counts_are_cached(self):
+        get_index_counts()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_index_counts()['num_books'], 2)
+
+    def test_saving_a_counted_model_invalidates_the_cache(self):
+        self.assertEqual(get_index_counts()['num_authors'], 1)
+        author = Author.objects.create(first_name='Percy', last_name='Shelley')
+        self.assertEqual(get_index_counts()['num_authors'], 2)
+
+        author.delete()
+        self.assertEqual(get_index_counts()['num_authors'], 1)
+
+    def test_status_change_invalidates_the_cache(self):
+        self.assertEqual(get_index_counts()['num_instances_available'], 1)
+        copy = BookInstance.objects.get(status='m')
+        copy.status = 'a'
+        copy.save()
+        self.assertEqual(get_index_counts()['num_instances_available'], 2)
+
+    def test_benchmark_leaves_the_cache_alone(self):
+        get_index_counts()
+        call_command('benchmark', 'index', scale=20, repeat=1, stdout=StringIO())
+        self.assertEqual(get_index_counts(), compute_index_counts())
+
+    def test_index_view_context(self):
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['num_books'], 2)
+        self.assertEqual(response.context['num_instances_available'], 1)
+        self.assertEqual(response.context['num_visits'], 0)
+
+class BookCopyCountersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        author = Author.objects.create(first_name='Mary', last_name='Shelley')
+        cls.book = Book.objects.create(title='Frankenstein', summary='A monster.', isbn='1', author=author)
+        cls.other_book = Book.objects.create(title='The Last Man', summary='A plague.', isbn='2', author=author)
+
+    def assertCounters(self, book, total, available, on_loan):
+        book.refresh_from_db()
+        self.assertEqual((book.copies_total, book.copies_available, book.copies_on_loan), (total, available, on_loan))
+
+    def test_creating_copies(self):
+        for status in ('a', 'a', 'o', 'm'):
+            BookInstance.objects.create(book=self.book, imprint='Lackington', status=status)
+        self.assertCounters(self.book, 4, 2, 1)
+        self.assertCounters(self.other_book, 0, 0, 0)
+
+    def test_status_changes(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Lackington', status='a')
+        copy.status = 'o'
+        copy.save()
+        self.assertCounters(self.book, 1, 0, 1)
+
+        # Saved again after a save: counted from the last saved status.
+        copy.status = 'r'
+        copy.save()
+        self.assertCounters(self.book, 1, 0, 0)
+
+    def test_update_fields(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Lackington', status='a')
+        copy.status = 'o'
+        copy.imprint = 'Colburn'
+        copy.save(update_fields=['imprint'])
+        self.assertCounters(self.book, 1, 1, 0)
+
+        copy.save(update_fields=['status'])
+        self.assertCounters(self.book, 1, 0, 1)
+
+    def test_loaded_copy_moved_to_another_book(self):
+        BookInstance.objects.create(book=self.book, imprint='Lackington', status='a')
+        copy = BookInstance.objects.get()
+        copy.book = self.other_book
+        copy.status = 'o'
+        copy.save()
+        self.assertCounters(self.book, 0, 0, 0)
+        self.assertCounters(self.other_book, 1, 0, 1)
+
+    def test_deleting_copies(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Lackington', status='o')
+        BookInstance.objects.create(book=self.book, imprint='Lackington', status='a')
+        copy.delete()
+        self.assertCounters(self.book, 1, 1, 0)
+
+        BookInstance.objects.all().delete()
+        self.assertCounters(self.book, 0, 0, 0)
+
+    def test_saving_a_stale_book_keeps_its_counters(self):
+        stale = Book.objects.get(pk=self.book.pk)
+        BookInstance.objects.create(book=self.book, imprint='Lackington', status='a')
+        BookInstance.objects.create(book=self.book, imprint='Colburn', status='a')
+
+        stale.title = 'Frankenstein; or, The Modern Prometheus'
+        stale.save()
+        self.assertCounters(self.book, 2, 2, 0)
+        self.assertEqual(self.book.title, stale.title)
+        self.assertEqual(find_counter_drift(Book.objects.all()), [])
+
+    def test_bulk_changes_are_found_and_recounted(self):
+        BookInstance.objects.create(book=self.book, imprint='Lackington', status='a')
+        BookInstance.objects.update(status='o')
+        self.assertEqual(find_counter_drift(Book.objects.all()), [self.book.pk])
+
+        recount_book_counters(Book.objects.filter(pk=self.book.pk))
+        self.assertEqual(find_counter_drift(Book.objects.all()), [])
+        self.assertCounters(self.book, 1, 0, 1)
+
+    def test_reconcile_counters_command(self):
+        BookInstance.objects.bulk_create([
+            BookInstance(book=book, imprint='Lackington', status='a') for book in (self.book, self.other_book)
+        ])
+
+        out = StringIO()
+        call_command('reconcile_counters', dry_run=True, stdout=out)
+        self.assertIn('Checked 2 books, found 2 with drifted counters.', out.getvalue())
+        self.assertCounters(self.book, 0, 0, 0)
+
+        out = StringIO()
+        call_command('reconcile_counters', batch_size=1, stdout=out)
+        self.assertIn('Checked 2 books, fixed 2 with drifted counters.', out.getvalue())
+        self.assertCounters(self.book, 1, 1, 0)
+        self.assertCounters(self.other_book, 1, 1, 0)
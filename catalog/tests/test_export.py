@@ -0,0 +1,142 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import tracemalloc
+
+from django.contrib.auth.models import Permission, User
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from catalog.export import accepts_gzip, encode, render
+from catalog.models import Author, Book, BookInstance, Language
+from catalog.tests.query_audit import QueryAuditMixin
+
+# Create your tests here.
+
+def create_books(number_of_books, first=0):
+    test_author = Author.objects.create(first_name='John', last_name='Smith')
+    test_books = Book.objects.bulk_create([
+        Book(title=f'Book {book_number}', summary='My book summary ' * 10, isbn=str(book_number), author=test_author)
+        for book_number in range(first, first + number_of_books)
+    ])
+    BookInstance.objects.bulk_create([
+        BookInstance(book=test_book, imprint='Unlikely Imprint, 2016', status='a') for test_book in test_books
+    ])
+
+class ExportViewTest(QueryAuditMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        test_user1 = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        test_user2 = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        test_user2.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+        Language.objects.create(language_name='English')
+        create_books(5)
+
+    def test_redirect_if_not_logged_in(self):
+        response = self.client.get(reverse('export', args=['books', 'csv']))
+        self.assertEqual(response.status_code, 302)
+
+    def test_forbidden_without_permission(self):
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        response = self.client.get(reverse('export', args=['books', 'csv']))
+        self.assertEqual(response.status_code, 403)
+
+    def test_unknown_export(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        self.assertEqual(self.client.get(reverse('export', args=['secrets', 'csv'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('export', args=['books', 'xml'])).status_code, 404)
+
+    def test_books_csv(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('export', args=['books', 'csv']))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['title'], 'Book 0')
+        self.assertEqual(rows[0]['author_last_name'], 'Smith')
+
+    def test_bookinstances_jsonl_gzipped(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('export', args=['bookinstances', 'jsonl']), HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(
+            sorted(json.loads(line)['book_title'] for line in lines),
+            [f'Book {book_number}' for book_number in range(5)],
+        )
+
+    def test_gzip_refused_with_q0(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('export', args=['books', 'csv']), HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn(b'Book 0', b''.join(response.streaming_content))
+
+class AcceptsGzipTest(SimpleTestCase):
+    def test_accepts_gzip(self):
+        for header, accepted in (
+            ('gzip', True),
+            ('deflate, GZIP;q=0.5', True),
+            ('gzip;q=0', False),
+            ('gzip; q=0.0, deflate', False),
+            ('*', True),
+            ('*;q=0', False),
+            ('gzip;q=0, *', False),
+            ('br, deflate', False),
+            ('', False),
+        ):
+            with self.subTest(header=header):
+                self.assertEqual(accepts_gzip(header), accepted)
+
+class ExportCommandTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        create_books(3)
+
+    def test_export_books_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'books.csv.gz')
+            call_command('export_books', output=path, gzip=True)
+            with gzip.open(path, 'rt') as export:
+                self.assertEqual(len(list(csv.DictReader(export))), 3)
+
+    def test_export_bookinstances_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'copies.jsonl')
+            call_command('export_bookinstances', output=path, format='jsonl')
+            with open(path) as export:
+                self.assertEqual(json.loads(export.readline())['status'], 'a')
+
+class ExportMemoryTest(TestCase):
+    """ Exporting ten times more rows must not take (much) more memory. """
+
+    def peak_memory(self, name):
+        tracemalloc.start()
+        size = 0
+        for chunk in encode(render(name, 'csv'), compress=True):
+            size += len(chunk)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak, size
+
+    def test_memory_ceiling(self):
+        create_books(4000)
+        small_peak, small_size = self.peak_memory('books')
+
+        create_books(36000, first=4000)
+        large_peak, large_size = self.peak_memory('books')
+
+        self.assertGreater(large_size, small_size * 5)
+        # Bounded by the chunk size, not by the number of rows.
+        self.assertLess(large_peak, small_peak * 1.5)
+        self.assertLess(large_peak, 16 * 1024 * 1024)
@@ -0,0 +1,213 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog import facets
+from catalog.counters import recount_book_counters
+from catalog.facets import canonical_query, parse_filters, rebuild_facet_counts
+from catalog.models import Author, Book, BookInstance, FacetCount, Genre, Language
+from catalog.tests.query_audit import QueryAuditMixin
+
+# Create your tests here.
+
+def facet_counts():
+    """ The FacetCount table, without the values no book has. """
+    return {(row.facet, row.value): row.books for row in FacetCount.objects.filter(books__gt=0)}
+
+class FacetCountsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.mary = Author.objects.create(first_name='Mary', last_name='Shelley')
+        cls.percy = Author.objects.create(first_name='Percy', last_name='Shelley')
+        cls.english = Language.objects.create(language_name='English')
+        cls.horror = Genre.objects.create(name='Horror')
+        cls.romance = Genre.objects.create(name='Romance')
+
+        cls.frankenstein = Book.objects.create(
+            title='Frankenstein', summary='A monster.', isbn='1', author=cls.mary, language=cls.english,
+        )
+        cls.frankenstein.genre.add(cls.horror, cls.romance)
+        cls.last_man = Book.objects.create(title='The Last Man', summary='A plague.', isbn='2', author=cls.mary)
+        cls.last_man.genre.add(cls.horror)
+
+    def assertMatchesRebuild(self):
+        """ The counts kept by the receivers are those rebuild_facet_counts() computes. """
+        counts = facet_counts()
+        rebuild_facet_counts()
+        self.assertEqual(counts, facet_counts())
+
+    def test_counts(self):
+        self.assertEqual(facet_counts(), {
+            ('author', self.mary.pk): 2,
+            ('language', self.english.pk): 1,
+            ('genre', self.horror.pk): 2,
+            ('genre', self.romance.pk): 1,
+        })
+        self.assertMatchesRebuild()
+
+    def test_genre_changes(self):
+        # Removing a genre the book does not have changes nothing.
+        self.last_man.genre.remove(self.romance)
+        self.assertEqual(facet_counts()[('genre', self.romance.pk)], 1)
+
+        self.frankenstein.genre.remove(self.horror)
+        self.assertEqual(facet_counts()[('genre', self.horror.pk)], 1)
+        self.frankenstein.genre.clear()
+        self.assertNotIn(('genre', self.romance.pk), facet_counts())
+        self.assertMatchesRebuild()
+
+    def test_genre_changes_from_the_genre(self):
+        gothic = Genre.objects.create(name='Gothic')
+        gothic.book_set.add(self.frankenstein, self.last_man)
+        self.assertEqual(facet_counts()[('genre', gothic.pk)], 2)
+
+        self.horror.book_set.remove(self.frankenstein, self.frankenstein)
+        self.assertEqual(facet_counts()[('genre', self.horror.pk)], 1)
+        gothic.book_set.clear()
+        self.assertNotIn(('genre', gothic.pk), facet_counts())
+        self.assertMatchesRebuild()
+
+    def test_book_changes(self):
+        self.last_man.author = self.percy
+        self.last_man.language = self.english
+        self.last_man.save()
+        self.assertEqual(facet_counts()[('author', self.percy.pk)], 1)
+        self.assertEqual(facet_counts()[('language', self.english.pk)], 2)
+
+        # Saving again, or saving other fields, moves nothing.
+        self.last_man.save()
+        Book.objects.get(pk=self.frankenstein.pk).save(update_fields=['title'])
+        self.assertMatchesRebuild()
+
+        self.frankenstein.delete()
+        self.assertMatchesRebuild()
+        self.assertNotIn(('genre', self.romance.pk), facet_counts())
+
+    def test_deleted_values_lose_their_row(self):
+        self.romance.delete()
+        self.mary.delete()
+        self.assertFalse(FacetCount.objects.filter(facet='genre', value=self.romance.pk).exists())
+        self.assertFalse(FacetCount.objects.filter(facet='author', value=self.mary.pk).exists())
+        self.assertMatchesRebuild()
+
+    def test_availability(self):
+        copy = BookInstance.objects.create(book=self.frankenstein, imprint='Lackington', status='a')
+        BookInstance.objects.create(book=self.frankenstein, imprint='Lackington', status='a')
+        self.assertEqual(facet_counts()[facets.AVAILABLE], 1)
+
+        copy.status = 'o'
+        copy.save()
+        self.assertEqual(facet_counts()[facets.AVAILABLE], 1)
+        BookInstance.objects.filter(book=self.frankenstein, status='a').get().delete()
+        self.assertNotIn(facets.AVAILABLE, facet_counts())
+        self.assertMatchesRebuild()
+
+    def test_availability_after_a_bulk_update(self):
+        BookInstance.objects.create(book=self.frankenstein, imprint='Lackington', status='o')
+        BookInstance.objects.create(book=self.last_man, imprint='Colburn', status='o')
+
+        # update() sends no signals: recount_book_counters() keeps the facet up to date.
+        BookInstance.objects.update(status='a')
+        recount_book_counters()
+        self.assertEqual(facet_counts()[facets.AVAILABLE], 2)
+        self.assertMatchesRebuild()
+
+    def test_rebuild_command(self):
+        FacetCount.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_facets', stdout=out)
+        self.assertIn('Facet counts rebuilt.', out.getvalue())
+        self.assertEqual(facet_counts()[('author', self.mary.pk)], 2)
+
+class FilterTest(TestCase):
+    def test_parse_filters(self):
+        self.assertEqual(parse_filters({'genre': '3', 'author': '12', 'available': '1'}), {
+            'genre': 3, 'author': 12, 'available': 1,
+        })
+        self.assertEqual(parse_filters({'genre': 'x', 'language': '-1', 'available': '2', 'q': 'monster'}), {})
+
+    def test_canonical_query(self):
+        self.assertEqual(canonical_query({'available': 1, 'genre': 3}), 'genre=3&available=1')
+        self.assertEqual(canonical_query({'author': 2}, 'abc'), 'author=2&cursor=abc')
+        self.assertEqual(canonical_query({}), '')
+
+class FacetedBookListViewTest(QueryAuditMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.mary = Author.objects.create(first_name='Mary', last_name='Shelley')
+        cls.english = Language.objects.create(language_name='English')
+        cls.horror = Genre.objects.create(name='Horror')
+
+        cls.frankenstein = Book.objects.create(
+            title='Frankenstein', summary='A monster.', isbn='1', author=cls.mary, language=cls.english,
+        )
+        cls.frankenstein.genre.add(cls.horror)
+        BookInstance.objects.create(book=cls.frankenstein, imprint='Lackington', status='a')
+
+        for number in range(facets.TOP_VALUES + 2):
+            author = Author.objects.create(first_name=f'John {number}', last_name='Smith')
+            Book.objects.create(title=f'Book {number:02d}', summary='Summary', isbn=f'B{number}', author=author)
+        cls.john = author
+
+    def setUp(self):
+        # The pages and facet counts are cached.
+        cache.clear()
+
+    def titles(self, response):
+        return [book.title for book in response.context['book_list']]
+
+    def test_filters(self):
+        url = reverse('books')
+        self.assertEqual(self.titles(self.client.get(url, {'genre': self.horror.pk})), ['Frankenstein'])
+        self.assertEqual(self.titles(self.client.get(url, {'language': self.english.pk})), ['Frankenstein'])
+        self.assertEqual(self.titles(self.client.get(url, {'available': 1})), ['Frankenstein'])
+        self.assertEqual(self.titles(self.client.get(url, {'author': self.john.pk})), [f'Book {facets.TOP_VALUES + 1}'])
+
+        response = self.client.get(url, {'genre': Genre.objects.create(name='Romance').pk})
+        self.assertContains(response, 'No books match these filters.')
+
+    def test_other_query_strings_are_redirected(self):
+        url = reverse('books')
+        response = self.client.get(f'{url}?available=1&utm_source=mail&genre={self.horror.pk}')
+        self.assertRedirects(response, f'{url}?genre={self.horror.pk}&available=1', status_code=301)
+        self.assertRedirects(self.client.get(f'{url}?genre=&author=x'), url, status_code=301)
+
+    def test_facets(self):
+        response = self.client.get(reverse('books'), {'genre': self.horror.pk})
+        links = dict(response.context['facets'])
+
+        self.assertEqual(links['genre'], [
+            {'label': 'Horror', 'books': 1, 'selected': True, 'query': ''},
+        ])
+        self.assertEqual(links['available'], [
+            {'label': 'Available now', 'books': 1, 'selected': False, 'query': f'genre={self.horror.pk}&available=1'},
+        ])
+        self.assertEqual(len(links['author']), facets.TOP_VALUES)
+        # Authors with as many books are ordered by id.
+        self.assertEqual(links['author'][0]['label'], 'Shelley, Mary')
+
+    def test_chosen_value_outside_the_top_ones_is_listed(self):
+        response = self.client.get(reverse('books'), {'author': self.john.pk})
+        author_links = dict(response.context['facets'])['author']
+        self.assertEqual(len(author_links), facets.TOP_VALUES + 1)
+        self.assertEqual(author_links[0], {'label': str(self.john), 'books': 1, 'selected': True, 'query': ''})
+
+    def test_pages_are_cached_until_a_book_changes(self):
+        url = reverse('books')
+        filters = {'genre': self.horror.pk}
+        self.client.get(url, filters)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, filters)
+        self.assertFalse([query for query in queries if 'catalog_' in query['sql']])
+
+        book = Book.objects.get(title='Book 00')
+        book.genre.add(self.horror)
+        response = self.client.get(url, filters)
+        self.assertEqual(self.titles(response), ['Book 00', 'Frankenstein'])
+        self.assertEqual(dict(response.context['facets'])['genre'][0]['books'], 2)
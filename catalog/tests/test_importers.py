@@ -0,0 +1,161 @@
+import io
+import json
+import os
+import tempfile
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+
+from catalog.importers import CatalogImporter, read_csv, read_jsonl, read_marc
+from catalog.models import Author, Book, Genre, Language
+from catalog.search import search_books
+
+# Create your tests here.
+
+def marc_record(fields):
+    """ Builds a binary MARC 21 record from [(tag, data), ...]. """
+    directory, data = b'', b''
+    for tag, value in fields:
+        value = value.encode() + b'\x1e'
+        directory += f'{tag}{len(value):04d}{len(data):05d}'.encode()
+        data += value
+    base_address = 24 + len(directory) + 1
+    length = base_address + len(data) + 1
+    leader = f'{length:05d}nam a22{base_address:05d} a 4500'.encode()
+    return leader + directory + b'\x1e' + data + b'\x1d'
+
+CSV_INPUT = '''title,isbn,summary,author_first_name,author_last_name,language,genres
+Frankenstein,9780141439471,A monster.,Mary,Shelley,English,Horror;Gothic
+The Last Man,9780199552351,A plague.,Mary,Shelley,English,Science Fiction
+,9780000000000,No title.,,,,
+Dracula,9780141439846,A count.,Bram,Stoker,English,Horror
+'''
+
+class CatalogImporterTest(TestCase):
+    def setUp(self):
+        # The importer starts from the cached genres and languages, which
+        # are not rolled back between tests like the database is.
+        cache.clear()
+
+    def import_csv(self, text=CSV_INPUT, **kwargs):
+        return CatalogImporter(**kwargs).run(read_csv(io.BytesIO(text.encode())))
+
+    def test_imports_books(self):
+        result = self.import_csv()
+
+        self.assertEqual((result.created, result.updated, result.skipped), (3, 0, 1))
+        self.assertEqual(result.errors, [(3, 'missing title')])
+
+        frankenstein = Book.objects.get(isbn='9780141439471')
+        self.assertEqual(str(frankenstein.author), 'Shelley, Mary')
+        self.assertEqual(str(frankenstein.language), 'English')
+        self.assertEqual(sorted(str(genre) for genre in frankenstein.genre.all()), ['Gothic', 'Horror'])
+
+        # Lookups are shared, not duplicated.
+        self.assertEqual(Author.objects.count(), 2)
+        self.assertEqual(Language.objects.count(), 1)
+        self.assertEqual(Genre.objects.count(), 3)
+
+    def test_reuses_existing_lookups(self):
+        Author.objects.create(first_name='Mary', last_name='Shelley')
+        Genre.objects.create(name='Horror')
+        self.import_csv()
+        self.assertEqual(Author.objects.count(), 2)
+        self.assertEqual(Genre.objects.count(), 3)
+
+    def test_upserts_on_isbn(self):
+        self.import_csv()
+        result = self.import_csv(
+            'title,isbn,summary,author_first_name,author_last_name,language,genres\n'
+            'Frankenstein; or The Modern Prometheus,9780141439471,A new summary.,Mary,Shelley,English,Horror\n'
+            'Carmilla,9780000000001,A vampire.,Sheridan,Le Fanu,English,\n'
+        )
+        self.assertEqual((result.created, result.updated), (1, 1))
+        self.assertEqual(Book.objects.count(), 4)
+
+        frankenstein = Book.objects.get(isbn='9780141439471')
+        self.assertEqual(frankenstein.title, 'Frankenstein; or The Modern Prometheus')
+        self.assertEqual([str(genre) for genre in frankenstein.genre.all()], ['Horror'])
+
+    def test_without_genres_column_keeps_genres(self):
+        self.import_csv()
+        self.import_csv('title,isbn\nDracula,9780141439846\n')
+        self.assertEqual([str(genre) for genre in Book.objects.get(isbn='9780141439846').genre.all()], ['Horror'])
+
+    def test_batches(self):
+        progress = []
+        result = self.import_csv(batch_size=2, progress=lambda result: progress.append(result.imported))
+        self.assertEqual(progress, [2, 3])
+        self.assertEqual(result.created, 3)
+
+    def test_dry_run(self):
+        result = self.import_csv(dry_run=True, batch_size=2)
+        self.assertEqual(result.created, 3)
+        self.assertEqual(Book.objects.count(), 0)
+        self.assertEqual(Author.objects.count(), 0)
+
+    def test_imported_books_are_searchable(self):
+        self.import_csv()
+        self.assertEqual([book.title for book in search_books('stoker')], ['Dracula'])
+
+    def test_jsonl_and_marc(self):
+        with tempfile.TemporaryDirectory() as directory:
+            jsonl_path = os.path.join(directory, 'books.jsonl')
+            with open(jsonl_path, 'w') as jsonl:
+                jsonl.write(json.dumps({'title': 'Emma', 'isbn': 9780141439587, 'genres': ['Romance']}) + '\n')
+
+            marc_path = os.path.join(directory, 'books.mrc')
+            with open(marc_path, 'wb') as marc:
+                marc.write(marc_record([
+                    ('008', '040520s1818    enk           000 1 eng d'),
+                    ('020', '  \x1fa9780141439471 (pbk.)'),
+                    ('100', '1 \x1faShelley, Mary Wollstonecraft,'),
+                    ('245', '10\x1faFrankenstein :\x1fbor, The modern Prometheus /'),
+                    ('520', '  \x1faA scientist creates life.'),
+                    ('650', ' 0\x1faMonsters\x1fvFiction.'),
+                    ('655', ' 7\x1faHorror fiction.'),
+                ]))
+
+            output = io.StringIO()
+            call_command('import_catalog', jsonl_path, stdout=output, stderr=io.StringIO())
+            call_command('import_catalog', marc_path, stdout=output, stderr=io.StringIO())
+
+        self.assertIn('1 books created', output.getvalue())
+        self.assertEqual([str(genre) for genre in Book.objects.get(isbn='9780141439587').genre.all()], ['Romance'])
+
+        frankenstein = Book.objects.get(isbn='9780141439471')
+        self.assertEqual(frankenstein.title, 'Frankenstein : or, The modern Prometheus')
+        self.assertEqual((frankenstein.author.first_name, frankenstein.author.last_name), ('Mary Wollstonecraft', 'Shelley'))
+        self.assertEqual(str(frankenstein.language), 'English')
+        self.assertEqual(sorted(str(genre) for genre in frankenstein.genre.all()), ['Horror fiction', 'Monsters'])
+
+    def test_read_marc_stops_at_end(self):
+        records = list(read_marc(io.BytesIO(marc_record([('245', '10\x1faOne')]) + marc_record([('245', '10\x1faTwo')]))))
+        self.assertEqual([record['title'] for record in records], ['One', 'Two'])
+
+    def test_skips_undecodable_records(self):
+        jsonl = '\n'.join([
+            json.dumps({'title': 'Emma', 'isbn': '9780141439587', 'summary': 'A matchmaker.'}),
+            '{"title": "Persuasion", "isbn": ',
+            json.dumps({'title': 'Sanditon', 'isbn': '9780140431988', 'summary': 'A seaside town.'}),
+        ])
+        result = CatalogImporter().run(read_jsonl(io.BytesIO(jsonl.encode())))
+        self.assertEqual((result.created, result.skipped), (2, 1))
+        self.assertEqual([line for line, error in result.errors], [2])
+        self.assertTrue(result.errors[0][1].startswith('invalid JSON'))
+
+        # A bad directory entry: the next record is still read.
+        bad = bytearray(marc_record([('245', '10\x1faOne')]))
+        bad[27:31] = b'xxxx'
+        marc = bytes(bad) + marc_record([('245', '10\x1faTwo'), ('020', '  \x1fa9780000000002')])
+        result = CatalogImporter().run(read_marc(io.BytesIO(marc)))
+        self.assertEqual((result.created, result.skipped), (1, 1))
+        self.assertEqual(result.errors[0][0], 1)
+        self.assertTrue(Book.objects.filter(title='Two').exists())
+
+    def test_read_marc_stops_at_a_bad_leader(self):
+        marc = marc_record([('245', '10\x1faOne')]) + b'x' * 30 + marc_record([('245', '10\x1faTwo')])
+        records = list(read_marc(io.BytesIO(marc)))
+        self.assertEqual(records[0]['title'], 'One')
+        self.assertEqual([str(record) for record in records[1:]], ['invalid MARC leader, the rest of the file was not read'])
@@ -0,0 +1,425 @@
+import datetime
+import threading
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.contrib.messages import get_messages
+from django.db import DatabaseError, connection
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog import loans
+from catalog.models import Author, Book, BookInstance, Reservation
+from catalog.tests.query_audit import QueryAuditMixin
+
+# Create your tests here.
+
+class LoanServicesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        author = Author.objects.create(first_name='Mary', last_name='Shelley')
+        cls.book = Book.objects.create(title='Frankenstein', summary='A monster.', isbn='1', author=author)
+        cls.copy = BookInstance.objects.create(book=cls.book, imprint='Lackington', status='a')
+        cls.reader = User.objects.create_user(username='reader', password='1X<ISRUkw+tuK')
+        cls.other_reader = User.objects.create_user(username='other', password='2HJ1vRV0Z&3iD')
+
+    def test_checkout_and_return(self):
+        copy = loans.checkout(self.copy, self.reader)
+        self.assertEqual((copy.status, copy.borrower), ('o', self.reader))
+        self.assertEqual(copy.due_back, datetime.date.today() + loans.LOAN_PERIOD)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.copies_available, self.book.copies_on_loan), (0, 1))
+
+        copy = loans.return_(self.copy)
+        self.assertEqual((copy.status, copy.borrower, copy.due_back), ('a', None, None))
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.copies_available, self.book.copies_on_loan), (1, 0))
+
+    def test_checkout_uses_the_current_status(self):
+        # 'self.copy' still says the copy is available.
+        loans.checkout(BookInstance.objects.get(), self.other_reader)
+        with self.assertRaises(loans.LoanError):
+            loans.checkout(self.copy, self.reader)
+        self.assertEqual(BookInstance.objects.get().borrower, self.other_reader)
+
+    def test_return_needs_a_copy_on_loan(self):
+        with self.assertRaises(loans.LoanError):
+            loans.return_(self.copy)
+
+    def test_reserved_copy_is_lent_to_its_borrower_only(self):
+        copy = loans.reserve(self.book, self.reader)
+        self.assertEqual((copy.pk, copy.status, copy.borrower), (self.copy.pk, 'r', self.reader))
+
+        with self.assertRaises(loans.LoanError):
+            loans.checkout(copy, self.other_reader)
+        self.assertEqual(loans.checkout(copy, self.reader).status, 'o')
+
+    def test_reserve_without_an_available_copy_joins_the_queue(self):
+        BookInstance.objects.create(book=self.book, imprint='Colburn', status='m')
+        loans.reserve(self.book, self.reader)
+        reservation = loans.reserve(self.book, self.other_reader)
+        self.assertIsInstance(reservation, Reservation)
+        self.assertEqual((reservation.book, reservation.borrower), (self.book, self.other_reader))
+
+    def test_one_copy_of_a_book_per_borrower(self):
+        BookInstance.objects.create(book=self.book, imprint='Colburn', status='a')
+        loans.reserve(self.book, self.reader)
+        with self.assertRaises(loans.LoanError):
+            loans.reserve(self.book, self.reader)
+
+    def test_returned_copy_is_held_for_the_head_of_the_queue(self):
+        loans.checkout(self.copy, self.reader)
+        third_reader = User.objects.create_user(username='third')
+        first = loans.reserve(self.book, self.other_reader)
+        second = loans.reserve(self.book, third_reader)
+        self.assertEqual((loans.queue_position(first), loans.queue_position(second)), (1, 2))
+
+        copy = loans.return_(self.copy)
+        self.assertEqual((copy.status, copy.borrower), ('r', self.other_reader))
+        self.assertEqual(list(Reservation.objects.all()), [second])
+        self.assertEqual(loans.queue_position(second), 1)
+
+        loans.checkout(copy, self.other_reader)
+        self.assertEqual(loans.return_(copy).borrower, third_reader)
+        self.assertEqual(loans.return_(loans.checkout(copy, third_reader)).status, 'a')
+
+    def test_join_queue_once(self):
+        loans.checkout(self.copy, self.other_reader)
+        reservation = loans.reserve(self.book, self.reader)
+        self.assertEqual(loans.reserve(self.book, self.reader), reservation)
+        self.assertEqual(Reservation.objects.count(), 1)
+
+        # Lent the book anyway: they are no longer waiting.
+        loans.return_(self.copy)
+        loans.checkout(self.copy, self.reader)
+        self.assertFalse(Reservation.objects.exists())
+        with self.assertRaises(loans.LoanError):
+            loans.reserve(self.book, self.reader)
+
+    def test_available_copies_go_to_the_queue_first(self):
+        loans.checkout(self.copy, self.reader)
+        waiting = loans.reserve(self.book, self.other_reader)
+
+        # E.g. a new copy, or one back from maintenance.
+        new_copy = BookInstance.objects.create(book=self.book, imprint='Colburn', status='a')
+        third_reader = User.objects.create_user(username='third')
+        reservation = loans.reserve(self.book, third_reader)
+        self.assertEqual(loans.queue_position(reservation), 1)
+        self.assertFalse(Reservation.objects.filter(pk=waiting.pk).exists())
+        new_copy.refresh_from_db()
+        self.assertEqual((new_copy.status, new_copy.borrower), ('r', self.other_reader))
+
+    def test_expired_holds_pass_to_the_queue(self):
+        loans.reserve(self.book, self.reader)
+        loans.reserve(self.book, self.other_reader)
+
+        self.assertEqual(loans.release_expired_holds(), 0)
+        expired = datetime.date.today() + loans.HOLD_PERIOD + datetime.timedelta(days=1)
+        self.assertEqual(loans.release_expired_holds(today=expired), 1)
+        copy = BookInstance.objects.get()
+        self.assertEqual((copy.status, copy.borrower), ('r', self.other_reader))
+        self.assertFalse(Reservation.objects.exists())
+
+        self.assertEqual(loans.release_expired_holds(today=expired + loans.HOLD_PERIOD), 1)
+        copy.refresh_from_db()
+        self.assertEqual((copy.status, copy.borrower, copy.due_back), ('a', None, None))
+
+class LoanViewsTest(QueryAuditMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        author = Author.objects.create(first_name='Mary', last_name='Shelley')
+        cls.book = Book.objects.create(title='Frankenstein', summary='A monster.', isbn='1', author=author)
+        cls.copy = BookInstance.objects.create(book=cls.book, imprint='Lackington', status='a')
+        cls.reader = User.objects.create_user(username='reader', password='1X<ISRUkw+tuK')
+        cls.librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+        cls.librarian.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+
+    def test_checkout_needs_permission(self):
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('checkout-book-librarian', args=[self.copy.pk]))
+        self.assertEqual(response.status_code, 403)
+
+    def test_checkout(self):
+        self.client.force_login(self.librarian)
+        response = self.client.get(reverse('checkout-book-librarian', args=[self.copy.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'catalog/book_checkout_librarian.html')
+
+        due_back = datetime.date.today() + datetime.timedelta(weeks=2)
+        response = self.client.post(
+            reverse('checkout-book-librarian', args=[self.copy.pk]), {'borrower': 'reader', 'due_back': due_back},
+        )
+        self.assertRedirects(response, reverse('all-borrowed'))
+        copy = BookInstance.objects.get()
+        self.assertEqual((copy.status, copy.borrower, copy.due_back), ('o', self.reader, due_back))
+
+    def test_checkout_of_a_lent_copy_shows_an_error(self):
+        loans.checkout(self.copy, self.librarian)
+        self.client.force_login(self.librarian)
+        response = self.client.post(
+            reverse('checkout-book-librarian', args=[self.copy.pk]),
+            {'borrower': 'reader', 'due_back': datetime.date.today()},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(response.context['form'], None, 'This copy is not available.')
+        self.assertEqual(BookInstance.objects.get().borrower, self.librarian)
+
+    def test_checkout_form_is_prefilled_for_reserved_copies(self):
+        loans.reserve(self.book, self.reader)
+        self.client.force_login(self.librarian)
+        response = self.client.get(reverse('checkout-book-librarian', args=[self.copy.pk]))
+        self.assertEqual(response.context['form'].initial['borrower'], 'reader')
+
+    def test_return(self):
+        loans.checkout(self.copy, self.reader)
+        self.client.force_login(self.librarian)
+        url = reverse('return-book-librarian', args=[self.copy.pk])
+        self.assertEqual(self.client.get(url).status_code, 405)
+
+        response = self.client.post(url, follow=True)
+        self.assertRedirects(response, reverse('all-borrowed'))
+        self.assertContains(response, 'The copy was returned.')
+        self.assertEqual(BookInstance.objects.get().status, 'a')
+
+        response = self.client.post(url, follow=True)
+        self.assertContains(response, 'This copy is not on loan.')
+
+    def test_reserve(self):
+        url = reverse('reserve-book', args=[self.book.pk])
+        response = self.client.post(url)
+        self.assertRedirects(response, f"{reverse('login')}?next={url}")
+
+        self.client.force_login(self.reader)
+        response = self.client.post(url, follow=True)
+        self.assertRedirects(response, self.book.get_absolute_url())
+        self.assertContains(response, 'A copy is held for you until')
+        self.assertEqual(BookInstance.objects.get().borrower, self.reader)
+
+        response = self.client.post(url, follow=True)
+        self.assertContains(response, 'You already have a copy of this book.')
+
+    def test_reserve_without_copies_joins_the_queue(self):
+        loans.checkout(self.copy, self.librarian)
+        self.client.force_login(self.reader)
+        response = self.client.post(reverse('reserve-book', args=[self.book.pk]), follow=True)
+        self.assertContains(response, 'you are number 1 on the waiting list')
+        self.assertTrue(Reservation.objects.filter(book=self.book, borrower=self.reader).exists())
+
+    def test_queue_depths_use_one_query(self):
+        other_book = Book.objects.create(title='The Last Man', summary='A plague.', isbn='2')
+        loans.checkout(self.copy, self.librarian)
+        for number in range(3):
+            reader = User.objects.create_user(username=f'waiting{number}')
+            loans.reserve(other_book, reader)
+            if number:
+                loans.reserve(self.book, reader)
+
+        self.client.force_login(self.librarian)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('reservation-queues'))
+        self.assertEqual(
+            [(queue['book__title'], queue['queued']) for queue in response.context['queue_list']],
+            [('The Last Man', 3), ('Frankenstein', 2)],
+        )
+        self.assertEqual(len([query for query in queries if 'catalog_reservation' in query['sql']]), 1)
+
+# Run where SELECT ... FOR UPDATE locks rows (PostgreSQL): SQLite lets only
+# one transaction write at a time, so threads mostly fail with "database is
+# locked" there.
+
+@skipUnlessDBFeature('has_select_for_update_skip_locked')
+class ConcurrentLoansTest(TransactionTestCase):
+    THREADS = 20
+    # Reads outside transactions may go to a read replica (which mirrors the
+    # test database).
+    databases = {'default', *settings.CATALOG_READ_REPLICAS}
+
+    def setUp(self):
+        author = Author.objects.create(first_name='Mary', last_name='Shelley')
+        self.book = Book.objects.create(title='Frankenstein', summary='A monster.', isbn='1', author=author)
+        self.readers = [User.objects.create_user(username=f'reader{i}') for i in range(self.THREADS)]
+
+    def run_threads(self, target, args):
+        """ Runs target(arg) for each of 'args', each in its own thread, all at once; returns the errors. """
+        barrier = threading.Barrier(len(args))
+        errors = []
+
+        def run(arg):
+            try:
+                barrier.wait()
+                target(arg)
+            except loans.LoanError:
+                pass
+            except DatabaseError as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=[arg]) for arg in args]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def test_a_copy_is_lent_once(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Lackington', status='a')
+        copy.refresh_from_db()
+
+        self.assertEqual(self.run_threads(lambda reader: loans.checkout(copy, reader), self.readers), [])
+        self.assertEqual(BookInstance.objects.filter(status='o').count(), 1)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.copies_available, self.book.copies_on_loan), (0, 1))
+
+    def test_reservations_get_different_copies(self):
+        for _ in range(5):
+            BookInstance.objects.create(book=self.book, imprint='Lackington', status='a')
+
+        self.assertEqual(self.run_threads(lambda reader: loans.reserve(self.book, reader), self.readers), [])
+        reserved = BookInstance.objects.filter(status='r')
+        self.assertEqual(reserved.count(), 5)
+        self.assertEqual(len(set(reserved.values_list('borrower', flat=True))), 5)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.copies_total, self.book.copies_available), (5, 0))
+
+    def test_returned_copies_go_to_different_borrowers(self):
+        copies = [
+            loans.checkout(BookInstance.objects.create(book=self.book, imprint='Lackington', status='a'), reader)
+            for reader in self.readers[:5]
+        ]
+        for reader in self.readers[5:]:
+            loans.reserve(self.book, reader)
+
+        self.assertEqual(self.run_threads(loans.return_, copies), [])
+        self.assertEqual(
+            sorted(BookInstance.objects.values_list('status', 'borrower__username')),
+            [('r', f'reader{i}') for i in range(5, 10)],
+        )
+        self.assertEqual(Reservation.objects.count(), self.THREADS - 10)
+
+class BulkLoansTest(QueryAuditMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        author = Author.objects.create(first_name='Mary', last_name='Shelley')
+        cls.book = Book.objects.create(title='Frankenstein', summary='A monster.', isbn='1', author=author)
+        cls.queued_book = Book.objects.create(title='The Last Man', summary='A plague.', isbn='2', author=author)
+        cls.reader = User.objects.create_user(username='reader')
+        cls.librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+        cls.librarian.user_permissions.add(*Permission.objects.filter(codename__in=['can_mark_returned', 'can_renew']))
+
+        cls.today = datetime.date.today()
+        cls.on_loan = [
+            BookInstance.objects.create(
+                book=cls.book, imprint='Lackington', status='o', borrower=cls.reader,
+                due_back=cls.today + datetime.timedelta(days=days),
+            )
+            for days in (-2, 0, 1)
+        ]
+        cls.due_later = BookInstance.objects.create(
+            book=cls.book, imprint='Lackington', status='o', borrower=cls.reader,
+            due_back=cls.today + datetime.timedelta(weeks=4),
+        )
+        cls.available = BookInstance.objects.create(book=cls.book, imprint='Lackington', status='a')
+        cls.queued = BookInstance.objects.create(
+            book=cls.queued_book, imprint='Colburn', status='o', borrower=cls.reader, due_back=cls.today,
+        )
+        Reservation.objects.create(book=cls.queued_book, borrower=cls.librarian)
+
+    def ids(self, *copies):
+        return [copy.pk for copy in copies]
+
+    def test_renew_many_reports_what_it_cannot_renew(self):
+        missing = uuid.uuid4()
+        due_back = self.today + datetime.timedelta(weeks=3)
+
+        with CaptureQueriesContext(connection) as queries:
+            renewed, failures = loans.renew_many(self.ids(*self.on_loan, self.due_later, self.available) + [missing], due_back)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]), 1)
+
+        self.assertEqual(sorted(renewed), sorted(self.ids(*self.on_loan)))
+        self.assertEqual(failures, {
+            self.due_later.pk: 'This loan is already due later.',
+            self.available.pk: 'This copy is not on loan.',
+            missing: 'This copy no longer exists.',
+        })
+        self.assertEqual(set(BookInstance.objects.filter(pk__in=renewed).values_list('due_back', flat=True)), {due_back})
+        self.due_later.refresh_from_db()
+        self.assertEqual(self.due_later.due_back, self.today + datetime.timedelta(weeks=4))
+
+    def test_return_many(self):
+        returned, failures = loans.return_many(self.ids(*self.on_loan, self.available, self.queued))
+        self.assertEqual(sorted(returned), sorted(self.ids(*self.on_loan, self.queued)))
+        self.assertEqual(failures, {self.available.pk: 'This copy is not on loan.'})
+
+        self.assertEqual(BookInstance.objects.filter(book=self.book, status='a').count(), 4)
+        # The copy of the queued book is held for the queue.
+        self.queued.refresh_from_db()
+        self.assertEqual((self.queued.status, self.queued.borrower), ('r', self.librarian))
+
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.copies_available, self.book.copies_on_loan), (4, 1))
+
+    def test_bulk_view(self):
+        self.client.force_login(self.librarian)
+        url = reverse('bulk-loans-librarian')
+        due_back = self.today + datetime.timedelta(weeks=3)
+
+        response = self.client.post(url, {
+            'copies': self.ids(self.on_loan[0], self.due_later), 'action': 'renew', 'renewal_date': due_back,
+            'next': reverse('all-borrowed') + '?overdue=1',
+        }, follow=True)
+        self.assertRedirects(response, reverse('all-borrowed') + '?overdue=1')
+        self.assertContains(response, 'Renewed 1 loan.')
+        self.assertContains(response, f'{self.due_later.pk}: This loan is already due later.')
+
+        response = self.client.post(url, {'copies': self.ids(*self.on_loan), 'action': 'return'}, follow=True)
+        self.assertContains(response, 'Returned 3 copies.')
+        self.assertEqual(BookInstance.objects.filter(pk__in=self.ids(*self.on_loan), status='a').count(), 3)
+
+    def test_bulk_view_validates_the_form(self):
+        self.client.force_login(self.librarian)
+        url = reverse('bulk-loans-librarian')
+
+        response = self.client.post(url, {'action': 'return'}, follow=True)
+        self.assertContains(response, 'Select at least one book.')
+
+        response = self.client.post(url, {
+            'copies': self.ids(self.on_loan[0]), 'action': 'renew',
+            'renewal_date': self.today + datetime.timedelta(weeks=5),
+        }, follow=True)
+        self.assertContains(response, 'Invalid date - renewal more than 4 weeks ahead')
+        self.on_loan[0].refresh_from_db()
+        self.assertEqual(self.on_loan[0].due_back, self.today - datetime.timedelta(days=2))
+
+    def test_bulk_renew_needs_permission(self):
+        self.librarian.user_permissions.remove(Permission.objects.get(codename='can_renew'))
+        self.client.force_login(self.librarian)
+        response = self.client.post(reverse('bulk-loans-librarian'), {
+            'copies': self.ids(self.on_loan[0]), 'action': 'renew', 'renewal_date': self.today,
+        })
+        self.assertEqual(response.status_code, 403)
+
+    def test_admin_actions(self):
+        admin = User.objects.create_superuser(username='admin', password='3Jk&8wZq!pL0')
+        self.client.force_login(admin)
+        url = reverse('admin:catalog_bookinstance_changelist')
+        selected = self.ids(self.on_loan[0], self.available)
+
+        response = self.client.post(url, {'action': 'renew_selected', '_selected_action': selected})
+        self.assertTemplateUsed(response, 'admin/catalog/bookinstance/renew_selected.html')
+
+        due_back = self.today + datetime.timedelta(weeks=2)
+        response = self.client.post(url, {
+            'action': 'renew_selected', '_selected_action': selected, 'apply': 'Renew', 'renewal_date': due_back,
+        })
+        self.assertEqual(
+            [str(message) for message in get_messages(response.wsgi_request)],
+            ['Renewed 1 loan.', f'{self.available.pk}: This copy is not on loan.'],
+        )
+        self.on_loan[0].refresh_from_db()
+        self.assertEqual(self.on_loan[0].due_back, due_back)
+
+        response = self.client.post(url, {'action': 'return_selected', '_selected_action': selected})
+        self.assertIn('Returned 1 copy.', [str(message) for message in get_messages(response.wsgi_request)])
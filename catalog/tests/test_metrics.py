@@ -0,0 +1,95 @@
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from catalog import metrics
+from catalog.metrics import Histogram
+from catalog.models import Author, Book
+
+# Create your tests here.
+
+class HistogramTest(TestCase):
+    def test_buckets_are_cumulative(self):
+        histogram = Histogram((1, 5, 10))
+        for value in (0.5, 1, 3, 7, 50):
+            histogram.observe(value)
+
+        cumulative, total, count = histogram.snapshot()
+        self.assertEqual(cumulative, [(1, 2), (5, 3), (10, 4), (float('inf'), 5)])
+        self.assertEqual(total, 61.5)
+        self.assertEqual(count, 5)
+
+    def test_prometheus_format(self):
+        metrics.reset()
+        metrics.increment('catalog_requests_total', 'catalog:books')
+        metrics.observe('catalog_db_queries', 'catalog:books', 3)
+
+        text = metrics.render_prometheus()
+        self.assertIn('# TYPE catalog_db_queries histogram', text)
+        self.assertIn('catalog_requests_total{view="catalog:books"} 1', text)
+        self.assertIn('catalog_db_queries_bucket{view="catalog:books",le="2"} 0', text)
+        self.assertIn('catalog_db_queries_bucket{view="catalog:books",le="5"} 1', text)
+        self.assertIn('catalog_db_queries_bucket{view="catalog:books",le="+Inf"} 1', text)
+        self.assertIn('catalog_db_queries_sum{view="catalog:books"} 3', text)
+        self.assertIn('catalog_db_queries_count{view="catalog:books"} 1', text)
+
+@override_settings(CATALOG_METRICS_SAMPLE_RATE=1.0)
+class MetricsMiddlewareTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        test_author = Author.objects.create(first_name='John', last_name='Smith')
+        Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG', author=test_author)
+
+        test_user1 = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        test_user2 = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        test_user2.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+
+    def setUp(self):
+        metrics.reset()
+        # The book list caches its pages.
+        cache.clear()
+
+    def series(self, name, view):
+        return metrics._series[(name, view)].snapshot()
+
+    def test_records_view_queries_and_rendering(self):
+        self.client.get(reverse('books'))
+        self.client.get(reverse('books'))
+
+        self.assertEqual(metrics._counters[('catalog_requests_total', 'books')], 2)
+        for name in ('catalog_request_duration_seconds', 'catalog_db_queries',
+                     'catalog_db_duration_seconds', 'catalog_template_render_seconds'):
+            cumulative, total, count = self.series(name, 'books')
+            self.assertEqual(count, 2)
+
+        # The first request runs at least the page query and the facet counts
+        # (the second one reads them from the cache).
+        cumulative, total, count = self.series('catalog_db_queries', 'books')
+        self.assertGreaterEqual(total, 2)
+
+    @override_settings(CATALOG_METRICS_SAMPLE_RATE=0.0)
+    def test_unsampled_requests_are_only_counted(self):
+        self.client.get(reverse('books'))
+
+        self.assertEqual(metrics._counters[('catalog_requests_total', 'books')], 1)
+        self.assertEqual(metrics._series, {})
+
+    def test_unresolved_requests(self):
+        self.client.get('/no/such/page/')
+        self.assertEqual(metrics._counters[('catalog_requests_total', 'unresolved')], 1)
+
+    def test_metrics_view_permissions(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 302)
+
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+    def test_metrics_view(self):
+        self.client.get(reverse('books'))
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('catalog_request_duration_seconds_count{view="books"} 1', response.content.decode())
@@ -1,6 +1,8 @@
+from django.db import connection, transaction
+from django.db.models import F
 from django.test import TestCase
 
-from catalog.models import Author
+from catalog.models import Author, Book, BookInstance
 
 # Create your tests here.
 
@@ -33,4 +35,39 @@ class AuthorModelTest(TestCase):
     def test_get_absolute_url(self):
         author = Author.objects.get(id=1)
         # This will also fail if the urlconf is not defined.
-        self.assertEqual(author.get_absolute_url(), '/catalog/author/1')
\ No newline at end of file
+        self.assertEqual(author.get_absolute_url(), '/catalog/author/1')
+
+class IndexUsageTest(TestCase):
+    """ Checks (with EXPLAIN) that the list view queries are served by an index. """
+
+    def assertUsesIndex(self, queryset, index_name):
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # The test tables are tiny, so make sequential scans unattractive.
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+
+        self.assertIn(index_name, plan)
+        if connection.vendor == 'sqlite':
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_all_borrowed_list(self):
+        queryset = (
+            BookInstance.objects.filter(status__exact='o')
+            .order_by(F('due_back').asc(nulls_last=True), 'pk')[:11]
+        )
+        self.assertUsesIndex(queryset, 'bookinstance_')
+
+    def test_borrowed_by_user_list(self):
+        queryset = (
+            BookInstance.objects.filter(borrower=1, status__exact='o')
+            .order_by(F('due_back').asc(nulls_last=True), 'pk')[:11]
+        )
+        self.assertUsesIndex(queryset, 'bookinstance_borrower_idx')
+
+    def test_author_list(self):
+        self.assertUsesIndex(Author.objects.order_by('last_name', 'first_name', 'pk')[:11], 'author_name_idx')
+
+    def test_book_list(self):
+        self.assertUsesIndex(Book.objects.order_by('title', 'pk')[:11], 'book_title_idx')
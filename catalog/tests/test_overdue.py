@@ -0,0 +1,127 @@
+import datetime
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
+
+from django.contrib.auth.models import Permission, User
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.models import Author, Book, BookInstance
+from catalog.overdue import process_overdue
+from catalog.tests.query_audit import QueryAuditMixin
+
+# Create your tests here.
+
+class ProcessOverdueTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        author = Author.objects.create(first_name='Mary', last_name='Shelley')
+        frankenstein = Book.objects.create(title='Frankenstein', summary='A monster.', isbn='1', author=author)
+        last_man = Book.objects.create(title='The Last Man', summary='A plague.', isbn='2', author=author)
+        cls.reader = User.objects.create_user(username='reader', email='reader@example.com')
+        cls.other_reader = User.objects.create_user(username='other', email='other@example.com')
+        no_email = User.objects.create_user(username='noemail')
+
+        cls.today = datetime.date.today()
+        last_week = cls.today - datetime.timedelta(weeks=1)
+        for book, borrower, due_back, status in (
+            (frankenstein, cls.reader, last_week, 'o'),
+            (last_man, cls.reader, cls.today - datetime.timedelta(days=1), 'o'),
+            (last_man, cls.other_reader, last_week, 'o'),
+            (frankenstein, no_email, last_week, 'o'),
+            # Not overdue.
+            (frankenstein, cls.other_reader, cls.today, 'o'),
+            (last_man, cls.reader, last_week, 'r'),
+        ):
+            BookInstance.objects.create(
+                book=book, imprint='Lackington', borrower=borrower, due_back=due_back, status=status,
+            )
+
+    def test_one_notice_per_borrower(self):
+        self.assertEqual(process_overdue(), (4, 2))
+
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['other@example.com', 'reader@example.com'])
+        notice = next(message for message in mail.outbox if message.to == ['reader@example.com'])
+        self.assertEqual(notice.subject, 'LocalLibrary: 2 overdue books')
+        self.assertIn('Frankenstein', notice.body)
+        self.assertIn('The Last Man', notice.body)
+
+        self.assertEqual(BookInstance.objects.filter(overdue_notice=self.today).count(), 4)
+
+    def test_one_query_finds_the_overdue_loans(self):
+        with CaptureQueriesContext(connection) as queries:
+            process_overdue()
+        # Then one batch: lock its loans, mark them.
+        statements = [query['sql'] for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 3)
+        self.assertTrue(statements[2].startswith('UPDATE'))
+
+    def test_running_again_sends_nothing(self):
+        process_overdue()
+        mail.outbox.clear()
+        self.assertEqual(process_overdue(), (0, 0))
+        self.assertEqual(mail.outbox, [])
+
+    def test_loans_overdue_again_get_a_new_notice(self):
+        process_overdue()
+        mail.outbox.clear()
+
+        # Renewed, then overdue again a month later.
+        loan = BookInstance.objects.get(borrower=self.other_reader, due_back__lt=self.today)
+        loan.due_back = self.today + datetime.timedelta(weeks=2)
+        loan.save()
+        # With their loan that was due today.
+        self.assertEqual(process_overdue(today=self.today + datetime.timedelta(weeks=4)), (2, 1))
+
+    def test_resumes_after_a_failed_batch(self):
+        real_get_connection = mail.get_connection
+
+        def failing_second_batch(*args, **kwargs):
+            connection = real_get_connection(*args, **kwargs)
+            if len(mail.outbox):
+                connection.send_messages = mock.Mock(side_effect=SMTPException)
+            return connection
+
+        with mock.patch('catalog.overdue.get_connection', failing_second_batch):
+            with self.assertRaises(SMTPException):
+                process_overdue(batch_size=1)
+        self.assertEqual(len(mail.outbox), 1)
+
+        # The first batch is not sent again.
+        self.assertEqual(process_overdue(batch_size=1)[1], 1)
+        self.assertEqual(len({message.to[0] for message in mail.outbox}), 2)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('process_overdue', stdout=out)
+        self.assertIn('Noticed 4 overdue loans, sent 2 notices.', out.getvalue())
+        self.assertIn('Released 1 expired holds.', out.getvalue())
+
+class OverdueFilterTest(QueryAuditMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        book = Book.objects.create(title='Frankenstein', summary='A monster.', isbn='1')
+        cls.librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+        cls.librarian.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+
+        today = datetime.date.today()
+        for days in (-3, -1, 0, 5):
+            BookInstance.objects.create(
+                book=book, imprint='Lackington', borrower=cls.librarian, status='o',
+                due_back=today + datetime.timedelta(days=days),
+            )
+
+    def test_overdue_only(self):
+        self.client.force_login(self.librarian)
+        response = self.client.get(reverse('all-borrowed'))
+        self.assertEqual(len(response.context['bookinstance_list']), 4)
+
+        response = self.client.get(reverse('all-borrowed'), {'overdue': '1'})
+        self.assertTrue(response.context['overdue_only'])
+        self.assertEqual(len(response.context['bookinstance_list']), 2)
+        self.assertTrue(all(copy.is_overdue for copy in response.context['bookinstance_list']))
@@ -0,0 +1,211 @@
+import datetime
+from unittest import mock, skipIf, skipUnless
+
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import cache
+from django.core.paginator import EmptyPage
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from catalog.models import Author, Book, BookInstance
+from catalog.pagination import (
+    CursorPaginator, EstimatedCountPaginator, InvalidCursor, estimate_count, is_unfiltered, table_estimate,
+)
+from catalog.views import BookListView
+
+# Create your tests here.
+
+class CursorPaginatorTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        test_book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG')
+
+        # 25 copies sharing 5 due dates, plus 3 without a due date.
+        for book_copy in range(28):
+            due_back = datetime.date(2030, 1, 1) + datetime.timedelta(days=book_copy % 5) if book_copy < 25 else None
+            BookInstance.objects.create(book=test_book, imprint='Unlikely Imprint, 2016', due_back=due_back, status='o')
+
+        cls.expected = list(BookInstance.objects.order_by('due_back', 'pk'))
+        # SQLite sorts NULLs first, the paginator sorts them last.
+        cls.expected = [copy for copy in cls.expected if copy.due_back] + [copy for copy in cls.expected if not copy.due_back]
+
+    def paginator(self):
+        return CursorPaginator(BookInstance.objects.all(), ('due_back', 'pk'), 10)
+
+    def test_walks_forward_over_all_rows_once(self):
+        paginator = self.paginator()
+        rows = []
+        page = paginator.page()
+        rows.extend(page)
+
+        while page.has_next():
+            page = paginator.page(page.next_cursor)
+            rows.extend(page)
+
+        self.assertEqual(rows, self.expected)
+        self.assertEqual(len(page), 8)
+        self.assertFalse(page.has_next())
+
+    def test_walks_backward(self):
+        paginator = self.paginator()
+        first_page = paginator.page()
+        second_page = paginator.page(first_page.next_cursor)
+        third_page = paginator.page(second_page.next_cursor)
+
+        self.assertFalse(first_page.has_previous())
+        self.assertTrue(third_page.has_previous())
+
+        previous_page = paginator.page(third_page.previous_cursor)
+        self.assertEqual(list(previous_page), list(second_page))
+        self.assertTrue(previous_page.has_next())
+
+        previous_page = paginator.page(previous_page.previous_cursor)
+        self.assertEqual(list(previous_page), list(first_page))
+        self.assertFalse(previous_page.has_previous())
+
+    def test_tampered_cursor_is_rejected(self):
+        paginator = self.paginator()
+        cursor = paginator.page().next_cursor
+
+        with self.assertRaises(InvalidCursor):
+            paginator.page(cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B'))
+        with self.assertRaises(InvalidCursor):
+            paginator.page('not-a-cursor')
+
+    def test_cursor_of_another_list_is_rejected(self):
+        Book.objects.create(title='Another Title', summary='My book summary', isbn='HIJKLMN')
+        cursor = CursorPaginator(Book.objects.all(), ('title', 'pk'), 1).page().next_cursor
+        with self.assertRaises(InvalidCursor):
+            self.paginator().page(cursor)
+
+    def test_cursor_with_invalid_values_is_rejected(self):
+        paginator = self.paginator()
+        cursor = signing.dumps({'d': 'next', 'v': ['B09', '1'], 'n': [False, False]}, salt=paginator.cursor_salt)
+        with self.assertRaises(InvalidCursor):
+            paginator.page(cursor)
+
+    def test_single_page(self):
+        page = CursorPaginator(BookInstance.objects.all(), ('due_back', 'pk'), 50).page()
+        self.assertEqual(len(page), 28)
+        self.assertFalse(page.has_other_pages())
+
+class CursorPaginationMixinTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        for book_number in range(15):
+            Book.objects.create(title=f'Book {book_number:02d}', summary='Summary', isbn=str(book_number), author=cls.author)
+
+    def setUp(self):
+        # BookListView caches its pages.
+        cache.clear()
+
+    def test_book_list_is_ordered_by_title(self):
+        response = self.client.get(reverse('books'))
+        titles = [book.title for book in response.context['book_list']]
+        self.assertEqual(titles, [f'Book {book_number:02d}' for book_number in range(10)])
+
+    def test_links_keep_other_query_parameters(self):
+        author = f'author={self.author.pk}'
+        response = self.client.get(reverse('books') + '?' + author)
+        next_querystring = response.context['page_obj'].next_querystring
+        self.assertIn(author, next_querystring)
+
+        response = self.client.get(reverse('books') + next_querystring)
+        self.assertEqual(len(response.context['book_list']), 5)
+        self.assertIn(author, response.context['page_obj'].previous_querystring)
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get(reverse('books') + '?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_of_another_view_is_404(self):
+        cursor = self.client.get(reverse('books')).context['page_obj'].next_cursor
+        self.client.force_login(User.objects.create_user(username='borrower'))
+        response = self.client.get(reverse('my-borrowed'), {'cursor': cursor})
+        self.assertEqual(response.status_code, 404)
+
+    def test_no_count_query(self):
+        response = self.client.get(reverse('books'))
+        self.assertIsNone(response.context['page_obj'].estimated_count)
+
+    def test_estimated_total(self):
+        view = BookListView(paginate_estimate_total=True)
+        view.setup(RequestFactory().get(reverse('books')))
+        paginator, page, object_list, is_paginated = view.paginate_queryset(Book.objects.all(), 10)
+        self.assertEqual(page.estimated_count, 15)
+        self.assertTrue(is_paginated)
+
+class EstimatedCountPaginatorTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        for number in range(25):
+            Book.objects.create(title=f'Book {number:02d}', summary='Summary', isbn=str(number))
+
+    def setUp(self):
+        # Cached counts.
+        cache.clear()
+
+    def paginator(self, **attributes):
+        paginator = EstimatedCountPaginator(Book.objects.order_by('title'), 10)
+        for name, value in attributes.items():
+            setattr(paginator, name, value)
+        return paginator
+
+    def test_exact_count_without_an_estimate(self):
+        with mock.patch.object(EstimatedCountPaginator, 'estimate', return_value=None):
+            paginator = self.paginator()
+            self.assertEqual(paginator.count, 25)
+            self.assertFalse(paginator.estimated)
+
+    def test_exact_count_below_the_threshold(self):
+        with mock.patch.object(EstimatedCountPaginator, 'estimate', return_value=100):
+            self.assertEqual(self.paginator().count, 25)
+
+    def test_estimated_count(self):
+        with mock.patch.object(EstimatedCountPaginator, 'estimate', return_value=15):
+            paginator = self.paginator(exact_below=10)
+            with self.assertNumQueries(0):
+                self.assertEqual(paginator.count, 15)
+            self.assertTrue(paginator.estimated)
+            self.assertEqual(paginator.num_pages, 2)
+
+            # Pages past the estimate are served while they have rows.
+            self.assertEqual([book.title for book in paginator.page(3)], ['Book 20', 'Book 21', 'Book 22', 'Book 23', 'Book 24'])
+            with self.assertRaises(EmptyPage):
+                paginator.page(4)
+
+    def test_cached_count(self):
+        with mock.patch.object(EstimatedCountPaginator, 'estimate', return_value=15):
+            self.assertEqual(self.paginator(exact_below=10, count_timeout=60).count, 25)
+
+            Book.objects.create(title='Book 25', summary='Summary', isbn='25')
+            with self.assertNumQueries(0):
+                self.assertEqual(self.paginator(exact_below=10, count_timeout=60).count, 25)
+
+            # Another queryset has its own count.
+            paginator = EstimatedCountPaginator(Book.objects.filter(title__startswith='Book 2').order_by('pk'), 10)
+            paginator.exact_below, paginator.count_timeout = 10, 60
+            self.assertEqual(paginator.count, 6)
+
+    def test_is_unfiltered(self):
+        self.assertTrue(is_unfiltered(Book.objects.select_related('author').order_by('title')))
+        self.assertFalse(is_unfiltered(Book.objects.filter(title='Book 01')))
+        self.assertFalse(is_unfiltered(Book.objects.none()))
+        self.assertFalse(is_unfiltered(Book.objects.all()[:5]))
+
+    @skipIf(connection.vendor == 'postgresql', 'PostgreSQL has estimates.')
+    def test_no_estimates(self):
+        self.assertIsNone(table_estimate(Book, 'default'))
+        self.assertIsNone(self.paginator().estimate())
+        self.assertEqual(estimate_count(Book.objects.all()), 25)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Counts are exact on other databases.')
+    def test_estimates(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE catalog_book')
+        self.assertEqual(table_estimate(Book, 'default'), 25)
+        with self.assertNumQueries(1):
+            self.assertEqual(estimate_count(Book.objects.all()), 25)
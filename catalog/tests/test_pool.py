@@ -0,0 +1,192 @@
+import threading
+from unittest import mock, skipUnless
+
+from django.db import OperationalError, connection, connections
+from django.test import SimpleTestCase, TestCase
+from psycopg2 import extensions
+
+from catalog.backends.postgresql.base import PostgreSQLPool
+from catalog.backends.postgresql.pool import ConnectionPool, PoolTimeout
+
+# Create your tests here.
+
+def run_in_thread(func):
+    """ Calls func() in a new thread, and returns its result. """
+    result = []
+    thread = threading.Thread(target=lambda: result.append(func()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class FakePool(ConnectionPool):
+    def __init__(self, **options):
+        options.setdefault('max_size', 2)
+        super().__init__(**options)
+        self.broken = set()
+
+    def getconn(self, connect=FakeConnection):
+        return super().getconn(connect)
+
+    def check(self, connection):
+        return connection not in self.broken
+
+class ConnectionPoolTest(SimpleTestCase):
+    def test_connections_are_reused(self):
+        pool = FakePool()
+        first = pool.getconn()
+        second = pool.getconn()
+        pool.putconn(first)
+        pool.putconn(second)
+
+        # The most recently returned first.
+        self.assertIs(pool.getconn(), second)
+        self.assertIs(pool.getconn(), first)
+        self.assertEqual(pool.opened, 2)
+
+    def test_waits_for_a_free_connection(self):
+        pool = FakePool(max_size=1, timeout=5)
+        taken = pool.getconn()
+        threading.Timer(0.05, pool.putconn, [taken]).start()
+        self.assertIs(pool.getconn(), taken)
+
+    def test_timeout(self):
+        pool = FakePool(max_size=1, timeout=0.01)
+        pool.getconn()
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+
+    def test_broken_connections_are_replaced(self):
+        pool = FakePool()
+        broken = pool.getconn()
+        pool.putconn(broken)
+        pool.broken.add(broken)
+
+        self.assertIsNot(pool.getconn(), broken)
+        self.assertTrue(broken.closed)
+        self.assertEqual(pool.size, 1)
+
+    def test_connections_that_cannot_be_reset_are_closed(self):
+        pool = FakePool()
+        taken = pool.getconn()
+        with mock.patch.object(FakePool, 'reset', return_value=False):
+            pool.putconn(taken)
+        self.assertTrue(taken.closed)
+        self.assertEqual(pool.size, 0)
+
+    def test_idle_and_old_connections_are_closed(self):
+        pool = FakePool(max_idle=60, max_lifetime=3600)
+        with mock.patch('time.monotonic', return_value=1000):
+            idle = pool.getconn()
+            old = pool.getconn()
+            pool.putconn(idle)
+        with mock.patch('time.monotonic', return_value=1100):
+            self.assertIsNot(pool.getconn(), idle)
+            self.assertTrue(idle.closed)
+        with mock.patch('time.monotonic', return_value=5000):
+            pool.putconn(old)
+        self.assertTrue(old.closed)
+
+    def test_failed_connect_frees_its_place(self):
+        pool = FakePool(max_size=1, timeout=0.01)
+        with self.assertRaises(OSError):
+            pool.getconn(mock.Mock(side_effect=OSError))
+        self.assertIsNotNone(pool.getconn())
+
+    def test_concurrent_use(self):
+        pool = FakePool(max_size=3, timeout=5)
+        errors = []
+
+        def use():
+            try:
+                for _ in range(50):
+                    pool.putconn(pool.getconn())
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=use) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertLessEqual(pool.peak, 3)
+        self.assertLessEqual(pool.opened, 3)
+
+    def test_expired_connections_are_closed_without_the_lock(self):
+        pool = FakePool(max_idle=60)
+        with mock.patch('time.monotonic', return_value=1000):
+            idle = pool.getconn()
+            pool.putconn(idle)
+
+        def close(connection):
+            # Another thread can take the lock meanwhile.
+            def take_lock():
+                if pool._condition.acquire(timeout=1):
+                    pool._condition.release()
+                    return True
+                return False
+            self.assertTrue(run_in_thread(take_lock))
+            connection.closed = True
+
+        with mock.patch('time.monotonic', return_value=1100), mock.patch.object(pool, 'close', side_effect=close):
+            self.assertIsNot(pool.getconn(), idle)
+        self.assertTrue(idle.closed)
+
+    def test_closeall(self):
+        pool = FakePool()
+        taken = pool.getconn()
+        pool.putconn(taken)
+        pool.closeall()
+        self.assertTrue(taken.closed)
+        self.assertEqual(pool.size, 0)
+
+@skipUnless(connection.settings_dict['ENGINE'] == 'catalog.backends.postgresql', 'The pooled backend is not in use.')
+class PooledBackendTest(TestCase):
+    def in_thread(self, func):
+        """ Calls func() in a new thread, which has connections of its own. """
+        return run_in_thread(func)
+
+    def backend_pid(self):
+        with connections['default'].cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            pid = cursor.fetchone()[0]
+        connections['default'].close()
+        return pid
+
+    def test_closed_connections_are_reused(self):
+        self.assertEqual(self.in_thread(self.backend_pid), self.in_thread(self.backend_pid))
+
+    def test_rolled_back_when_returned(self):
+        def leave_transaction_open():
+            db = connections['default']
+            db.set_autocommit(False)
+            with db.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            db.close()
+
+        def transaction_status():
+            db = connections['default']
+            db.ensure_connection()
+            status = db.connection.get_transaction_status()
+            db.close()
+            return status
+
+        self.in_thread(leave_transaction_open)
+        self.assertEqual(self.in_thread(transaction_status), extensions.TRANSACTION_STATUS_IDLE)
+
+    def test_pool_timeout(self):
+        def connect():
+            with mock.patch.object(PostgreSQLPool, 'getconn', side_effect=PoolTimeout('No database connection was free.')):
+                with self.assertRaisesMessage(OperationalError, 'No database connection was free.'):
+                    connections['default'].ensure_connection()
+            return True
+
+        self.assertTrue(self.in_thread(connect))
@@ -0,0 +1,49 @@
+from django.template import Context, Template
+from django.test import TestCase
+
+from catalog.models import Author, Book
+from catalog.tests.query_audit import QueryAuditor, fingerprint
+
+# Create your tests here.
+
+class FingerprintTest(TestCase):
+    def test_literals_and_in_lists_are_normalized(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM book WHERE id = 12 AND title = \'It\'\'s\''),
+            fingerprint('SELECT *  FROM book\nWHERE id = 7 AND title = \'Dune\''),
+        )
+        self.assertEqual(
+            fingerprint('SELECT * FROM book WHERE id IN (%s, %s, %s)'),
+            fingerprint('SELECT * FROM book WHERE id IN (%s)'),
+        )
+        self.assertNotEqual(
+            fingerprint('SELECT * FROM book WHERE id = %s'),
+            fingerprint('SELECT * FROM author WHERE id = %s'),
+        )
+
+class QueryAuditorTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        for number in range(3):
+            test_author = Author.objects.create(first_name='John', last_name=f'Smith {number}')
+            Book.objects.create(title=f'Book {number}', summary='Summary', isbn=str(number), author=test_author)
+
+    def test_reports_repeated_queries_with_template_line(self):
+        template = Template('{% for book in books %}\n{{ book.author }}\n{% endfor %}')
+
+        with QueryAuditor() as audit:
+            template.render(Context({'books': Book.objects.all()}))
+
+        with self.assertRaises(AssertionError) as raised:
+            audit.assert_no_repeats()
+        self.assertIn('3 x SELECT', str(raised.exception))
+        self.assertIn('line 2: book.author', str(raised.exception))
+
+    def test_select_related_passes(self):
+        template = Template('{% for book in books %}\n{{ book.author }}\n{% endfor %}')
+
+        with QueryAuditor() as audit:
+            template.render(Context({'books': Book.objects.select_related('author')}))
+
+        audit.assert_no_repeats()
+        self.assertEqual(sum(len(runs) for runs in audit.queries.values()), 1)
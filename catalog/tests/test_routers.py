@@ -0,0 +1,135 @@
+from unittest import skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.middleware import ReplicaPinningMiddleware
+from catalog.models import Author, Book, PageVisits
+from catalog.routers import ReplicaRouter, start_request, use_primary
+
+# Create your tests here.
+
+REPLICAS = ['replica_1', 'replica_2']
+
+@override_settings(CATALOG_READ_REPLICAS=REPLICAS, CATALOG_REPLICA_PIN_SECONDS=10)
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        start_request()
+
+    def test_catalog_reads_go_to_one_replica(self):
+        replica = self.router.db_for_read(Book)
+        self.assertIn(replica, REPLICAS)
+        self.assertEqual({self.router.db_for_read(Author) for _ in range(20)}, {replica})
+
+        # Other apps' models (users, sessions) are read from the primary.
+        self.assertEqual(self.router.db_for_read(User), 'default')
+
+    def test_writes_pin_reads_to_the_primary(self):
+        self.assertEqual(self.router.db_for_write(Book), 'default')
+        self.assertEqual(self.router.db_for_read(Book), 'default')
+
+        # Until the next request.
+        start_request()
+        self.assertIn(self.router.db_for_read(Book), REPLICAS)
+
+    def test_bookkeeping_writes_do_not_pin(self):
+        for model in (PageVisits, User, Session):
+            self.assertEqual(self.router.db_for_write(model), 'default')
+        self.assertIn(self.router.db_for_read(Book), REPLICAS)
+
+    def test_pinned_request(self):
+        start_request(pinned=True)
+        self.assertEqual(self.router.db_for_read(Book), 'default')
+
+    def test_use_primary(self):
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(Book), 'default')
+        self.assertIn(self.router.db_for_read(Book), REPLICAS)
+
+        with use_primary():
+            self.router.db_for_write(Book)
+        self.assertEqual(self.router.db_for_read(Book), 'default')
+
+    def test_related_objects_are_read_where_their_instance_was(self):
+        book = Book(title='Frankenstein')
+        book._state.db = 'default'
+        self.assertEqual(self.router.db_for_read(Author, instance=book), 'default')
+
+    def test_migrations_only_run_on_the_primary(self):
+        self.assertIsNone(self.router.allow_migrate('default', 'catalog'))
+        self.assertFalse(self.router.allow_migrate('replica_1', 'catalog'))
+
+    def test_pinning_middleware(self):
+        factory = RequestFactory()
+
+        def view(write):
+            def get_response(request):
+                if write:
+                    self.router.db_for_write(Book)
+                return HttpResponse(self.router.db_for_read(Book))
+            return ReplicaPinningMiddleware(get_response)
+
+        response = view(write=False)(factory.get('/'))
+        self.assertIn(response.content.decode(), REPLICAS)
+        self.assertNotIn('primary_pin', response.cookies)
+
+        response = view(write=True)(factory.post('/'))
+        self.assertEqual(response.content, b'default')
+        self.assertEqual(response.cookies['primary_pin']['max-age'], 10)
+
+        # Later requests of the same client read from the primary.
+        request = factory.get('/')
+        request.COOKIES['primary_pin'] = '1'
+        self.assertEqual(view(write=False)(request).content, b'default')
+
+class TransactionRoutingTest(TestCase):
+    @override_settings(CATALOG_READ_REPLICAS=REPLICAS)
+    def test_reads_in_a_transaction_go_to_the_primary(self):
+        # TestCase runs each test in a transaction.
+        start_request()
+        self.assertEqual(ReplicaRouter().db_for_read(Book), 'default')
+
+@skipUnless(settings.CATALOG_READ_REPLICAS, 'Set DATABASE_REPLICA_URLS, e.g. to sqlite:///db-replica.sqlite3.')
+class ReplicaViewsTest(TransactionTestCase):
+    """ The views with a read replica configured (which mirrors the test database). """
+    databases = {'default', *settings.CATALOG_READ_REPLICAS}
+
+    def setUp(self):
+        cache.clear()
+        Author.objects.create(first_name='Mary', last_name='Shelley')
+        self.librarian = User.objects.create_user(username='librarian')
+        self.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+
+    def catalog_queries(self, alias, response_func):
+        with CaptureQueriesContext(connections[alias]) as queries:
+            response_func()
+        return [query for query in queries if 'catalog_' in query['sql']]
+
+    def test_reads_go_to_the_replica_until_the_client_writes(self):
+        replica = settings.CATALOG_READ_REPLICAS[0]
+        self.client.force_login(self.librarian)
+        url = reverse('authors')
+
+        self.assertTrue(self.catalog_queries(replica, lambda: self.client.get(url)))
+        self.assertFalse(self.catalog_queries('default', lambda: self.client.get(url)))
+
+        response = self.client.post(reverse('author-create'), {'first_name': 'Percy', 'last_name': 'Shelley'})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('primary_pin', response.cookies)
+
+        self.assertTrue(self.catalog_queries('default', lambda: self.client.get(url)))
+        self.assertFalse(self.catalog_queries(replica, lambda: self.client.get(url)))
+
+    def test_cached_values_are_computed_on_the_primary(self):
+        replica = settings.CATALOG_READ_REPLICAS[0]
+        with CaptureQueriesContext(connections[replica]) as queries:
+            self.client.get(reverse('books'))
+        self.assertFalse([query for query in queries if 'catalog_book' in query['sql']])
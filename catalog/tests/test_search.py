@@ -0,0 +1,138 @@
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog.models import Author, Book, Genre
+from catalog.pagination import EstimatedCountPaginator
+from catalog.search import rebuild_search_index, search_books
+from catalog.tests.query_audit import QueryAuditMixin
+
+# Create your tests here.
+
+class SearchBooksTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.shelley = Author.objects.create(first_name='Mary', last_name='Shelley')
+        cls.stoker = Author.objects.create(first_name='Bram', last_name='Stoker')
+        cls.horror = Genre.objects.create(name='Horror')
+
+        cls.frankenstein = Book.objects.create(
+            title='Frankenstein', summary='A scientist builds a creature.', isbn='1', author=cls.shelley,
+        )
+        cls.frankenstein.genre.add(cls.horror)
+        cls.dracula = Book.objects.create(
+            title='Dracula', summary='Count Dracula leaves Transylvania for England.', isbn='2', author=cls.stoker,
+        )
+        cls.last_man = Book.objects.create(
+            title='The Last Man', summary='A plague and Frankenstein references.', isbn='3', author=cls.shelley,
+        )
+
+    def search(self, query):
+        return [book.title for book in search_books(query)]
+
+    def test_searches_title_and_summary(self):
+        self.assertEqual(self.search('transylvania'), ['Dracula'])
+        self.assertEqual(self.search('plague'), ['The Last Man'])
+
+    def test_title_match_ranks_first(self):
+        self.assertEqual(self.search('frankenstein'), ['Frankenstein', 'The Last Man'])
+
+    def test_searches_author_names(self):
+        self.assertEqual(sorted(self.search('shelley')), ['Frankenstein', 'The Last Man'])
+
+    def test_searches_genre_names(self):
+        self.assertEqual(self.search('horror'), ['Frankenstein'])
+
+    def test_all_words_must_match(self):
+        self.assertEqual(self.search('mary plague'), ['The Last Man'])
+        self.assertEqual(self.search('mary transylvania'), [])
+
+    def test_operators_are_not_interpreted(self):
+        self.assertEqual(self.search('title: OR "NEAR(*'), [])
+        self.assertEqual(self.search('   '), [])
+
+    def test_results_are_ranked(self):
+        results = search_books('frankenstein')
+        self.assertGreater(results[0].rank, results[1].rank)
+        self.assertEqual(results.count(), 2)
+
+    def test_book_changes_are_indexed(self):
+        self.dracula.title = 'Nosferatu'
+        self.dracula.save()
+        self.assertEqual(self.search('nosferatu'), ['Nosferatu'])
+
+    def test_deleted_books_are_removed(self):
+        self.dracula.delete()
+        self.assertEqual(self.search('dracula'), [])
+
+    def test_genre_changes_are_indexed(self):
+        self.dracula.genre.add(self.horror)
+        self.assertEqual(sorted(self.search('horror')), ['Dracula', 'Frankenstein'])
+
+        self.horror.book_set.clear()
+        self.assertEqual(self.search('horror'), [])
+
+    def test_genre_rename_is_indexed(self):
+        self.horror.name = 'Gothic'
+        self.horror.save()
+        self.assertEqual(self.search('gothic'), ['Frankenstein'])
+        self.assertEqual(self.search('horror'), [])
+
+    def test_author_rename_and_delete_are_indexed(self):
+        self.stoker.last_name = 'Stokerr'
+        self.stoker.save()
+        self.assertEqual(self.search('stokerr'), ['Dracula'])
+
+        self.stoker.delete()
+        self.assertEqual(self.search('stokerr'), [])
+
+    def test_rebuild(self):
+        Book.objects.filter(pk=self.dracula.pk).update(title='Carmilla')
+        self.assertEqual(self.search('carmilla'), [])
+
+        rebuild_search_index()
+        self.assertEqual(self.search('carmilla'), ['Carmilla'])
+
+class BookSearchViewTest(QueryAuditMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        for book_number in range(13):
+            Book.objects.create(title=f'Ghost story {book_number}', summary='Spooky.', isbn=str(book_number))
+
+    def setUp(self):
+        # Result counts are cached.
+        cache.clear()
+
+    def test_view_url_exists_at_desired_location(self):
+        response = self.client.get('/catalog/search/?q=ghost')
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'catalog/book_search.html')
+
+    def test_results_are_paginated(self):
+        response = self.client.get(reverse('search'), {'q': 'ghost'})
+        self.assertTrue(response.context['is_paginated'])
+        self.assertEqual(len(response.context['book_list']), 10)
+        self.assertContains(response, '13 results')
+
+        response = self.client.get(reverse('search'), {'q': 'ghost', 'page': 2})
+        self.assertEqual(len(response.context['book_list']), 3)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Counts are exact on other databases.')
+    def test_large_result_counts_are_cached(self):
+        with mock.patch.object(EstimatedCountPaginator, 'estimate', return_value=20000):
+            self.assertContains(self.client.get(reverse('search'), {'q': 'ghost'}), 'About 13 results')
+
+            Book.objects.create(title='Ghost story 13', summary='Spooky.', isbn='13')
+            self.assertContains(self.client.get(reverse('search'), {'q': 'ghost'}), 'About 13 results')
+
+    def test_empty_query(self):
+        response = self.client.get(reverse('search'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['book_list']), 0)
+
+    def test_no_results(self):
+        response = self.client.get(reverse('search'), {'q': 'vampire'})
+        self.assertContains(response, 'No books match')
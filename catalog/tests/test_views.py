@@ -4,14 +4,19 @@ import uuid
 # Required to grant the permission needed to set a book as returned.
 from django.contrib.auth.models import Permission
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 
+from catalog.counters import recount_book_counters
 from catalog.models import Author, BookInstance, Book, Genre, Language
+from catalog.tests.query_audit import QueryAuditMixin
 
 # Create your tests here.
-class AuthorCreateViewTest(TestCase):
+class AuthorCreateViewTest(QueryAuditMixin, TestCase):
     def setUp(self):
         test_user1 = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
         test_user2 = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
@@ -59,7 +64,7 @@ class AuthorCreateViewTest(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertTrue(response.url.startswith('/catalog/author/'))
 
-class AuthorListViewTest(TestCase):
+class AuthorListViewTest(QueryAuditMixin, TestCase):
     @classmethod
     def setUpTestData(cls) -> None:
         # Creates 13 authors for pagination tests
@@ -92,14 +97,49 @@ class AuthorListViewTest(TestCase):
         self.assertEqual(len(response.context['author_list']), 10)
 
     def test_lists_all_authors(self):
-        # Get second page and confirm it has (exactly) 3 items left
-        response = self.client.get(reverse('authors') + '?page=2')
+        # Follow the 'next' link and confirm the second page has (exactly) 3 items left
+        response = self.client.get(reverse('authors'))
+        response = self.client.get(reverse('authors') + response.context['page_obj'].next_querystring)
         self.assertEqual(response.status_code, 200)
         self.assertTrue('is_paginated' in response.context)
         self.assertTrue(response.context['is_paginated'] == True)
         self.assertEqual(len(response.context['author_list']), 3)
 
-class LoanedBookInstancesByUserListViewTest(TestCase):
+class BookListViewTest(QueryAuditMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        # Creates 13 books, each by a different author
+        for book_id in range(13):
+            test_author = Author.objects.create(first_name=f'John {book_id}', last_name='Smith')
+            Book.objects.create(
+                title=f'Book {book_id:02d}', summary='My book summary', isbn=f'{book_id:013d}', author=test_author,
+            )
+
+    def setUp(self):
+        # The pages are cached (see BookListView).
+        cache.clear()
+
+    def test_view_uses_correct_template(self):
+        response = self.client.get(reverse('books'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'catalog/book_list.html')
+
+    def test_lists_books_with_their_authors(self):
+        response = self.client.get(reverse('books'))
+        self.assertEqual(len(response.context['book_list']), 10)
+        self.assertContains(response, 'Smith, John 0')
+
+    def test_shows_availability_without_counting_copies(self):
+        book = Book.objects.get(title='Book 00')
+        for status in ('a', 'o', 'm'):
+            BookInstance.objects.create(book=book, imprint='Unlikely Imprint, 2016', status=status)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('books'))
+        self.assertContains(response, '1 of 3 available')
+        self.assertFalse([query for query in queries if 'catalog_bookinstance' in query['sql']])
+
+class LoanedBookInstancesByUserListViewTest(QueryAuditMixin, TestCase):
     def setUp(self):
         # Create two users
         test_user1 = User.objects.create_user(username='testuser1', password='SuperLongRandomPasswordForUser1')
@@ -214,7 +254,65 @@ class LoanedBookInstancesByUserListViewTest(TestCase):
                 self.assertTrue(last_date <= book.due_back)
                 last_date = book.due_back
 
-class RenewBookInstancesViewTest(TestCase):
+class AllLoanedBooksListViewTest(QueryAuditMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        test_user1 = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        test_user2 = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        test_user1.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+        test_user2.user_permissions.add(
+            Permission.objects.get(name='Set book as returned'),
+            Permission.objects.get(name='Set new due_back date'),
+        )
+
+        # Three loans to each of 5 borrowers, of 15 different books
+        test_author = Author.objects.create(first_name='John', last_name='Smith')
+        for loan in range(15):
+            borrower = User.objects.get_or_create(username=f'borrower{loan % 5}')[0]
+            test_book = Book.objects.create(
+                title=f'Book {loan}', summary='My book summary', isbn=f'{loan:013d}', author=test_author,
+            )
+            BookInstance.objects.create(
+                book=test_book,
+                imprint='Unlikely Imprint, 2016',
+                due_back=datetime.date.today() + datetime.timedelta(days=loan),
+                borrower=borrower,
+                status='o',
+            )
+
+    def test_forbidden_without_permission(self):
+        User.objects.create_user(username='testuser3', password='3HJ1vRV0Z&3iD')
+        self.client.login(username='testuser3', password='3HJ1vRV0Z&3iD')
+        self.assertEqual(self.client.get(reverse('all-borrowed')).status_code, 403)
+
+    def test_lists_loans_with_book_and_borrower(self):
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        response = self.client.get(reverse('all-borrowed'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['bookinstance_list']), 10)
+        self.assertContains(response, 'Book 0')
+        self.assertContains(response, 'borrower0')
+        # Renewing needs another permission.
+        self.assertNotContains(response, 'Renew')
+
+    def test_renew_links_with_permission(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('all-borrowed'))
+        self.assertContains(response, 'Renew</a>', count=10)
+        # And the bulk renewal of the ticked loans.
+        self.assertContains(response, 'value="renew"', count=1)
+
+    def test_query_count_does_not_depend_on_page(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        with CaptureQueriesContext(connection) as first_page:
+            response = self.client.get(reverse('all-borrowed'))
+        with CaptureQueriesContext(connection) as second_page:
+            self.client.get(reverse('all-borrowed') + response.context['page_obj'].next_querystring)
+
+        self.assertEqual(len(first_page), len(second_page))
+
+class RenewBookInstancesViewTest(QueryAuditMixin, TestCase):
     def setUp(self):
         # Create a user
         test_user1 = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
@@ -359,3 +457,131 @@ class RenewBookInstancesViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertFormError(response, 'form', 'renewal_date', 'Invalid date - renewal more than 4 weeks ahead')
 
+
+class BookDetailViewTest(QueryAuditMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        test_author = Author.objects.create(first_name='John', last_name='Smith')
+        test_language = Language.objects.create(language_name='English')
+        Genre.objects.create(name='Fantasy')
+        Genre.objects.create(name='Horror')
+
+        cls.test_books = []
+        for number_of_copies in (1, 50):
+            test_book = Book.objects.create(
+                title=f'Book with {number_of_copies} copies',
+                summary='My book summary',
+                isbn=f'ISBN{number_of_copies}',
+                author=test_author,
+                language=test_language,
+            )
+            test_book.genre.set(Genre.objects.all())
+
+            for book_copy in range(number_of_copies):
+                BookInstance.objects.create(book=test_book, imprint='Unlikely Imprint, 2016', status='a')
+            cls.test_books.append(test_book)
+
+    def setUp(self):
+        # Cached fragments outlive the test database rollback.
+        cache.clear()
+
+    def test_view_uses_correct_template(self):
+        response = self.client.get(self.test_books[0].get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'catalog/book_detail.html')
+
+    def test_query_count_does_not_depend_on_number_of_copies(self):
+        query_counts = []
+        for test_book in self.test_books:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(test_book.get_absolute_url())
+            self.assertEqual(response.status_code, 200)
+            query_counts.append(len(queries))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_lists_all_copies(self):
+        response = self.client.get(self.test_books[1].get_absolute_url())
+        self.assertContains(response, 'Unlikely Imprint, 2016', count=50)
+        self.assertContains(response, 'Fantasy, Horror')
+
+    def test_copies_section_is_cached(self):
+        url = self.test_books[1].get_absolute_url()
+        self.client.get(url)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+
+        self.assertFalse(any('catalog_bookinstance' in query['sql'] for query in queries))
+
+    def test_changing_a_copy_refreshes_the_copies_section(self):
+        url = self.test_books[0].get_absolute_url()
+        self.assertContains(self.client.get(url), 'Available')
+
+        book_copy = BookInstance.objects.get(book=self.test_books[0])
+        book_copy.status = 'm'
+        book_copy.save()
+
+        response = self.client.get(url)
+        self.assertNotContains(response, 'Available')
+        self.assertContains(response, 'Maintenance')
+
+    def test_moving_a_copy_refreshes_both_books(self):
+        for test_book in self.test_books:
+            self.client.get(test_book.get_absolute_url())
+
+        book_copy = BookInstance.objects.get(book=self.test_books[0])
+        book_copy.book = self.test_books[1]
+        book_copy.save()
+
+        self.assertContains(self.client.get(self.test_books[0].get_absolute_url()), 'Unlikely Imprint', count=0)
+        self.assertContains(self.client.get(self.test_books[1].get_absolute_url()), 'Unlikely Imprint', count=51)
+
+class AuthorDetailViewTest(QueryAuditMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.test_authors = {}
+
+        for number_of_books in (1, 100, 1000):
+            test_author = Author.objects.create(first_name='Prolific', last_name=f'Author {number_of_books}')
+            test_books = Book.objects.bulk_create([
+                Book(
+                    title=f'Book {book_number}',
+                    summary='My book summary',
+                    isbn=f'{number_of_books}-{book_number}',
+                    author=test_author,
+                )
+                for book_number in range(number_of_books)
+            ])
+            BookInstance.objects.bulk_create([
+                BookInstance(book=test_book, imprint='Unlikely Imprint, 2016', status=status)
+                for test_book in test_books
+                for status in ('a', 'o')
+            ])
+            cls.test_authors[number_of_books] = test_author
+        # bulk_create() does not update the copy counters.
+        recount_book_counters()
+
+    def test_view_uses_correct_template(self):
+        response = self.client.get(self.test_authors[1].get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'catalog/author_detail.html')
+
+    def test_books_show_copy_counts(self):
+        response = self.client.get(self.test_authors[100].get_absolute_url())
+        self.assertEqual(len(response.context['book_list']), 100)
+
+        for book in response.context['book_list']:
+            self.assertEqual(book.copies_total, 2)
+            self.assertEqual(book.copies_available, 1)
+        self.assertContains(response, '(2, 1 available)', count=100)
+
+    def test_query_count_does_not_depend_on_number_of_books(self):
+        query_counts = set()
+        for test_author in self.test_authors.values():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(test_author.get_absolute_url())
+            self.assertEqual(response.status_code, 200)
+            query_counts.add(len(queries))
+
+        self.assertEqual(query_counts, {2})
@@ -0,0 +1,79 @@
+import datetime
+from io import StringIO
+from unittest import mock
+
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from catalog.models import PageVisits
+from catalog.tests.query_audit import QueryAuditMixin
+from catalog.visits import VISITS_COOKIE, visit_buffer
+
+# Create your tests here.
+
+class IndexVisitsTest(QueryAuditMixin, TestCase):
+    def setUp(self):
+        visit_buffer.pending.clear()
+
+    def test_counts_visits_in_a_cookie(self):
+        for expected in range(3):
+            response = self.client.get(reverse('index'))
+            self.assertEqual(response.context['num_visits'], expected)
+
+    def test_tampered_cookie_starts_again(self):
+        self.client.cookies[VISITS_COOKIE] = '41'
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['num_visits'], 0)
+
+    def test_anonymous_visit_uses_no_session(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'))
+
+        self.assertFalse([query for query in queries if 'django_session' in query['sql']])
+        self.assertNotIn('sessionid', response.cookies)
+
+    def test_totals_are_written_behind(self):
+        with override_settings(CATALOG_VISITS_FLUSH_INTERVAL=3600):
+            visit_buffer.flush()
+            for _ in range(3):
+                self.client.get(reverse('index'))
+        self.assertFalse(PageVisits.objects.exists())
+
+        visit_buffer.flush()
+        visits = PageVisits.objects.get()
+        self.assertEqual((visits.page, visits.date, visits.count), ('index', timezone.localdate(), 3))
+
+        # Later flushes add to the same row.
+        with override_settings(CATALOG_VISITS_FLUSH_INTERVAL=0):
+            self.client.get(reverse('index'))
+        visits.refresh_from_db()
+        self.assertEqual(visits.count, 4)
+
+    def test_failed_writes_are_kept(self):
+        visit_buffer.add('index')
+        with mock.patch('catalog.visits._add_visits', side_effect=DatabaseError):
+            visit_buffer.flush()
+        self.assertEqual(sum(visit_buffer.pending.values()), 1)
+
+        visit_buffer.flush()
+        self.assertEqual(PageVisits.objects.get().count, 1)
+
+class PurgeSessionsCommandTest(TestCase):
+    def test_deletes_only_expired_sessions(self):
+        now = timezone.now()
+        for number in range(5):
+            Session.objects.create(
+                session_key=f'expired{number}', session_data='', expire_date=now - datetime.timedelta(days=1),
+            )
+        Session.objects.create(session_key='current', session_data='', expire_date=now + datetime.timedelta(days=1))
+
+        out = StringIO()
+        call_command('purge_sessions', chunk_size=2, stdout=out)
+
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['current'])
+        self.assertIn('Deleted 5 expired sessions.', out.getvalue())
@@ -1,22 +1,46 @@
 from django.urls import path
-from . import views
+from . import api, async_views, views
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('books/', views.BookListView.as_view(), name='books'),
     path('book/<int:pk>', views.BookDetailView.as_view(), name='book-detail'),
+    path('search/', views.BookSearchView.as_view(), name='search'),
     path('authors/', views.AuthorListView.as_view(), name='authors'),
     path('author/<int:pk>', views.AuthorDetailView.as_view(),  name='author-detail'),
     path('secret/', views.SecretListView.as_view(), name='secret'),
     path('mybooks/', views.LoanedBooksByUserListView.as_view(), name='my-borrowed'),
     path('borrowed/', views.AllLoanedBooksListView.as_view(), name='all-borrowed'),
+    path('borrowed/bulk', views.bulk_loans_librarian, name='bulk-loans-librarian'),
     path('book/<uuid:pk>/renew', views.renew_book_librarian, name='renew-book-librarian'),
+    path('book/<uuid:pk>/checkout', views.checkout_book_librarian, name='checkout-book-librarian'),
+    path('book/<uuid:pk>/return', views.return_book_librarian, name='return-book-librarian'),
+    path('book/<int:pk>/reserve', views.reserve_book, name='reserve-book'),
+    path('queues/', views.ReservationQueueListView.as_view(), name='reservation-queues'),
     path('author/create/', views.AuthorCreate.as_view(), name='author-create'),
     path('author/<int:pk>/update/', views.AuthorUpdate.as_view(), name='author-update'),
     path('author/<int:pk>/delete/', views.AuthorDelete.as_view(), name='author-delete'),
     path('book/create/', views.BookCreate.as_view(), name='book-create'),
     path('book/<int:pk>/update/', views.BookUpdate.as_view(), name='book-update'),
     path('book/<int:pk>/delete/', views.BookDelete.as_view(), name='book-delete'),
+    path('export/<str:name>.<str:format>', views.export_catalog, name='export'),
+    path('metrics', views.metrics_view, name='metrics'),
+
+    # Read-only JSON API.
+    path('api/books/', api.BookListApi.as_view(), name='api-books'),
+    path('api/books/<int:pk>/', api.BookDetailApi.as_view(), name='api-book-detail'),
+    path('api/authors/', api.AuthorListApi.as_view(), name='api-authors'),
+    path('api/authors/<int:pk>/', api.AuthorDetailApi.as_view(), name='api-author-detail'),
+    path('api/instances/', api.BookInstanceListApi.as_view(), name='api-instances'),
+    path('api/instances/<uuid:pk>/', api.BookInstanceDetailApi.as_view(), name='api-instance-detail'),
+    path('api/loans/', api.LoanListApi.as_view(), name='api-loans'),
+
+    # Async versions of the read-only pages (for ASGI servers).
+    path('async/', async_views.index, name='async-index'),
+    path('async/books/', async_views.AsyncBookListView.as_view(), name='async-books'),
+    path('async/book/<int:pk>', async_views.AsyncBookDetailView.as_view(), name='async-book-detail'),
+    path('async/authors/', async_views.AsyncAuthorListView.as_view(), name='async-authors'),
+    path('async/author/<int:pk>', async_views.AsyncAuthorDetailView.as_view(), name='async-author-detail'),
 
     # For more complex pattern matching.
     # re_path(r'^book/(?P<pk>\d+)$', views.BookDetailView.as_view(), name='book-detail'), 
@@ -1,17 +1,31 @@
 import datetime
 
 from typing import Any, Dict
+from django.db.models import Count, Min
 from django.db.models.query import QuerySet
 from django.shortcuts import render, get_object_or_404
-from .models import Author, Book, BookInstance, Genre, Language, Secret
+from .models import Author, Book, BookInstance, Genre, Language, Reservation, Secret
 from django.views import generic
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required, permission_required
-from django.http import HttpResponseRedirect
+from django.core.exceptions import PermissionDenied
+from django.http import (
+    Http404, HttpResponse, HttpResponsePermanentRedirect, HttpResponseRedirect, StreamingHttpResponse,
+)
 from django.urls import reverse, reverse_lazy
-
-from catalog.forms import RenewBookForm
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.utils.translation import gettext as _, ngettext
+from django.views.decorators.http import require_POST
+
+from catalog import facets, loans, metrics, visits
+from catalog.cache import book_copies_version, get_cached
+from catalog.counters import get_index_counts
+from catalog.export import CONTENT_TYPES, EXPORTS, FORMATS, accepts_gzip, encode, render as render_export
+from catalog.forms import BookForm, BulkLoanForm, CheckoutForm, RenewBookForm
+from catalog.pagination import CursorPage, CursorPaginationMixin, EstimatedCountPaginator
+from catalog.search import search_books
 from catalog.models import Author
 
 # Create your views here.
@@ -19,40 +33,32 @@ from catalog.models import Author
 def index(request):
     """ View function for home page of site. """
 
-    # Generate counts of some of the main objects.
-    num_books = Book.objects.all().count()
-    num_instances = BookInstance.objects.all().count()
-
-    # Available books (status = 'a')
-    num_instances_available = BookInstance.objects.filter(status__exact='a').count()
-
-    # The 'all()' is implied by default.
-    num_authors = Author.objects.count()
-
-    num_genres_with_word = Genre.objects.filter(name__icontains='horror').count()
-    num_books_with_word_the = Book.objects.filter(title__icontains='the ').count()
+    # All the record counts come from one aggregate query, cached until
+    # one of the counted models changes (see catalog/counters.py).
+    counts = get_index_counts()
 
-    # Number of visits to this view, as counted in the session variable.
-    # Gets a session value, setting default it is not present (0).
-    num_visits = request.session.get('num_visits', 0) 
-    request.session['num_visits'] = num_visits + 1
+    # Number of visits to this view, as counted in a signed cookie rather
+    # than the session, so that no session is stored for anonymous visitors.
+    # The site-wide total is written behind (see catalog/visits.py).
+    num_visits = visits.get_visits(request)
+    visits.record_visit('index')
 
     context = {
-        'num_books': num_books,
-        'num_instances': num_instances,
-        'num_instances_available': num_instances_available,
-        'num_authors': num_authors,
-        'num_genres_with_word': num_genres_with_word,
-        'num_books_with_word_the': num_books_with_word_the,
+        **counts,
         'num_visits': num_visits,
     }
 
     # Render the HTML template index.html with the data in the context variable
-    return render(request, 'index.html', context=context)
+    response = render(request, 'index.html', context=context)
+    visits.set_visits(response, num_visits + 1)
+    return response
 
-class BookListView(generic.ListView):
+class BookListView(CursorPaginationMixin, generic.ListView):
     model = Book
+    # The template shows each book's author.
+    queryset = Book.objects.select_related('author')
     paginate_by = 10
+    cursor_ordering = ('title', 'pk')
     """
     /locallibrary/catalog/templates/catalog/book_list.html
         The DEFAULT template file expected by the generic class-based list view 
@@ -83,9 +89,54 @@ class BookListView(generic.ListView):
     #     return context
     #=====================================================================================
 
+    # Filtered by the facets of catalog/facets.py.
+
+    def setup(self, request, *args, **kwargs):
+        super().setup(request, *args, **kwargs)
+        self.filters = facets.parse_filters(request.GET)
+        self.canonical_query = facets.canonical_query(self.filters, request.GET.get(self.cursor_query_param))
+
+    def get(self, request, *args, **kwargs):
+        # Each set of filters has one URL (and so one cached copy of each
+        # page): other spellings of the query string are redirected to it.
+        if request.GET.urlencode() != self.canonical_query:
+            return HttpResponsePermanentRedirect(
+                f'{request.path}?{self.canonical_query}' if self.canonical_query else request.path
+            )
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return facets.filter_books(super().get_queryset(), self.filters)
+
+    def get_cursor_page(self, paginator, cursor):
+        def compute():
+            page = paginator.page(cursor)
+            return page.object_list, page.next_cursor, page.previous_cursor
+
+        # Cached until a book, author or copy changes (see catalog/signals.py).
+        rows, next_cursor, previous_cursor = get_cached(facets.BOOK_LIST, compute, key=self.canonical_query)
+        return CursorPage(rows, next_cursor, previous_cursor)
+
+    def get_context_data(self, **kwargs: Any) -> Dict[str, Any]:
+        context = super().get_context_data(**kwargs)
+        context['filters'] = self.filters
+        context['facets'] = facets.facet_links(self.filters)
+        return context
+
 class BookDetailView(generic.DetailView):
     model = Book
 
+    def get_queryset(self):
+        # The copies are not prefetched: they are only read when the cached
+        # 'Copies' fragment of the template has to be rendered again.
+        return Book.objects.select_related('author', 'language').prefetch_related('genre')
+
+    def get_context_data(self, **kwargs: Any) -> Dict[str, Any]:
+        context = super().get_context_data(**kwargs)
+        # Part of the fragment cache key, bumped whenever a copy changes.
+        context['copies_version'] = book_copies_version(self.object.pk)
+        return context
+
     # ============== Without Generics ==============================================
     # def book_detail_view(request, primary_key):
     #     try:
@@ -96,46 +147,101 @@ class BookDetailView(generic.DetailView):
     #     return render(request, 'catalog/book_detail.html', context={'book': book})
     # ==============================================================================
 
-class AuthorListView(generic.ListView):
+class BookSearchView(generic.ListView):
+    """ Full-text search over books, their authors and genres (?q=...). """
+    template_name = 'catalog/book_search.html'
+    context_object_name = 'book_list'
+    paginate_by = 10
+    paginator_class = EstimatedCountPaginator
+    # Seconds for which the result count of a large search is cached.
+    count_timeout = 300
+
+    def get_paginator(self, *args, **kwargs):
+        paginator = super().get_paginator(*args, **kwargs)
+        # The count is shown ('N results'), and the planner's estimates of
+        # full-text matches are rough: it is counted exactly, then cached.
+        paginator.count_timeout = self.count_timeout
+        return paginator
+
+    def get_queryset(self):
+        self.query = self.request.GET.get('q', '').strip()
+        if not self.query:
+            return Book.objects.none()
+        return search_books(self.query, Book.objects.select_related('author'))
+
+    def get_context_data(self, **kwargs: Any) -> Dict[str, Any]:
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.query
+        return context
+
+class AuthorListView(CursorPaginationMixin, generic.ListView):
     model = Author
     paginate_by = 10
+    cursor_ordering = ('last_name', 'first_name', 'pk')
 
 class AuthorDetailView(generic.DetailView):
     model = Author
 
+    def get_context_data(self, **kwargs: Any) -> Dict[str, Any]:
+        context = super().get_context_data(**kwargs)
+        # The copy counts are stored on each book (see catalog/counters.py).
+        context['book_list'] = self.object.book_set.order_by('title', 'pk')
+        return context
+
 class SecretListView(LoginRequiredMixin, generic.ListView):    
     login_url = '/accounts/login/'
     # redirect_field_name = '' # Diff URL parameter instead of 'next'.
 
     model = Secret
 
-class LoanedBooksByUserListView(LoginRequiredMixin, generic.ListView):
+class LoanedBooksByUserListView(LoginRequiredMixin, CursorPaginationMixin, generic.ListView):
     """Generic class-based view listing books on loan to current user."""
     model = BookInstance
     template_name = 'catalog/bookinstance_list_borrowed_user.html'
     paginate_by = 10
+    # Ordered by due date (the pagination applies the ordering).
+    cursor_ordering = ('due_back', 'pk')
 
     def get_queryset(self):
         return (
             BookInstance.objects.filter(borrower=self.request.user)
             .filter(status__exact='o')
-            .order_by('due_back')
+            .select_related('book')
+            .only('id', 'due_back', 'book__title')
         )
 
-class AllLoanedBooksListView(PermissionRequiredMixin, generic.ListView):
+class AllLoanedBooksListView(PermissionRequiredMixin, CursorPaginationMixin, generic.ListView):
     """Generic class-based view listing ALL the books currently on loan."""
     model = BookInstance
     template_name = 'catalog/bookinstance_list_all_borrowed.html'
     paginate_by = 10
+    # Ordered by due date (the pagination applies the ordering).
+    cursor_ordering = ('due_back', 'pk')
 
     permission_required = 'catalog.can_mark_returned'
 
+    def overdue_only(self):
+        return self.request.GET.get('overdue') == '1'
+
     def get_queryset(self) -> QuerySet[Any]:
+        queryset = BookInstance.objects.filter(status__exact='o')
+        if self.overdue_only():
+            # A range of the same partial index (bookinstance_on_loan_idx).
+            queryset = queryset.filter(due_back__lt=datetime.date.today())
+
+        # Only the columns the template renders.
         return (
-            BookInstance.objects.filter(status__exact='o')
-            .order_by('due_back')
+            queryset.select_related('book', 'borrower')
+            .only('id', 'due_back', 'book__title', 'borrower__username')
         )
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Checked once here rather than for every row in the template.
+        context['can_renew'] = self.request.user.has_perm('catalog.can_renew')
+        context['overdue_only'] = self.overdue_only()
+        return context
+
 @login_required
 @permission_required('catalog.can_renew', raise_exception=True)
 def renew_book_librarian(request, pk):
@@ -168,6 +274,128 @@ def renew_book_librarian(request, pk):
 
     return render(request, 'catalog/book_renew_librarian.html', context)
 
+@login_required
+@permission_required('catalog.can_mark_returned', raise_exception=True)
+def checkout_book_librarian(request, pk):
+    """ Lends a copy to a borrower (see catalog/loans.py). """
+    book_instance = get_object_or_404(BookInstance.objects.select_related('book', 'borrower'), pk=pk)
+
+    if request.method == 'POST':
+        form = CheckoutForm(request.POST)
+
+        if form.is_valid():
+            try:
+                loans.checkout(book_instance, form.cleaned_data['borrower'], form.cleaned_data['due_back'])
+            except loans.LoanError as e:
+                # E.g. lent by someone else since the form was shown.
+                form.add_error(None, str(e))
+            else:
+                return HttpResponseRedirect(reverse('all-borrowed'))
+
+    else:
+        initial = {'due_back': datetime.date.today() + loans.LOAN_PERIOD}
+        # A reserved copy is normally lent to whoever reserved it.
+        if book_instance.status == 'r' and book_instance.borrower:
+            initial['borrower'] = book_instance.borrower.get_username()
+        form = CheckoutForm(initial=initial)
+
+    context = {
+        'form': form,
+        'book_instance': book_instance,
+    }
+
+    return render(request, 'catalog/book_checkout_librarian.html', context)
+
+@require_POST
+@login_required
+@permission_required('catalog.can_mark_returned', raise_exception=True)
+def return_book_librarian(request, pk):
+    """ Takes back a copy on loan (see catalog/loans.py). """
+    book_instance = get_object_or_404(BookInstance, pk=pk)
+
+    try:
+        loans.return_(book_instance)
+    except loans.LoanError as e:
+        messages.error(request, str(e))
+    else:
+        messages.success(request, _('The copy was returned.'))
+
+    return HttpResponseRedirect(reverse('all-borrowed'))
+
+@require_POST
+@login_required
+@permission_required('catalog.can_mark_returned', raise_exception=True)
+def bulk_loans_librarian(request):
+    """ Renews or returns the loans ticked on the all-borrowed list, with one UPDATE (see catalog/loans.py). """
+    form = BulkLoanForm(request.POST)
+
+    if not form.is_valid():
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request, error)
+    elif form.cleaned_data['action'] == 'renew':
+        if not request.user.has_perm('catalog.can_renew'):
+            raise PermissionDenied
+        renewed, failures = loans.renew_many(form.cleaned_data['copies'], form.cleaned_data['renewal_date'])
+        report_bulk_loans(request, 'renew', renewed, failures)
+    else:
+        returned, failures = loans.return_many(form.cleaned_data['copies'])
+        report_bulk_loans(request, 'return', returned, failures)
+
+    # Back to the list (and its filter) the loans were ticked on.
+    next_url = request.POST.get('next')
+    if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        next_url = reverse('all-borrowed')
+    return HttpResponseRedirect(next_url)
+
+def report_bulk_loans(request, action, done, failures):
+    """
+    Reports the outcome of a bulk renewal ('renew') or return ('return'),
+    including each copy it could not change. Also used by the admin actions.
+    """
+    if action == 'renew':
+        message = ngettext('Renewed %(count)d loan.', 'Renewed %(count)d loans.', len(done))
+    else:
+        message = ngettext('Returned %(count)d copy.', 'Returned %(count)d copies.', len(done))
+    messages.success(request, message % {'count': len(done)})
+    for pk, reason in failures.items():
+        messages.warning(request, _('%(copy)s: %(reason)s') % {'copy': pk, 'reason': reason})
+
+@require_POST
+@login_required
+def reserve_book(request, pk):
+    """ Holds an available copy of a book for the current user (see catalog/loans.py). """
+    book = get_object_or_404(Book, pk=pk)
+
+    try:
+        held = loans.reserve(book, request.user)
+    except loans.LoanError as e:
+        messages.error(request, str(e))
+    else:
+        if isinstance(held, Reservation):
+            messages.success(request, _('No copy is available: you are number %(position)s on the waiting list.') % {
+                'position': loans.queue_position(held),
+            })
+        else:
+            messages.success(request, _('A copy is held for you until %(date)s.') % {'date': held.due_back})
+
+    return HttpResponseRedirect(book.get_absolute_url())
+
+class ReservationQueueListView(PermissionRequiredMixin, generic.ListView):
+    """ The books with the longest queues of reservations (see catalog/loans.py). """
+    template_name = 'catalog/reservation_queues.html'
+    context_object_name = 'queue_list'
+    permission_required = 'catalog.can_mark_returned'
+    max_books = 100
+
+    def get_queryset(self):
+        # One GROUP BY query, answered from the (book, created, id) index.
+        return (
+            Reservation.objects.values('book', 'book__title')
+            .annotate(queued=Count('id'), oldest=Min('created'))
+            .order_by('-queued', 'book')[:self.max_books]
+        )
+
 class AuthorCreate(PermissionRequiredMixin, CreateView):
     model = Author
     fields = ['first_name', 'last_name', 'date_of_birth', 'date_of_death']
@@ -187,21 +415,43 @@ class AuthorDelete(PermissionRequiredMixin, DeleteView):
 
 class BookCreate(PermissionRequiredMixin, CreateView):
     model = Book
-    fields = [
-        'title', 'author', 'summary', 'isbn',
-        'genre', 'language'
-    ]
+    # Lists the genres and languages from the cache (see catalog/forms.py).
+    form_class = BookForm
     permission_required = 'catalog.can_mark_returned'
 
 class BookUpdate(PermissionRequiredMixin, UpdateView):
     model = Book
-    fields = [
-        'title', 'author', 'summary', 'isbn',
-        'genre', 'language'
-    ]
+    # Lists the genres and languages from the cache (see catalog/forms.py).
+    form_class = BookForm
     permission_required = 'catalog.can_mark_returned'
 
 class BookDelete(PermissionRequiredMixin, DeleteView):
     model = Book
     success_url = reverse_lazy('books')
-    permission_required = 'catalog.can_mark_returned'
\ No newline at end of file
+    permission_required = 'catalog.can_mark_returned'
+
+@login_required
+@permission_required('catalog.can_mark_returned', raise_exception=True)
+def export_catalog(request, name, format):
+    """ Streams a catalog export (see catalog/export.py) as CSV or JSON Lines. """
+    if name not in EXPORTS or format not in FORMATS:
+        raise Http404('No such export.')
+
+    # Compressed on the fly when the client accepts it.
+    compress = accepts_gzip(request.headers.get('Accept-Encoding', ''))
+
+    response = StreamingHttpResponse(
+        encode(render_export(name, format), compress=compress),
+        content_type=CONTENT_TYPES[format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{name}.{format}"'
+    response['Vary'] = 'Accept-Encoding'
+    if compress:
+        response['Content-Encoding'] = 'gzip'
+    return response
+
+@login_required
+@permission_required('catalog.can_mark_returned', raise_exception=True)
+def metrics_view(request):
+    """ Per-view request metrics (see catalog/metrics.py), in Prometheus text format. """
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
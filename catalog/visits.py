@@ -0,0 +1,99 @@
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from catalog.models import PageVisits
+
+# Visit counting without the session.
+#
+# A visitor's own count is kept in a signed cookie, so the index page reads
+# and writes no session (and creates no 'django_session' row for anonymous
+# visitors and crawlers). Site-wide totals are counted in memory and written
+# behind: each worker adds its pending counts to the PageVisits table at most
+# every CATALOG_VISITS_FLUSH_INTERVAL seconds, one UPDATE per page and day.
+# Counts still pending when a worker stops (at most one interval's worth) are
+# lost, which is fine for statistics.
+
+logger = logging.getLogger(__name__)
+
+VISITS_COOKIE = 'num_visits'
+VISITS_COOKIE_SALT = 'catalog.visits'
+VISITS_COOKIE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Flush early if this many (page, day) totals are pending.
+MAX_PENDING = 1000
+
+def get_visits(request) -> int:
+    """ Returns the number of earlier visits of this visitor (0 if unknown). """
+    value = request.get_signed_cookie(
+        VISITS_COOKIE, default='0', salt=VISITS_COOKIE_SALT, max_age=VISITS_COOKIE_MAX_AGE,
+    )
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+def set_visits(response, num_visits):
+    response.set_signed_cookie(
+        VISITS_COOKIE, str(num_visits), salt=VISITS_COOKIE_SALT,
+        max_age=VISITS_COOKIE_MAX_AGE, httponly=True, samesite='Lax',
+    )
+
+class VisitBuffer:
+    """ Per-process counts of visits by (page, day), not yet written. """
+
+    def __init__(self):
+        self.pending = Counter()
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+    def add(self, page):
+        with self.lock:
+            self.pending[(page, timezone.localdate())] += 1
+            due = (
+                len(self.pending) >= MAX_PENDING
+                or time.monotonic() - self.last_flush >= settings.CATALOG_VISITS_FLUSH_INTERVAL
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        """ Adds the pending counts to the PageVisits table. """
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+            self.last_flush = time.monotonic()
+
+        failed = Counter()
+        for (page, date), count in pending.items():
+            try:
+                _add_visits(page, date, count)
+            except DatabaseError:
+                failed[(page, date)] = count
+
+        if failed:
+            logger.warning('Could not write %d page visit totals; retrying at the next flush.', len(failed))
+            with self.lock:
+                self.pending.update(failed)
+
+def _add_visits(page, date, count):
+    rows = PageVisits.objects.filter(page=page, date=date)
+    if rows.update(count=F('count') + count):
+        return
+    try:
+        with transaction.atomic():
+            PageVisits.objects.create(page=page, date=date, count=count)
+    except IntegrityError:
+        # Another worker created the row in the meantime.
+        rows.update(count=F('count') + count)
+
+visit_buffer = VisitBuffer()
+
+def record_visit(page):
+    """ Counts a visit of 'page' in the site-wide totals. """
+    visit_buffer.add(page)
@@ -0,0 +1,20 @@
+import os
+
+# Gunicorn settings (read from the current directory by 'gunicorn
+# locallibrary.wsgi', see Procfile).
+#
+# Each worker process serves GUNICORN_THREADS requests at a time and keeps
+# its own pool of database connections, as many as its threads unless
+# DATABASE_POOL_SIZE says otherwise (see locallibrary/settings.py): at most
+# WEB_CONCURRENCY x pool size connections are open to PostgreSQL, however
+# many clients there are.
+
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+
+def worker_exit(server, worker):
+    # Closes the worker's idle pooled connections rather than leaving the
+    # server to notice they are gone.
+    from catalog.backends.postgresql.pool import close_pools
+    close_pools()
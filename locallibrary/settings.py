@@ -1,4 +1,4 @@
-import os, dj_database_url
+import os, sys, tempfile, dj_database_url
 
 """
 Django settings for locallibrary project.
@@ -50,7 +50,13 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # WhiteNoise, in a version that also runs natively under ASGI.
+    'catalog.middleware.StaticFilesMiddleware',
+    # Per-view latency/query metrics, exposed at /catalog/metrics.
+    'catalog.middleware.MetricsMiddleware',
+    # Sends the reads of a client that has just written to the primary
+    # database (when there are read replicas).
+    'catalog.middleware.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -138,12 +144,123 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+#
+# A cache shared by every worker: Redis when REDIS_URL is set (production),
+# otherwise files in CACHE_DIR, which the local processes share. The catalog
+# keeps a small in-process cache in front of it (catalog/cache.py).
+#
+# 'manage.py test' uses an in-memory cache instead, one per process: the
+# tests clear the cache, and what they cache belongs to their own test
+# database (each 'test --parallel' process has its own).
+
+TESTING = sys.argv[1:2] == ['test']
+
+if TESTING:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'locallibrary-tests',
+        },
+    }
+elif os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'locallibrary-cache')),
+        },
+    }
+
+# The in-process tier: how many values it keeps, and for how many seconds.
+CATALOG_LOCAL_CACHE = {
+    'MAX_ENTRIES': 512,
+    'TIMEOUT': 300,
+}
+
+# Sessions are read from the cache, and only written through to the database.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# How often (in seconds) each worker writes the page visit totals it has
+# counted (see catalog/visits.py).
+CATALOG_VISITS_FLUSH_INTERVAL = 60
+
+# Fraction of the requests instrumented by catalog.middleware.MetricsMiddleware.
+CATALOG_METRICS_SAMPLE_RATE = float(os.environ.get('CATALOG_METRICS_SAMPLE_RATE', '0.1'))
+
+# Mail (overdue notices, see catalog/overdue.py). Printed to the console
+# unless EMAIL_BACKEND is set, e.g. to django.core.mail.backends.smtp.EmailBackend.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'False') == 'True'
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'library@localhost')
+
 # Redirects to Home URL after login
 # (Default redirects to /accounts/profile)
 LOGIN_REDIRECT_URL = '/'
 
-db_from_env = dj_database_url.config(conn_max_age=500)
-DATABASES['default'].update(db_from_env)
+# DATABASE_URL (PostgreSQL in production) replaces the SQLite database.
+# Connections are checked before they are reused, and connecting gives up
+# after DATABASE_CONNECT_TIMEOUT seconds.
+def database_from_url(url):
+    """ The DATABASES entry for 'url' (empty for no URL). """
+    if not url:
+        return {}
+    database = dj_database_url.parse(
+        url, conn_max_age=int(os.environ.get('DATABASE_CONN_MAX_AGE', '500')), conn_health_checks=True,
+    )
+    if database['ENGINE'] != 'django.db.backends.postgresql':
+        return database
+
+    database.setdefault('OPTIONS', {}).setdefault(
+        'connect_timeout', int(os.environ.get('DATABASE_CONNECT_TIMEOUT', '5')),
+    )
+    # Each process (gunicorn worker) pools up to DATABASE_POOL_SIZE
+    # connections per database, by default one per worker thread (see
+    # gunicorn.conf.py and catalog/backends/postgresql). DATABASE_POOL_SIZE=0
+    # turns pooling off, for persistent per-thread connections instead.
+    pool_size = int(os.environ.get('DATABASE_POOL_SIZE', os.environ.get('GUNICORN_THREADS', '4')))
+    if pool_size > 0:
+        database['ENGINE'] = 'catalog.backends.postgresql'
+        # Connections go back to the pool at the end of each request.
+        database['CONN_MAX_AGE'] = 0
+        database['OPTIONS']['pool'] = {
+            'max_size': pool_size,
+            # Seconds a request waits for a free connection.
+            'timeout': float(os.environ.get('DATABASE_POOL_TIMEOUT', '10')),
+            # Seconds after which unused connections are closed, and after
+            # which every connection is replaced.
+            'max_idle': float(os.environ.get('DATABASE_POOL_MAX_IDLE', '300')),
+            'max_lifetime': float(os.environ.get('DATABASE_POOL_MAX_LIFETIME', '3600')),
+        }
+    return database
+
+DATABASES['default'].update(database_from_url(os.environ.get('DATABASE_URL')))
+
+# Read replicas: DATABASE_REPLICA_URLS, a comma-separated list of database
+# URLs, adds them as 'replica_1', 'replica_2', ... Reads of the catalog go to
+# one of them, except for a client that has just written, whose reads go to
+# the primary for CATALOG_REPLICA_PIN_SECONDS (see catalog/routers.py).
+# Locally, e.g. DATABASE_REPLICA_URLS=sqlite:///db-replica.sqlite3 with a
+# copy of db.sqlite3. In tests the replicas mirror the test database.
+CATALOG_READ_REPLICAS = []
+for number, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    DATABASES[f'replica_{number}'] = {**database_from_url(url.strip()), 'TEST': {'MIRROR': 'default'}}
+    CATALOG_READ_REPLICAS.append(f'replica_{number}')
+
+if CATALOG_READ_REPLICAS:
+    DATABASE_ROUTERS = ['catalog.routers.ReplicaRouter']
+CATALOG_REPLICA_PIN_SECONDS = int(os.environ.get('CATALOG_REPLICA_PIN_SECONDS', '10'))
 
 # Simplified static file serving. More efficient. Reduces size of static files.
 # https://pypi.org/project/whitenoise/